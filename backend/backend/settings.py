@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'estate.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,3 +128,136 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Estate application
+# Tunables for the estate app, overridable through environment variables
+
+# Number of rows written per bulk INSERT when processing CSV uploads
+ESTATE_UPLOAD_BATCH_SIZE = int(os.getenv('ESTATE_UPLOAD_BATCH_SIZE', '1000'))
+# Number of rows read from the CSV file at a time, bounding the memory of uploads
+ESTATE_UPLOAD_CHUNK_SIZE = int(os.getenv('ESTATE_UPLOAD_CHUNK_SIZE', '10000'))
+# Number of row errors returned in the upload response, the full list goes to a report file beyond it
+ESTATE_UPLOAD_MAX_ERRORS = int(os.getenv('ESTATE_UPLOAD_MAX_ERRORS', '100'))
+# Directory of upload error reports, the system temporary directory when unset
+ESTATE_UPLOAD_ERROR_DIR = os.getenv('ESTATE_UPLOAD_ERROR_DIR')
+# Seconds upload error reports are kept for download before being removed
+ESTATE_UPLOAD_ERROR_REPORT_TTL = int(os.getenv('ESTATE_UPLOAD_ERROR_REPORT_TTL', '86400'))
+# Processes inferring the city and type of uploaded rows from their text (1 infers in
+# process) and the fewest rows of a CSV chunk worth sending to them
+ESTATE_TEXT_INFERENCE_WORKERS = int(os.getenv('ESTATE_TEXT_INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+ESTATE_TEXT_INFERENCE_MIN_ROWS = int(os.getenv('ESTATE_TEXT_INFERENCE_MIN_ROWS', '2000'))
+# Directory of the files of background upload jobs, shared by the web and worker processes
+ESTATE_UPLOAD_JOB_DIR = os.getenv('ESTATE_UPLOAD_JOB_DIR', str(BASE_DIR / 'upload_jobs'))
+# Seconds between polls of the upload job worker when the queue is empty
+ESTATE_UPLOAD_JOB_POLL_INTERVAL = float(os.getenv('ESTATE_UPLOAD_JOB_POLL_INTERVAL', '2'))
+# Seconds without progress after which a running upload job is considered abandoned
+ESTATE_UPLOAD_JOB_STALE_TIMEOUT = int(os.getenv('ESTATE_UPLOAD_JOB_STALE_TIMEOUT', '600'))
+
+# Seed of the random sampling of query results, unset for non-deterministic sampling
+ESTATE_SAMPLE_SEED = int(os.getenv('ESTATE_SAMPLE_SEED')) if os.getenv('ESTATE_SAMPLE_SEED') else None
+# Number of filter signatures whose matching ids are cached for sampling
+ESTATE_SAMPLE_CACHE_SIZE = int(os.getenv('ESTATE_SAMPLE_CACHE_SIZE', '128'))
+# Seconds a cached list of matching ids stays valid
+ESTATE_SAMPLE_CACHE_TTL = int(os.getenv('ESTATE_SAMPLE_CACHE_TTL', '300'))
+# Evaluate the filters of queries over an in-memory columnar copy of the estates
+ESTATE_SNAPSHOT = os.getenv('ESTATE_SNAPSHOT', 'true').lower() == 'true'
+# Seconds between checks for estates created or deleted by other processes
+ESTATE_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('ESTATE_SNAPSHOT_CHECK_INTERVAL', '5'))
+
+# HTTP connection pool and timeouts of the shared Azure OpenAI client
+ESTATE_LLM_MAX_CONNECTIONS = int(os.getenv('ESTATE_LLM_MAX_CONNECTIONS', '100'))
+ESTATE_LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('ESTATE_LLM_MAX_KEEPALIVE_CONNECTIONS', '20'))
+ESTATE_LLM_KEEPALIVE_EXPIRY = float(os.getenv('ESTATE_LLM_KEEPALIVE_EXPIRY', '60'))
+ESTATE_LLM_TIMEOUT = float(os.getenv('ESTATE_LLM_TIMEOUT', '60'))
+ESTATE_LLM_CONNECT_TIMEOUT = float(os.getenv('ESTATE_LLM_CONNECT_TIMEOUT', '5'))
+ESTATE_LLM_MAX_RETRIES = int(os.getenv('ESTATE_LLM_MAX_RETRIES', '2'))
+# Admission control of LLM calls: concurrent calls, callers allowed to wait for
+# one and how long they wait before getting a 503 response
+ESTATE_LLM_MAX_CONCURRENCY = int(os.getenv('ESTATE_LLM_MAX_CONCURRENCY', '32'))
+ESTATE_LLM_MAX_QUEUE = int(os.getenv('ESTATE_LLM_MAX_QUEUE', '128'))
+ESTATE_LLM_QUEUE_TIMEOUT = float(os.getenv('ESTATE_LLM_QUEUE_TIMEOUT', '30'))
+# Calls per second allowed by the token bucket (0 disables it) and its capacity
+ESTATE_LLM_RATE_LIMIT = float(os.getenv('ESTATE_LLM_RATE_LIMIT', '0'))
+ESTATE_LLM_RATE_BURST = int(os.getenv('ESTATE_LLM_RATE_BURST', '10'))
+
+# Cache of the filters extracted from queries: 'local', 'django' or 'none'
+ESTATE_FILTER_CACHE_BACKEND = os.getenv('ESTATE_FILTER_CACHE_BACKEND', 'local')
+# Django cache used by the 'django' filter cache backend
+ESTATE_FILTER_CACHE_ALIAS = os.getenv('ESTATE_FILTER_CACHE_ALIAS', 'default')
+# Maximum entries of the 'local' filter cache backend
+ESTATE_FILTER_CACHE_SIZE = int(os.getenv('ESTATE_FILTER_CACHE_SIZE', '10000'))
+# Seconds cached filters stay valid
+ESTATE_FILTER_CACHE_TTL = int(os.getenv('ESTATE_FILTER_CACHE_TTL', '86400'))
+
+# Minimum share of query words the rule based extractor must understand for its
+# filters to be used without calling the LLM (above 1 always calls the LLM)
+ESTATE_RULE_EXTRACTOR_THRESHOLD = float(os.getenv('ESTATE_RULE_EXTRACTOR_THRESHOLD', '0.9'))
+
+# Rank the estates matching the filters of a query by similarity of their text to
+# the query, instead of sampling them at random
+ESTATE_SEMANTIC_SEARCH = os.getenv('ESTATE_SEMANTIC_SEARCH', 'true').lower() == 'true'
+# Directory of the memory-mapped semantic index, shared by all processes, and the
+# dimensions of its vectors (changing them requires `manage.py build_semantic_index`)
+ESTATE_SEMANTIC_INDEX_DIR = os.getenv('ESTATE_SEMANTIC_INDEX_DIR', str(BASE_DIR / 'semantic_index'))
+ESTATE_SEMANTIC_INDEX_DIM = int(os.getenv('ESTATE_SEMANTIC_INDEX_DIM', '512'))
+
+# Runs the tests with their own semantic index directory
+TEST_RUNNER = 'estate.test_runner.EstateTestRunner'
+
+# Let concurrent identical queries share one response (summary included), not
+# only one filter extraction
+ESTATE_COALESCE_RESULTS = os.getenv('ESTATE_COALESCE_RESULTS', 'false').lower() == 'true'
+
+# Give the summary prompt the count and price statistics of the estates similar
+# to the presented ones, from the materialized aggregates
+ESTATE_SUMMARY_MARKET_CONTEXT = os.getenv('ESTATE_SUMMARY_MARKET_CONTEXT', 'true').lower() == 'true'
+
+# File recording the filters of every query, read by `manage.py explain_filters`
+ESTATE_FILTER_LOG = os.getenv('ESTATE_FILTER_LOG')
+
+# File receiving the stage timings of every query (one JSON object per line),
+# unset to write them to the console
+ESTATE_QUERY_LOG = os.getenv('ESTATE_QUERY_LOG')
+
+# Add a Server-Timing header with the stage timings to query responses
+ESTATE_SERVER_TIMING = os.getenv('ESTATE_SERVER_TIMING', 'false').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '{message}', 'style': '{'},
+    },
+    'handlers': {
+        'query_log': {
+            'class': 'logging.FileHandler',
+            'filename': ESTATE_QUERY_LOG,
+            'formatter': 'message',
+        } if ESTATE_QUERY_LOG else {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+        **({
+            'filter_log': {
+                'class': 'logging.FileHandler',
+                'filename': ESTATE_FILTER_LOG,
+                'formatter': 'message',
+            },
+        } if ESTATE_FILTER_LOG else {}),
+    },
+    'loggers': {
+        'estate.query': {
+            'handlers': ['query_log'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        **({
+            'estate.filters': {
+                'handlers': ['filter_log'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        } if ESTATE_FILTER_LOG else {}),
+    },
+}
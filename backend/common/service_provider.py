@@ -1,5 +1,7 @@
-from typing import Dict, Type, TypeVar
+from typing import Dict, Optional, Type, TypeVar
+import threading
 from estate.service import EstateService
+from estate.types_registry import TypesRegistry
 
 T = TypeVar('T')
 
@@ -7,6 +9,8 @@ T = TypeVar('T')
 class ServiceProvider:
     _instance = None
     _services: Dict[str, object] = {}
+    # Reentrant, as services may get other services while being constructed
+    _lock = threading.RLock()
 
     def __new__(cls):
         if cls._instance is None:
@@ -27,10 +31,38 @@ class ServiceProvider:
         service_name = service_class.__name__
 
         if service_name not in cls._services:
-            cls._services[service_name] = service_class()
+            with cls._lock:
+                if service_name not in cls._services:
+                    cls._services[service_name] = service_class()
 
         return cls._services[service_name]
 
+    @classmethod
+    def find_service(cls, service_class: Type[T]) -> Optional[T]:
+        """
+        Get a service instance without creating it.
+
+        Args:
+            service_class: The class of the service to get
+
+        Returns:
+            The instance of the service, None if it was not created yet
+        """
+        return cls._services.get(service_class.__name__)
+
+    @classmethod
+    def register_service(cls, service_class: Type[T], instance: T) -> None:
+        """
+        Register the instance returned for a service class, replacing any existing
+        one - mainly useful for substituting stubs in tests and benchmarks.
+
+        Args:
+            service_class: The class of the service
+            instance: The instance to return for it
+        """
+        with cls._lock:
+            cls._services[service_class.__name__] = instance
+
     @classmethod
     def clear_services(cls):
         """Clear all registered services - mainly useful for testing"""
@@ -39,5 +71,6 @@ class ServiceProvider:
 
 # Register all available services
 AVAILABLE_SERVICES = {
-    'estate': EstateService
+    'estate': EstateService,
+    'types_registry': TypesRegistry
 }
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import Estate, Types
+from .models import Estate, EstateAggregate, Types, UploadJob
 
 # Register your models here.
 admin.site.register(Estate)
 admin.site.register(Types)
+admin.site.register(UploadJob)
+admin.site.register(EstateAggregate)
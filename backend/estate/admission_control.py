@@ -0,0 +1,199 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import math
+import threading
+import time
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call is not admitted, the client should retry later"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A caller queued for a slot, a thread (event) or a coroutine (loop and future)"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Bounds the LLM calls of the process.
+
+    - At most `max_concurrency` calls run at once. Further callers wait in a
+      FIFO queue of at most `max_queue` callers for up to `queue_timeout`
+      seconds; callers that find the queue full or time out get an
+      LLMOverloadedError, which the views turn into a 503 response.
+    - With a positive `rate`, calls also take a token from a bucket refilled
+      with `rate` tokens per second and holding up to `burst` tokens.
+
+    Threads and coroutines share the same slots and queue.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 rate: float = 0, burst: int = 1):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._available = max_concurrency
+        self._waiters: Deque[_Waiter] = deque()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+
+        # Counters, see stats()
+        self.admitted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+
+    def _try_acquire(self, waiter_loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """
+        Take a free slot, or queue a waiter for one.
+
+        Returns:
+            None when a slot was taken, otherwise the queued waiter
+        """
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                self.admitted += 1
+                return None
+
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloadedError(
+                    'Too many queries waiting for the language model', self._retry_after())
+
+            waiter = _Waiter(waiter_loop)
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Remove a waiter that stopped waiting.
+
+        Returns:
+            True if the waiter was granted a slot in the meantime (and now owns it)
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _record_wait(self, started_at: float) -> None:
+        with self._lock:
+            self.total_wait += time.monotonic() - started_at
+
+    def _timed_out(self) -> LLMOverloadedError:
+        with self._lock:
+            self.rejected += 1
+        return LLMOverloadedError(
+            'Timed out waiting for the language model', self._retry_after())
+
+    def _retry_after(self) -> float:
+        """Rough time until a queued caller would be served"""
+        return max(1.0, math.ceil(self.queue_timeout / 2))
+
+    def release(self) -> None:
+        """Free a slot, handing it to the first waiter if any"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                self.admitted += 1
+                waiter.grant()
+            else:
+                self._available += 1
+
+    def acquire(self) -> None:
+        """
+        Wait for a slot.
+
+        Raises:
+            LLMOverloadedError: If the queue is full or no slot frees up in time
+        """
+        started_at = time.monotonic()
+        waiter = self._try_acquire()
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            if not self._abandon(waiter):
+                raise self._timed_out()
+        self._record_wait(started_at)
+
+    async def aacquire(self) -> None:
+        """Async version of `acquire()`"""
+        started_at = time.monotonic()
+        waiter = self._try_acquire(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release()
+                raise
+        self._record_wait(started_at)
+
+    def reserve_token(self) -> float:
+        """
+        Take a token from the bucket, possibly ahead of its refill.
+
+        Returns:
+            float: Seconds to wait before the call may start
+
+        Raises:
+            LLMOverloadedError: If the wait would exceed the queue timeout
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > self.queue_timeout:
+                self.rejected += 1
+                raise LLMOverloadedError(
+                    'Language model rate limit reached', math.ceil(wait))
+            self._tokens -= 1
+            return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and wait counters of this process"""
+        with self._lock:
+            return {
+                'in_flight': self.max_concurrency - self._available,
+                'queue_depth': len(self._waiters),
+                'max_queue_depth': self.max_queue_depth,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'average_wait': self.total_wait / self.admitted if self.admitted else None,
+            }
@@ -14,6 +14,7 @@ class EstateConfig(AppConfig):
         # Import here to avoid circular import issues
         from common.service_provider import ServiceProvider
         from .service import EstateService
+        from . import receivers  # noqa: F401 - registers the signal receivers
 
         # Check if running in main thread to avoid running twice in development
         import sys
@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List
+import asyncio
+import csv
+import json
+import random
+import time
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .constants import *
+from .llm_client import LLMClient
+from .rule_based_filter_extractor import RuleBasedFilterExtractor
+
+
+class SyntheticListingGenerator:
+    """
+    Generates listings CSVs in the upload format, deterministic for a given seed.
+
+    About 2% of the rows carry an invalid value (size, furnishing or
+    verification), so uploads exercise the error paths as well.
+    """
+
+    COLUMNS = ['displayAddress', 'bathrooms', 'bedrooms', 'price', 'verified', 'type',
+               'priceDuration', 'sizeMin', 'furnishing', 'description', 'addedOn', 'title']
+
+    FEATURES = ['sea view', 'private pool', 'maid room', 'large balcony', 'gym access',
+                'covered parking', 'garden', 'walk-in closet', 'city view', 'kids play area']
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.cities = [item['value'] for item in INITIAL_TYPES if item['type'] == CITY_TYPE]
+        self.estate_types = [item['value'] for item in INITIAL_TYPES if item['type'] == ESTATE_TYPE]
+        self.rooms = [item['value'] for item in INITIAL_TYPES if item['type'] == BEDROOM_TYPE]
+
+    def _row(self, index: int) -> List[Any]:
+        city = self.random.choice(self.cities)
+        estate_type = self.random.choice(self.estate_types)
+        bedrooms = self.random.choice(self.rooms)
+        features = ', '.join(self.random.sample(self.FEATURES, 3))
+
+        size = f'{self.random.randint(300, 9000)} sqft'
+        furnishing = self.random.choice(['YES', 'NO', 'PARTLY'])
+        verified = self.random.choice(['true', 'false'])
+        if self.random.random() < 0.02:
+            size, furnishing, verified = 'large', 'SOMETIMES', 'maybe'
+
+        return [
+            f'Building {index}, {city}',
+            self.random.choice(['1', '2', '3', '4', '5', '6', '7', '7+']),
+            bedrooms,
+            self.random.randrange(100_000, 20_000_000, 1_000),
+            verified,
+            'Residential for Sale',
+            'sell',
+            size,
+            furnishing,
+            f'Spacious {estate_type} in {city} with {features}. '
+            f'Close to schools, malls and public transport.',
+            f'2024-{self.random.randint(1, 12):02d}-{self.random.randint(1, 28):02d}T10:00:00Z',
+            f'{bedrooms} bedroom {estate_type} in {city}',
+        ]
+
+    def write(self, path: str, rows: int) -> None:
+        """Write a CSV of the given number of listings"""
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.COLUMNS)
+            for index in range(rows):
+                writer.writerow(self._row(index))
+
+    def queries(self, count: int) -> List[str]:
+        """
+        Build natural language queries, half simple enough for the rule based
+        extractor and half mentioning features only the LLM understands.
+        """
+        queries = []
+        for index in range(count):
+            city = self.random.choice(self.cities)
+            estate_type = self.random.choice(self.estate_types)
+            bedrooms = self.random.randint(1, 5)
+            price = self.random.randrange(500_000, 10_000_000, 100_000)
+            if index % 2:
+                queries.append(f'{bedrooms} bedroom {estate_type} in {city} under {price}')
+            else:
+                feature = self.random.choice(self.FEATURES)
+                queries.append(f'{estate_type} with {feature} in {city} under {price}')
+        return queries
+
+
+class _StubStream:
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[ChatCompletionChunk]:
+        return iter(self._chunks)
+
+    def close(self) -> None:
+        pass
+
+
+class _StubCompletions:
+    """Stand-in for `client.chat.completions` answering without any network call"""
+
+    SUMMARY = ('Here are some properties matching your search. Each one offers a good '
+               'balance of location, size and price, take a look at the details below.')
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.extractor = RuleBasedFilterExtractor()
+
+    def _filters(self, prompt: str) -> Dict[str, Any]:
+        # The query closes the filters prompt (see EstateService.get_filters_ai_prompt)
+        query = prompt.rsplit('User Query: ', 1)[-1].strip()
+        filters, _ = self.extractor.extract(query)
+        return filters or {'price__gt': 0}
+
+    def _respond(self, messages: List[Dict[str, str]], **kwargs: Any):
+        prompt = messages[-1]['content']
+        if kwargs.get('response_format', {}).get('type') == 'json_object':
+            text = json.dumps(self._filters(prompt))
+        else:
+            text = self.SUMMARY
+
+        usage = {
+            'prompt_tokens': len(prompt) // 4,
+            'completion_tokens': len(text) // 4,
+            'total_tokens': len(prompt) // 4 + len(text) // 4,
+        }
+
+        if kwargs.get('stream'):
+            return _StubStream([
+                ChatCompletionChunk.model_validate({
+                    'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'stub',
+                    'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}],
+                })
+                for word in text.split(' ')
+            ])
+
+        return ChatCompletion.model_validate({
+            'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': 'stub',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': text}}],
+            'usage': usage,
+        })
+
+    def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+
+class _AsyncStubCompletions(_StubCompletions):
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages, **kwargs)
+
+
+class StubLLMClient(LLMClient):
+    """
+    LLMClient answering locally and deterministically, for benchmarks.
+
+    Filter extraction answers with the filters of the rule based extractor
+    (whatever its confidence), summaries with a fixed text. Admission control,
+    retries and timing run as with the real client; `latency` seconds are
+    waited per call to model the network.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        super().__init__()
+
+    def _create_client(self):
+        return SimpleNamespace(chat=SimpleNamespace(completions=_StubCompletions(self.latency)))
+
+    def _create_async_client(self):
+        return SimpleNamespace(chat=SimpleNamespace(completions=_AsyncStubCompletions(self.latency)))
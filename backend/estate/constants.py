@@ -4,6 +4,8 @@ FURNISHED_TYPE = 'furnished'
 ESTATE_TYPE = 'estate_type'
 ESTATE_CATEGORY = 'estate_category'
 CITY_TYPE = 'city'
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
 INITIAL_TYPES = [
     {
         'type': BATHROOM_TYPE,
@@ -0,0 +1,339 @@
+from itertools import combinations, islice, product
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import threading
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Q
+
+from .models import Estate, EstateAggregate
+from .query_timer import QueryTimer
+from .types_registry import TypesRegistry
+
+# (city id, type id, bedrooms id), None standing for all values
+GroupKey = Tuple[Optional[int], Optional[int], Optional[int]]
+
+
+class EstateAggregates:
+    """
+    Maintains the EstateAggregate table: the count and the minimum, median and
+    maximum price and size of the estates of every city × type × bedrooms
+    group, and of their rollups over any of the three fields (all the villas
+    of a city, whatever their bedrooms; all the estates of a city; all the
+    estates). Reads are single indexed lookups instead of aggregate queries
+    over the estates.
+
+    Estates written in this process mark their groups as pending (see
+    estate/receivers.py). Pending groups are refreshed at the end of every
+    upload and after every committed save, never by reads, by recomputing only
+    them and their rollups. Medians cannot be updated from the previous
+    statistics: a few groups are recomputed with an aggregate query and one
+    median query per column, restricted to the estates of each group, while
+    larger refreshes read the price and size of every estate once and group
+    them with NumPy.
+
+    Note:
+        - Estates without a city, type or bedrooms only count in the rollups
+          over that field
+        - Estates deleted one at a time are not tracked: their groups are
+          corrected by the next truncating upload or `manage.py refresh_estate_aggregates`
+    """
+
+    FIELDS = ('city', 'type', 'bedrooms')
+    # Rows read from the database at a time while refreshing
+    READ_CHUNK_SIZE = 10000
+    # Aggregates deleted per query while refreshing
+    DELETE_BATCH_SIZE = 500
+    # Attempts at a refresh, retried when a concurrent refresh wrote the same groups
+    REFRESH_ATTEMPTS = 3
+    # Keys recomputed with queries restricted to their estates, above which
+    # reading every estate once is cheaper
+    INCREMENTAL_MAX_KEYS = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Groups of the estates written since the last refresh
+        self._pending: Set[GroupKey] = set()
+        self._pending_all = False
+
+    @property
+    def types_registry(self) -> TypesRegistry:
+        # Import here to avoid circular import issues
+        from common.service_provider import ServiceProvider
+        return ServiceProvider.get_service(TypesRegistry)
+
+    # Invalidation
+
+    def mark(self, estates: Iterable[Estate]) -> None:
+        """Mark the groups of created estates for the next refresh"""
+        groups = {(estate.city_id, estate.type_id, estate.bedrooms_id) for estate in estates}
+        with self._lock:
+            self._pending |= groups
+
+    def mark_all(self) -> None:
+        """Recompute every group on the next refresh, e.g. after estates were deleted"""
+        with self._lock:
+            self._pending_all = True
+            self._pending.clear()
+
+    # Refresh
+
+    @classmethod
+    def _rollups(cls, groups: Iterable[GroupKey]) -> Set[GroupKey]:
+        """Every key whose statistics depend on the estates of the groups"""
+        keys = set()
+        for group in groups:
+            for kept in product((True, False), repeat=len(cls.FIELDS)):
+                key = tuple(value if keep else None for value, keep in zip(group, kept))
+                # A missing value only counts in the rollups over its field
+                if all(value is not None or not keep for value, keep in zip(group, kept)):
+                    keys.add(key)
+        return keys
+
+    @classmethod
+    def _read_estates(cls) -> Dict[str, np.ndarray]:
+        """Group fields (-1 for none), price and size of every estate"""
+        fields = (*(f'{field}_id' for field in cls.FIELDS), 'price', 'size')
+        rows = Estate.objects.order_by().values_list(*fields).iterator(chunk_size=cls.READ_CHUNK_SIZE)
+
+        chunks = []
+        while chunk := list(islice(rows, cls.READ_CHUNK_SIZE)):
+            # Read as floats, turning None into NaN
+            chunks.append(np.array(chunk, dtype=np.float64))
+        values = np.concatenate(chunks) if chunks else np.empty((0, len(fields)))
+        values = np.nan_to_num(values, nan=-1).astype(np.int64)
+        return {field: values[:, index] for index, field in enumerate((*cls.FIELDS, 'price', 'size'))}
+
+    @classmethod
+    def _compute_key(cls, key: GroupKey) -> Optional[Dict[str, Any]]:
+        """
+        Compute the statistics of one key from the estates of its group only.
+
+        Returns:
+            dict: Statistics of the key, None when no estate is in its group
+        """
+        estates = Estate.objects.filter(**{
+            field: value for field, value in zip(cls.FIELDS, key) if value is not None}).order_by()
+        statistics = estates.aggregate(
+            count=Count('id'), min_price=Min('price'), max_price=Max('price'),
+            min_size=Min('size'), max_size=Max('size'))
+        count = statistics['count']
+        if not count:
+            return None
+
+        for column in ('price', 'size'):
+            # Middle values of the sorted column: one for odd counts, two for even ones
+            middle = list(estates.order_by(column).values_list(column, flat=True)
+                          [(count - 1) // 2:count // 2 + 1])
+            statistics[f'median_{column}'] = sum(middle) / len(middle)
+        return statistics
+
+    @classmethod
+    def _compute(cls, estates: Dict[str, np.ndarray],
+                 keys: Optional[Set[GroupKey]]) -> Dict[GroupKey, Dict[str, Any]]:
+        """
+        Compute the statistics of the groups of each combination of fields.
+
+        Args:
+            estates: Columns returned by `_read_estates()`
+            keys: Keys to compute, None for all of them
+
+        Returns:
+            dict: Statistics by key, for the keys having estates
+        """
+        statistics = {}
+        # Radix of the composite keys: one digit per grouping field
+        radix = max([int(estates[field].max()) + 1 for field in cls.FIELDS if len(estates[field])] + [1])
+        for size in range(len(cls.FIELDS) + 1):
+            for fields in combinations(cls.FIELDS, size):
+                # Estates missing one of the grouping fields are not in any group
+                selected = np.ones(len(estates['price']), dtype=bool)
+                for field in fields:
+                    selected &= estates[field] >= 0
+                rows = np.flatnonzero(selected)
+
+                # Rows sorted by a single integer key, so each group is a slice
+                composite = np.zeros(len(rows), dtype=np.int64)
+                for field in fields:
+                    composite = composite * radix + estates[field][rows]
+                sorting = np.argsort(composite, kind='stable')
+                rows = rows[sorting]
+                starts = np.flatnonzero(np.diff(composite[sorting])) + 1
+                bounds = np.concatenate([[0], starts, [len(rows)]]) if len(rows) else np.array([0])
+
+                prices = estates['price'][rows]
+                sizes = estates['size'][rows]
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    key = tuple(int(estates[field][rows[start]]) if field in fields else None
+                                for field in cls.FIELDS)
+                    if keys is not None and key not in keys:
+                        continue
+
+                    group_prices = prices[start:end]
+                    group_sizes = sizes[start:end]
+                    statistics[key] = {
+                        'count': int(end - start),
+                        'min_price': int(group_prices.min()),
+                        'median_price': float(np.median(group_prices)),
+                        'max_price': int(group_prices.max()),
+                        'min_size': int(group_sizes.min()),
+                        'median_size': float(np.median(group_sizes)),
+                        'max_size': int(group_sizes.max()),
+                    }
+        return statistics
+
+    def refresh(self, groups: Optional[Iterable[GroupKey]] = None) -> int:
+        """
+        Recompute the statistics of groups and of their rollups.
+
+        Args:
+            groups: (city id, type id, bedrooms id) of the estates that changed,
+                None to recompute the whole table
+
+        Returns:
+            int: Number of rewritten rows
+        """
+        keys = None if groups is None else self._rollups(groups)
+        if keys is not None and not keys:
+            return 0
+
+        with QueryTimer.measure('aggregates'):
+            for attempt in range(self.REFRESH_ATTEMPTS):
+                if keys is not None and len(keys) <= self.INCREMENTAL_MAX_KEYS:
+                    statistics = {key: values for key in keys
+                                  if (values := self._compute_key(key)) is not None}
+                else:
+                    statistics = self._compute(self._read_estates(), keys)
+                try:
+                    self._replace(keys, statistics)
+                    break
+                except IntegrityError:
+                    # Another process refreshed the same groups concurrently:
+                    # recomputed, as the estates may have changed since
+                    if attempt == self.REFRESH_ATTEMPTS - 1:
+                        raise
+        return len(statistics)
+
+    def _replace(self, keys: Optional[Set[GroupKey]], statistics: Dict[GroupKey, Dict[str, Any]]) -> None:
+        """Rewrite the rows of the keys, None for all of them, in one transaction"""
+        with transaction.atomic():
+            # The table is small: matched in Python rather than with one
+            # condition per key, which would exceed SQL expression limits
+            replaced = [aggregate_id for aggregate_id, *key in EstateAggregate.objects.values_list(
+                'id', *(f'{field}_id' for field in self.FIELDS)) if keys is None or tuple(key) in keys]
+            for start in range(0, len(replaced), self.DELETE_BATCH_SIZE):
+                EstateAggregate.objects.filter(
+                    id__in=replaced[start:start + self.DELETE_BATCH_SIZE]).delete()
+            # The unique constraint rejects rows written meanwhile by another refresh
+            EstateAggregate.objects.bulk_create([
+                EstateAggregate(city_id=key[0], type_id=key[1], bedrooms_id=key[2], **values)
+                for key, values in statistics.items()
+            ], batch_size=1000)
+
+    def refresh_pending(self) -> int:
+        """
+        Refresh the groups of the estates written since the last refresh.
+
+        Returns:
+            int: Number of rewritten rows
+        """
+        with self._lock:
+            pending_all, pending = self._pending_all, self._pending
+            self._pending_all, self._pending = False, set()
+
+        try:
+            if pending_all:
+                return self.refresh()
+            return self.refresh(pending) if pending else 0
+        except Exception:
+            # Kept for the next refresh
+            with self._lock:
+                self._pending_all |= pending_all
+                self._pending |= pending
+            raise
+
+    # Reads
+
+    @classmethod
+    def _lookup(cls, keys: Iterable[GroupKey]) -> Q:
+        condition = Q(pk__in=[])
+        for key in keys:
+            condition |= Q(**dict(zip(cls.FIELDS, key)))
+        return condition
+
+    def _describe(self, aggregate: EstateAggregate) -> Dict[str, Any]:
+        types_registry = self.types_registry
+        description = {}
+        for field in self.FIELDS:
+            type_id = getattr(aggregate, f'{field}_id')
+            found_type = types_registry.get_by_id(type_id) if type_id is not None else None
+            description[field] = {'id': type_id, 'value': found_type.value if found_type else None} \
+                if type_id is not None else None
+
+        return {
+            **description,
+            'count': aggregate.count,
+            'price': {'min': aggregate.min_price, 'median': aggregate.median_price,
+                      'max': aggregate.max_price},
+            'size': {'min': aggregate.min_size, 'median': aggregate.median_size,
+                     'max': aggregate.max_size},
+            'updated_at': aggregate.updated_at,
+        }
+
+    def stats(self, city: Optional[int] = None, type: Optional[int] = None,
+              bedrooms: Optional[int] = None, group_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the statistics of a group of estates.
+
+        Args:
+            city: City type id, None for all cities
+            type: Estate type id, None for all types
+            bedrooms: Bedrooms type id, None for any number of bedrooms
+            group_by: Optional field ('city', 'type' or 'bedrooms') to break the
+                group down by, instead of returning the group as a whole
+
+        Returns:
+            list: Statistics of the group, or of each of its subgroups by
+                decreasing count. Empty when no estate matches
+
+        Raises:
+            ValueError: If group_by is not one of the fields or is already set
+        """
+        key = {'city': city, 'type': type, 'bedrooms': bedrooms}
+        if group_by is not None and (group_by not in self.FIELDS or key[group_by] is not None):
+            raise ValueError(f"group_by must be one of the fields not filtered on: "
+                             f"{', '.join(field for field in self.FIELDS if key[field] is None)}")
+
+        aggregates = EstateAggregate.objects.filter(**{
+            field: value for field, value in key.items() if field != group_by})
+        if group_by is not None:
+            aggregates = aggregates.filter(**{f'{group_by}__isnull': False}).order_by('-count', group_by)
+        return [self._describe(aggregate) for aggregate in aggregates]
+
+    def market_context(self, properties: List[Estate]) -> List[Dict[str, Any]]:
+        """
+        Describe the market of the groups of properties, for the summary prompt.
+
+        Args:
+            properties: Estates presented to the customer
+
+        Returns:
+            list: Count and price and size statistics of the estates with the
+                same city, type and bedrooms as each property
+        """
+        keys = {(estate.city_id, estate.type_id, estate.bedrooms_id) for estate in properties}
+        keys = {key for key in keys if None not in key}
+        if not keys:
+            return []
+
+        context = []
+        for aggregate in EstateAggregate.objects.filter(self._lookup(keys)):
+            description = self._describe(aggregate)
+            context.append({
+                **{field: description[field]['value'] for field in self.FIELDS},
+                'listings': aggregate.count,
+                'median_price': aggregate.median_price,
+                'price_range': [aggregate.min_price, aggregate.max_price],
+                'median_size': aggregate.median_size,
+            })
+        return context
@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count
+
+from common.service_provider import ServiceProvider
+from .estate_snapshot import EstateSnapshot
+from .models import Estate
+from .types_registry import TypesRegistry
+
+
+class EstateFacets:
+    """
+    Counts the estates matching a set of filters by value of each categorized
+    field (bedrooms, bathrooms, furnished, city, category and type), e.g. to
+    show how many of the results are in each city.
+
+    Counts come from the bitmap indexes of the EstateSnapshot when it is
+    enabled, and from grouped database queries otherwise.
+    """
+
+    FIELDS = EstateSnapshot.FOREIGN_KEY_COLUMNS
+
+    @property
+    def snapshot(self) -> EstateSnapshot:
+        return ServiceProvider.get_service(EstateSnapshot)
+
+    @property
+    def types_registry(self) -> TypesRegistry:
+        return ServiceProvider.get_service(TypesRegistry)
+
+    def _database_counts(self, filters: Dict[str, Any]) -> Tuple[int, Dict[str, Dict[int, int]]]:
+        estates = Estate.objects.filter(**filters)
+        facets = {}
+        for field in self.FIELDS:
+            rows = estates.filter(**{f'{field}__isnull': False}).order_by() \
+                .values_list(field).annotate(count=Count('id'))
+            facets[field] = dict(rows)
+        return estates.count(), facets
+
+    def counts(self, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Count the estates matching the filters, by value of each categorized field.
+
+        Args:
+            filters: Validated Estate filters, all estates when empty
+
+        Returns:
+            dict: 'total' number of matching estates, and 'facets' listing for
+                each field the id, value and count of its values, most frequent first
+        """
+        filters = filters or {}
+        counted = self.snapshot.facet_counts(filters) if settings.ESTATE_SNAPSHOT else None
+        total, facets = counted if counted is not None else self._database_counts(filters)
+
+        types_registry = self.types_registry
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for field in self.FIELDS:
+            values = []
+            for type_id, count in facets[field].items():
+                found_type = types_registry.get_by_id(type_id)
+                values.append({
+                    'id': type_id,
+                    'value': found_type.value if found_type else None,
+                    'count': count,
+                })
+            result[field] = sorted(values, key=lambda value: (-value['count'], value['id']))
+
+        return {'total': total, 'facets': result}
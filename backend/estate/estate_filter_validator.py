@@ -1,7 +1,10 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from django.core.exceptions import ValidationError
 
+from .constants import *
+from .types_registry import TypesRegistry
+
 
 class FilterValidationError(ValidationError):
     pass
@@ -38,32 +41,38 @@ class EstateFilterValidator:
         'bathrooms': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': BATHROOM_TYPE
         },
         'bedrooms': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': BEDROOM_TYPE
         },
         'furnished': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': FURNISHED_TYPE
         },
         'city': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': CITY_TYPE
         },
         'category': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': ESTATE_CATEGORY
         },
         'type': {
             'type': int,
             'suffixes': EXACT_MATCH_SUFFIX,
-            'required': False
+            'required': False,
+            'types': ESTATE_TYPE
         }
     }
 
@@ -160,12 +169,38 @@ class EstateFilterValidator:
                 )
 
     @classmethod
-    def validate_filters(cls, filters: Dict[str, Any]) -> None:
+    def _validate_type_id(cls, field: str, value: Any, type_name: str,
+                          types_registry: TypesRegistry) -> None:
+        """
+        Validates that a value is the id of a type of the expected type name.
+
+        Args:
+            field: The field name
+            value: The type id to validate
+            type_name: The expected type name (e.g. CITY_TYPE)
+            types_registry: Registry used to look the id up
+
+        Raises:
+            FilterValidationError: If the id does not belong to a type of that name
+        """
+        if value is None:
+            return
+
+        found_type = types_registry.get_by_id(int(value))
+        if found_type is None or found_type.type != type_name:
+            raise FilterValidationError(
+                f"Unknown {type_name} id {value} for {field}")
+
+    @classmethod
+    def validate_filters(cls, filters: Dict[str, Any],
+                         types_registry: Optional[TypesRegistry] = None) -> None:
         """
         Validates a dictionary of filters according to predefined rules.
 
         Args:
             filters: Dictionary of filters to validate
+            types_registry: Optional registry used to check that enum filters
+                reference existing types of the right kind
 
         Raises:
             FilterValidationError: If any validation rule is violated
@@ -188,6 +223,12 @@ class EstateFilterValidator:
                 # Validate value
                 cls._validate_value(field, value, field_type)
 
+                # Validate enum values against the Types table
+                type_name = cls.FIELD_CONSTRAINTS[base_field].get('types')
+                if type_name and types_registry is not None:
+                    cls._validate_type_id(
+                        field, value, type_name, types_registry)
+
                 valid_filters += 1
 
             except FilterValidationError as e:
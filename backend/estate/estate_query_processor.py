@@ -1,17 +1,69 @@
-from openai import AzureOpenAI
-import os
+from typing import Iterator, Optional
 import json
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
 from common.service_provider import ServiceProvider
 from .service import EstateService
-from .models import Estate
+from .estate_aggregates import EstateAggregates
+from .estate_sampler import EstateSampler
+from .filter_cache import FilterCache
+from .admission_control import LLMOverloadedError
+from .llm_client import LLMClient
+from .query_timer import QueryTimer
+from .rule_based_filter_extractor import RuleBasedFilterExtractor
+from .singleflight import SingleFlight
+
+# Records the validated filters of every query, one JSON object per line,
+# read back by `manage.py explain_filters`
+filters_logger = logging.getLogger('estate.filters')
+
+NO_PROPERTIES_SUMMARY = "I apologize, but I couldn't find any properties matching your criteria."
 
 
 class RealEstateQueryProcessor:
+    """
+    Answers natural language queries. Stateless apart from its shared services,
+    a single instance obtained through the ServiceProvider serves all requests.
+    """
+
     def __init__(self):
-        self.client = AzureOpenAI()
+        self.llm_client = ServiceProvider.get_service(LLMClient)
         self.estate_service = ServiceProvider.get_service(EstateService)
+        self.estate_sampler = ServiceProvider.get_service(EstateSampler)
+        self.estate_aggregates = ServiceProvider.get_service(EstateAggregates)
+        self.filter_cache = ServiceProvider.get_service(FilterCache)
+        self.rule_based_extractor = ServiceProvider.get_service(RuleBasedFilterExtractor)
+        # Coalesces identical queries in flight, keyed by normalized query
+        self.singleflight = SingleFlight()
+
+    # Completion parameters of the filter extraction
+    FILTERS_COMPLETION_OPTIONS = {
+        "temperature": 0,  # Keep it deterministic for consistent filter extraction
+        "max_tokens": 1024,
+        "response_format": {"type": "json_object"}  # Ensure JSON response
+    }
+
+    @staticmethod
+    def _get_filters_messages(filters_prompt: str) -> list:
+        return [
+            {
+                "role": "user",
+                "content": filters_prompt
+            }
+        ]
+
+    @staticmethod
+    def _parse_filters_response(response) -> dict:
+        try:
+            # Parse the JSON response
+            filters = json.loads(response.choices[0].message.content)
+            return filters
+        except json.JSONDecodeError:
+            raise ValueError("Failed to parse AI-generated filters")
 
     def _get_filters_from_query(self, query: str) -> dict:
         """
@@ -22,41 +74,103 @@ class RealEstateQueryProcessor:
 
         Returns:
             dict: Extracted filters for database query
+
+        Raises:
+            FilterValidationError: If the extracted filters are invalid
         """
+        QueryTimer.annotate('filters_source', 'llm')
+
         # Get the base prompt for filter extraction
-        filters_prompt = self.estate_service.get_filters_ai_prompt(query)
+        with QueryTimer.measure('prompt'):
+            filters_prompt = self.estate_service.get_filters_ai_prompt(query)
 
         # Send query to OpenAI API
-        response = self.client.chat.completions.create(
-            # Using GPT-4 for better understanding
-            model=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
-            messages=[
-                {
-                    "role": "user",
-                    "content": filters_prompt
-                }
-            ],
-            temperature=0,  # Keep it deterministic for consistent filter extraction
-            max_tokens=1024,
-            response_format={"type": "json_object"}  # Ensure JSON response
-        )
+        with QueryTimer.measure('llm_filters'):
+            response = self.llm_client.complete(
+                messages=self._get_filters_messages(filters_prompt),
+                **self.FILTERS_COMPLETION_OPTIONS
+            )
 
-        try:
-            # Parse the JSON response
-            filters = json.loads(response.choices[0].message.content)
+        # Validated before being cached, so invalid filters are extracted again
+        # by the next query instead of failing it until they expire
+        filters = self._parse_filters_response(response)
+        self.estate_service.validate_filters(filters)
+        return filters
+
+    async def _aget_filters_from_query(self, query: str) -> dict:
+        """Async version of `_get_filters_from_query()`"""
+        QueryTimer.annotate('filters_source', 'llm')
+
+        # The prompt lists the Types table, which may have to be loaded
+        with QueryTimer.measure('prompt'):
+            filters_prompt = await sync_to_async(self.estate_service.get_filters_ai_prompt)(query)
+
+        with QueryTimer.measure('llm_filters'):
+            response = await self.llm_client.acomplete(
+                messages=self._get_filters_messages(filters_prompt),
+                **self.FILTERS_COMPLETION_OPTIONS
+            )
+
+        filters = self._parse_filters_response(response)
+        await sync_to_async(self.estate_service.validate_filters)(filters)
+        return filters
+
+    def _extract_filters(self, query: str) -> dict:
+        """
+        Extract filters from a query, skipping the LLM when the rule based
+        extractor understands the query well enough.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            dict: Extracted filters for database query
+        """
+        filters, confidence = self.rule_based_extractor.extract(query)
+        if filters and confidence >= settings.ESTATE_RULE_EXTRACTOR_THRESHOLD:
+            QueryTimer.annotate('filters_source', 'rules')
             return filters
-        except json.JSONDecodeError:
-            raise ValueError("Failed to parse AI-generated filters")
 
-    def _generate_property_summary(self, properties: list) -> str:
+        # Reused from the cache or a concurrent query, unless extracted by this one
+        QueryTimer.annotate('filters_source', 'cache')
+
+        # Fall back to the LLM, reusing the filters of equivalent queries,
+        # cached or being extracted for a concurrent request
+        key = ('filters', FilterCache.normalize_query(query))
+        return dict(self.singleflight.do(
+            key, self.filter_cache.get_or_extract, query, self._get_filters_from_query))
+
+    async def _aextract_filters(self, query: str) -> dict:
+        """Async version of `_extract_filters()`"""
+        filters, confidence = await sync_to_async(self.rule_based_extractor.extract)(query)
+        if filters and confidence >= settings.ESTATE_RULE_EXTRACTOR_THRESHOLD:
+            QueryTimer.annotate('filters_source', 'rules')
+            return filters
+
+        QueryTimer.annotate('filters_source', 'cache')
+
+        key = ('filters', FilterCache.normalize_query(query))
+        return dict(await self.singleflight.ado(
+            key, self.filter_cache.aget_or_extract, query, self._aget_filters_from_query))
+
+    def _get_market_context(self, properties: list) -> list:
+        """Statistics of the estates similar to the properties, empty when disabled"""
+        if not settings.ESTATE_SUMMARY_MARKET_CONTEXT:
+            return []
+        with QueryTimer.measure('market'):
+            return self.estate_aggregates.market_context(properties)
+
+    def _get_summary_messages(self, properties: list, market_context: Optional[list] = None) -> list:
         """
-        Generate a natural language summary of matching properties using ChatGPT.
+        Build the chat messages asking for a summary of matching properties.
 
         Args:
             properties: List of matching Estate objects
+            market_context: Optional statistics of the estates with the same
+                city, type and bedrooms (see `_get_market_context()`)
 
         Returns:
-            str: Generated summary
+            list: Chat messages for the summary completion
         """
         # Convert properties to JSON for the prompt
         properties_json = json.dumps([{
@@ -66,47 +180,179 @@ class RealEstateQueryProcessor:
 
         # Get the base prompt for summary generation
         summary_prompt = self.estate_service.get_summary_ai_prompt()
+        content = f"{summary_prompt}\n\nProperties: {properties_json}"
+
+        if market_context:
+            content += ("\n\nMarket context, listings with the same city, type and bedrooms "
+                        f"(prices in AED, sizes in sqft): {json.dumps(market_context)}")
+
+        return [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+
+    def _generate_property_summary(self, properties: list) -> str:
+        """
+        Generate a natural language summary of matching properties using ChatGPT.
+
+        Args:
+            properties: List of matching Estate objects
+
+        Returns:
+            str: Generated summary
+        """
+        market_context = self._get_market_context(properties)
 
         # Send to OpenAI API
-        response = self.client.chat.completions.create(
-            # Using GPT-4 for better quality summaries
-            model=os.getenv('AZURE_OPENAI_DEPLOYMENT'),
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"{summary_prompt}\n\nProperties: {properties_json}"
-                }
-            ],
-            temperature=0.7,  # Allow some creativity in summary generation
-            max_tokens=2048
-        )
+        with QueryTimer.measure('summary'):
+            response = self.llm_client.complete(
+                messages=self._get_summary_messages(properties, market_context),
+                temperature=0.7,  # Allow some creativity in summary generation
+                max_tokens=2048
+            )
 
         return response.choices[0].message.content
 
-    def process_query(self, query: str) -> dict:
+    async def _agenerate_property_summary(self, properties: list) -> str:
+        """Async version of `_generate_property_summary()`"""
+        market_context = await sync_to_async(self._get_market_context)(properties)
+
+        with QueryTimer.measure('summary'):
+            response = await self.llm_client.acomplete(
+                messages=self._get_summary_messages(properties, market_context),
+                temperature=0.7,
+                max_tokens=2048
+            )
+
+        return response.choices[0].message.content
+
+    def _stream_property_summary(self, properties: list) -> Iterator[str]:
+        """
+        Generate a natural language summary of matching properties, yielding
+        the text as the model produces it.
+
+        Args:
+            properties: List of matching Estate objects
+
+        Yields:
+            str: Consecutive pieces of the summary
+        """
+        stream = self.llm_client.complete(
+            messages=self._get_summary_messages(properties, self._get_market_context(properties)),
+            temperature=0.7,
+            max_tokens=2048,
+            stream=True
+        )
+
+        for chunk in stream:
+            # Azure sends chunks without choices (e.g. content filter results)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _find_properties(self, query: str) -> list:
+        """
+        Extract and validate the filters of a query and sample matching properties.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            list: Up to 5 matching Estate objects
+        """
+        # Extract filters from query
+        with QueryTimer.measure('extract'):
+            filters = self._extract_filters(query)
+
+        # Validate filters
+        with QueryTimer.measure('validate'):
+            self.estate_service.validate_filters(filters)
+        filters_logger.info(json.dumps(filters, sort_keys=True))
+
+        # Query database with filters and get the 5 properties most relevant to the query
+        with QueryTimer.measure('sample'):
+            return self.estate_sampler.sample(filters, 5, query=query)
+
+    async def _afind_properties(self, query: str) -> list:
+        """Async version of `_find_properties()`"""
+        with QueryTimer.measure('extract'):
+            filters = await self._aextract_filters(query)
+
+        with QueryTimer.measure('validate'):
+            await sync_to_async(self.estate_service.validate_filters)(filters)
+        filters_logger.info(json.dumps(filters, sort_keys=True))
+
+        with QueryTimer.measure('sample'):
+            return await self.estate_sampler.asample(filters, 5, query=query)
+
+    @staticmethod
+    def error_category(error: Exception) -> str:
+        """Category of a query error, mirroring the error responses"""
+        if isinstance(error, LLMOverloadedError):
+            return 'overloaded'
+        elif isinstance(error, ValidationError):
+            return 'validation'
+        elif isinstance(error, ValueError):
+            return 'value'
+        return 'unexpected'
+
+    @classmethod
+    def _error_response(cls, error: Exception) -> dict:
+        """Build the response of a query that failed with the given error"""
+        QueryTimer.annotate('error', cls.error_category(error))
+
+        if isinstance(error, LLMOverloadedError):
+            # Turned into a 503 response by the views
+            return {
+                "success": False,
+                "error": f"Service overloaded: {str(error)}",
+                "retry_after": error.retry_after
+            }
+        elif isinstance(error, ValidationError):
+            message = f"Invalid filters: {str(error)}"
+        elif isinstance(error, ValueError):
+            message = f"Processing error: {str(error)}"
+        else:
+            message = f"Unexpected error: {str(error)}"
+
+        return {
+            "success": False,
+            "error": message
+        }
+
+    def process_query(self, query: str, timer: Optional[QueryTimer] = None) -> dict:
         """
         Process a natural language real estate query end-to-end.
 
         Args:
             query: Natural language query string
+            timer: Optional timer receiving the stage timings, e.g. for a
+                Server-Timing header
 
         Returns:
             dict: Response containing summary and matched properties
         """
-        try:
-            # Extract filters from query
-            filters = self._get_filters_from_query(query)
+        timer = timer or QueryTimer()
+        with timer.activate():
+            if settings.ESTATE_COALESCE_RESULTS:
+                # Identical queries in flight share one response
+                key = ('result', FilterCache.normalize_query(query))
+                result = dict(self.singleflight.do(key, self._process_query, query))
+            else:
+                result = self._process_query(query)
 
-            # Validate filters
-            self.estate_service.validate_filters(filters)
+        timer.finish(result["success"])
+        return result
 
-            # Query database with filters and get 5 random properties
-            properties = Estate.objects.filter(**filters).order_by('?')[:5]
+    def _process_query(self, query: str) -> dict:
+        try:
+            properties = self._find_properties(query)
 
             if not properties:
                 return {
                     "success": True,
-                    "summary": "I apologize, but I couldn't find any properties matching your criteria.",
+                    "summary": NO_PROPERTIES_SUMMARY,
                 }
 
             # Generate summary
@@ -118,18 +364,91 @@ class RealEstateQueryProcessor:
                 "summary": summary
             }
 
-        except ValidationError as e:
-            return {
-                "success": False,
-                "error": f"Invalid filters: {str(e)}"
-            }
-        except ValueError as e:
-            return {
-                "success": False,
-                "error": f"Processing error: {str(e)}"
-            }
         except Exception as e:
+            return self._error_response(e)
+
+    async def aprocess_query(self, query: str, timer: Optional[QueryTimer] = None) -> dict:
+        """
+        Process a natural language real estate query end-to-end without blocking
+        the event loop while waiting on the LLM or the database.
+
+        Args:
+            query: Natural language query string
+            timer: Optional timer receiving the stage timings
+
+        Returns:
+            dict: Same response as `process_query()`
+        """
+        timer = timer or QueryTimer()
+        with timer.activate():
+            if settings.ESTATE_COALESCE_RESULTS:
+                key = ('result', FilterCache.normalize_query(query))
+                result = dict(await self.singleflight.ado(key, self._aprocess_query, query))
+            else:
+                result = await self._aprocess_query(query)
+
+        timer.finish(result["success"])
+        return result
+
+    async def _aprocess_query(self, query: str) -> dict:
+        try:
+            properties = await self._afind_properties(query)
+
+            if not properties:
+                return {
+                    "success": True,
+                    "summary": NO_PROPERTIES_SUMMARY,
+                }
+
+            summary = await self._agenerate_property_summary(properties)
+
             return {
-                "success": False,
-                "error": f"Unexpected error: {str(e)}"
+                "success": True,
+                "summary": summary
             }
+
+        except Exception as e:
+            return self._error_response(e)
+
+    def stream_query(self, query: str, timer: Optional[QueryTimer] = None) -> Iterator[dict]:
+        """
+        Process a natural language real estate query, streaming the summary.
+
+        Token usage is not reported for streamed summaries.
+
+        Args:
+            query: Natural language query string
+            timer: Optional timer receiving the stage timings
+
+        Yields:
+            dict: Events of the response, in order:
+                {"event": "delta", "text": ...} for each piece of the summary,
+                then {"event": "done", "success": True} or
+                {"event": "error", "success": False, "error": ...}
+        """
+        timer = timer or QueryTimer()
+        success = False
+        try:
+            # The timer is only active outside of yields, as the consumer may
+            # resume the generator from another context
+            with timer.activate():
+                properties = self._find_properties(query)
+
+            if not properties:
+                yield {"event": "delta", "text": NO_PROPERTIES_SUMMARY}
+            else:
+                started_at = time.perf_counter()
+                for text in self._stream_property_summary(properties):
+                    yield {"event": "delta", "text": text}
+                timer.add_stage('summary', time.perf_counter() - started_at)
+
+            success = True
+            yield {"event": "done", "success": True}
+
+        except Exception as e:
+            with timer.activate():
+                error_response = self._error_response(e)
+            yield {"event": "error", **error_response}
+
+        finally:
+            timer.finish(success)
@@ -0,0 +1,190 @@
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import random
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .estate_snapshot import EstateSnapshot
+from .models import Estate
+from .query_timer import QueryTimer
+from .semantic_index import SemanticIndex
+
+
+class EstateSampler:
+    """
+    Picks random estates matching a set of filters without sorting the matching set.
+
+    Instead of `ORDER BY RANDOM()`, which sorts every matching row by a random key,
+    the sampler reads the ids of the matching estates (a narrow, index-backed scan),
+    draws k of them and loads only those k rows. Id lists are cached per filter
+    signature, so repeated filters cost a single primary key lookup of k rows.
+    With ESTATE_SNAPSHOT enabled, the matching ids are found in memory instead
+    (see EstateSnapshot) and the database only serves the k rows.
+
+    When a query text is given, the matching estates most similar to it are
+    picked first (see SemanticIndex), the remaining places are drawn at random.
+
+    The cache is cleared when estates change in this process (see estate/receivers.py)
+    and entries expire after ESTATE_SAMPLE_CACHE_TTL seconds to bound staleness
+    from writes made by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._random = random.Random(settings.ESTATE_SAMPLE_SEED)
+        # Filter signature -> (expiry timestamp, matching ids)
+        self._id_cache: OrderedDict[str, tuple[float, array]] = OrderedDict()
+        # Id cache lookups, for metrics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(filters: Dict[str, Any]) -> str:
+        """Build a stable cache key for a filters dictionary"""
+        return json.dumps(filters, sort_keys=True, default=str)
+
+    def invalidate(self) -> None:
+        """Drop all cached id lists"""
+        with self._lock:
+            self._id_cache.clear()
+
+    def _get_cached_ids(self, signature: str) -> Optional[array]:
+        """Get the cached ids of a filter signature, None when missing or expired"""
+        with self._lock:
+            cached = self._id_cache.get(signature)
+            if cached is not None and cached[0] > time.monotonic():
+                self._id_cache.move_to_end(signature)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        return None
+
+    def _cache_ids(self, signature: str, ids: array) -> None:
+        with self._lock:
+            self._id_cache[signature] = (
+                time.monotonic() + settings.ESTATE_SAMPLE_CACHE_TTL, ids)
+            self._id_cache.move_to_end(signature)
+            while len(self._id_cache) > settings.ESTATE_SAMPLE_CACHE_SIZE:
+                self._id_cache.popitem(last=False)
+
+    @property
+    def snapshot(self) -> EstateSnapshot:
+        """In-memory copy of the estates evaluating filters, shared through the ServiceProvider"""
+        # Import here to avoid circular import issues
+        from common.service_provider import ServiceProvider
+        return ServiceProvider.get_service(EstateSnapshot)
+
+    def _get_matching_ids(self, filters: Dict[str, Any]) -> Sequence[int]:
+        """
+        Get the ids of the estates matching the filters, from the snapshot or the
+        cache when possible.
+
+        Args:
+            filters: Validated Estate filters
+
+        Returns:
+            Sequence: Matching estate ids in ascending order
+        """
+        if settings.ESTATE_SNAPSHOT:
+            ids = self.snapshot.matching_ids(filters)
+            if ids is not None:
+                return ids
+
+        signature = self._signature(filters)
+        ids = self._get_cached_ids(signature)
+        if ids is None:
+            ids = array('q', sorted(
+                Estate.objects.filter(**filters).values_list('id', flat=True)))
+            self._cache_ids(signature, ids)
+            QueryTimer.record_rows_scanned(len(ids))
+        return ids
+
+    async def _aget_matching_ids(self, filters: Dict[str, Any]) -> Sequence[int]:
+        """Async version of `_get_matching_ids()`, using the async ORM"""
+        if settings.ESTATE_SNAPSHOT:
+            # Sync, as rebuilding the snapshot reads every estate
+            ids = await sync_to_async(self.snapshot.matching_ids)(filters)
+            if ids is not None:
+                return ids
+
+        signature = self._signature(filters)
+        ids = self._get_cached_ids(signature)
+        if ids is None:
+            queryset = Estate.objects.filter(**filters).values_list('id', flat=True)
+            ids = array('q', sorted([estate_id async for estate_id in queryset.aiterator()]))
+            self._cache_ids(signature, ids)
+            QueryTimer.record_rows_scanned(len(ids))
+        return ids
+
+    @property
+    def semantic_index(self) -> SemanticIndex:
+        """Text index ranking the matching estates, shared through the ServiceProvider"""
+        # Import here to avoid circular import issues
+        from common.service_provider import ServiceProvider
+        return ServiceProvider.get_service(SemanticIndex)
+
+    def _choose_ids(self, ids: Sequence[int], k: int, seed: Optional[int],
+                    query: Optional[str] = None) -> List[int]:
+        """
+        Pick up to k distinct ids: the most relevant to the query first when
+        semantic search is enabled, completed with random draws.
+        """
+        chosen = []
+        if query and settings.ESTATE_SEMANTIC_SEARCH:
+            chosen = self.semantic_index.top_k(query, ids, k)
+            if len(chosen) == k:
+                return chosen
+
+        # Drawing len(chosen) extra ids leaves k after removing the chosen ones
+        draws = min(k + len(chosen), len(ids))
+        # Positions are drawn, as NumPy arrays are not sequences for random.sample
+        if seed is not None:
+            positions = random.Random(seed).sample(range(len(ids)), draws)
+        else:
+            with self._lock:
+                positions = self._random.sample(range(len(ids)), draws)
+
+        picked = set(chosen)
+        drawn = [int(ids[position]) for position in positions]
+        return (chosen + [estate_id for estate_id in drawn if estate_id not in picked])[:k]
+
+    def sample(self, filters: Dict[str, Any], k: int = 5,
+               seed: Optional[int] = None, query: Optional[str] = None) -> List[Estate]:
+        """
+        Get up to k random estates matching the filters.
+
+        Args:
+            filters: Validated Estate filters
+            k: Number of estates to return
+            seed: Optional seed making the draw deterministic (mainly useful for testing)
+            query: Optional free text; the matching estates whose text is the most
+                similar to it are returned first (see ESTATE_SEMANTIC_SEARCH)
+
+        Returns:
+            List of at most k distinct matching estates, most relevant first, then
+            in random order
+        """
+        chosen_ids = self._choose_ids(self._get_matching_ids(filters), k, seed, query)
+        estates = Estate.objects.in_bulk(chosen_ids)
+        QueryTimer.record_rows_scanned(len(estates))
+
+        # Cached ids may reference estates deleted by another process
+        return [estates[estate_id] for estate_id in chosen_ids if estate_id in estates]
+
+    async def asample(self, filters: Dict[str, Any], k: int = 5,
+                      seed: Optional[int] = None, query: Optional[str] = None) -> List[Estate]:
+        """Async version of `sample()`, using the async ORM"""
+        ids = await self._aget_matching_ids(filters)
+        if query and settings.ESTATE_SEMANTIC_SEARCH:
+            # Sync, as ranking reads the semantic index and scores every candidate
+            chosen_ids = await sync_to_async(self._choose_ids)(ids, k, seed, query)
+        else:
+            chosen_ids = self._choose_ids(ids, k, seed)
+        estates = await Estate.objects.ain_bulk(chosen_ids)
+        QueryTimer.record_rows_scanned(len(estates))
+
+        return [estates[estate_id] for estate_id in chosen_ids if estate_id in estates]
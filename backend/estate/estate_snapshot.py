@@ -0,0 +1,375 @@
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Estate
+from .query_timer import QueryTimer
+
+
+class EstateSnapshot:
+    """
+    Read-only columnar copy of the filterable fields of every estate, held in
+    NumPy arrays, evaluating validated filters without querying the database.
+
+    Foreign keys to Types (bedrooms, bathrooms, furnished, city, category and
+    type) are low-cardinality, so each of their Types ids has a bitmap index:
+    one packed bitset over the estates, with a bit set for every estate
+    referencing it. Equality filters on them are answered by ANDing bitsets,
+    counts by population counts; the remaining filters are vectorized
+    comparisons over the estates left. Foreign keys are stored as Types ids,
+    -1 for none, and dates as POSIX timestamps.
+
+    Estates uploaded in this process are appended as they are saved, into
+    arrays and bitsets over-allocated by doubling, so an append only writes
+    the new rows and the bits of the Types ids they reference; a truncation
+    empties the snapshot (see estate/receivers.py). Estates saved
+    one at a time, which may be updates, make it rebuild on its next use, as
+    do writes of other processes, detected by comparing the highest estate id
+    and the number of estates to those of the snapshot at most every
+    ESTATE_SNAPSHOT_CHECK_INTERVAL seconds.
+
+    Note:
+        - Other processes updating estates in place, without creating or
+          deleting any, are not detected until the snapshot is rebuilt
+        - Filters the snapshot cannot evaluate exactly like the database
+          (e.g. None values) are left to the database
+    """
+
+    NUMERIC_COLUMNS = ('price', 'size')
+    FOREIGN_KEY_COLUMNS = ('bathrooms', 'bedrooms', 'furnished', 'city', 'category', 'type')
+    COLUMN_TYPES = {
+        'id': np.int64,
+        'price': np.int64,
+        'size': np.int64,
+        'verified': bool,
+        'created_at': np.float64,
+        **{column: np.int32 for column in FOREIGN_KEY_COLUMNS},
+    }
+    # Rows read from the database at a time while building
+    BUILD_CHUNK_SIZE = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Views of the first len(self) rows of the buffers below, whose rows
+        # are never written again once handed to readers
+        self._columns: Dict[str, np.ndarray] = self._to_columns([])
+        # Foreign key column -> Types id -> packed bitset over the rows
+        self._bitmaps: Dict[str, Dict[int, np.ndarray]] = self._index(self._columns)
+        # Arrays and bitsets holding rows up to the capacity, for appends
+        self._column_buffers = self._columns
+        self._bitmap_buffers = self._bitmaps
+        self._capacity = 0
+        # (highest id, count) of the estates in the snapshot
+        self._version: Optional[Tuple[Optional[int], int]] = None
+        self._stale = True
+        self._next_check = 0.0
+
+    def invalidate(self) -> None:
+        """Rebuild the snapshot before its next use"""
+        self._stale = True
+
+    def __len__(self) -> int:
+        return len(self._columns['id'])
+
+    # Building
+
+    @staticmethod
+    def _database_version() -> Tuple[Optional[int], int]:
+        version = Estate.objects.aggregate(max_id=Max('id'), count=Count('id'))
+        return version['max_id'], version['count']
+
+    @classmethod
+    def _fields(cls) -> Tuple[str, ...]:
+        return ('id', *cls.NUMERIC_COLUMNS, 'verified', 'created_at',
+                *(f'{column}_id' for column in cls.FOREIGN_KEY_COLUMNS))
+
+    @classmethod
+    def _to_columns(cls, rows: List[Tuple]) -> Dict[str, np.ndarray]:
+        """Convert rows of the `_fields()` values of estates to columns"""
+        if not rows:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in cls.COLUMN_TYPES.items()}
+
+        ids, prices, sizes, verified, created_at, *foreign_keys = zip(*rows)
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'price': np.array(prices, dtype=np.int64),
+            'size': np.array(sizes, dtype=np.int64),
+            'verified': np.array(verified, dtype=bool),
+            'created_at': np.fromiter(map(datetime.timestamp, created_at),
+                                      dtype=np.float64, count=len(created_at)),
+            **{
+                column: np.array([-1 if value is None else value for value in values],
+                                 dtype=np.int32)
+                for column, values in zip(cls.FOREIGN_KEY_COLUMNS, foreign_keys)
+            },
+        }
+
+    @classmethod
+    def _concatenate(cls, parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        if len(parts) == 1:
+            return parts[0]
+        return {column: np.concatenate([part[column] for part in parts])
+                for column in cls.COLUMN_TYPES}
+
+    @classmethod
+    def _index(cls, columns: Dict[str, np.ndarray]) -> Dict[str, Dict[int, np.ndarray]]:
+        """Build the bitmap of every Types id referenced by the foreign key columns"""
+        bitmaps = {}
+        for column in cls.FOREIGN_KEY_COLUMNS:
+            values = columns[column]
+            bitmaps[column] = {int(type_id): np.packbits(values == type_id)
+                               for type_id in np.unique(values) if type_id >= 0}
+        return bitmaps
+
+    def _set_columns(self, columns: Dict[str, np.ndarray],
+                     version: Tuple[Optional[int], int]) -> None:
+        # Readers take both under the lock, so they always match
+        self._bitmaps = self._bitmap_buffers = self._index(columns)
+        self._columns = self._column_buffers = columns
+        self._capacity = len(columns['id'])
+        self._version = version
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the buffers to hold `rows` more rows, doubling their capacity"""
+        count = len(self)
+        needed = count + rows
+        if needed <= self._capacity:
+            return
+
+        capacity = max(needed, 2 * self._capacity, self.BUILD_CHUNK_SIZE)
+        column_buffers = {}
+        for column, dtype in self.COLUMN_TYPES.items():
+            column_buffers[column] = np.empty(capacity, dtype=dtype)
+            column_buffers[column][:count] = self._columns[column]
+        bitmap_buffers = {}
+        for column, bitmaps in self._bitmap_buffers.items():
+            bitmap_buffers[column] = {}
+            for type_id, bitmap in bitmaps.items():
+                # Bits past the rows must stay clear, appends only set bits
+                buffer = np.zeros((capacity + 7) // 8, dtype=np.uint8)
+                buffer[:(count + 7) // 8] = bitmap[:(count + 7) // 8]
+                bitmap_buffers[column][type_id] = buffer
+
+        self._column_buffers = column_buffers
+        self._bitmap_buffers = bitmap_buffers
+        self._capacity = capacity
+
+    def _append(self, columns: Dict[str, np.ndarray]) -> None:
+        """Write rows after the last one and publish views including them"""
+        start = len(self)
+        end = start + len(columns['id'])
+        self._reserve(end - start)
+
+        for column, values in columns.items():
+            self._column_buffers[column][start:end] = values
+
+        # Bits of the new rows, from the byte holding the first one: the bits
+        # of the rows already in that byte are kept, those after them are clear
+        first_byte, offset = divmod(start, 8)
+        for column in self.FOREIGN_KEY_COLUMNS:
+            buffers = self._bitmap_buffers[column]
+            values = columns[column]
+            for type_id in np.unique(values):
+                if type_id < 0:
+                    continue
+                buffer = buffers.get(int(type_id))
+                if buffer is None:
+                    buffer = np.zeros((self._capacity + 7) // 8, dtype=np.uint8)
+                    buffers[int(type_id)] = buffer
+                bits = values == type_id
+                if offset:
+                    kept = np.unpackbits(buffer[first_byte:first_byte + 1])[:offset]
+                    bits = np.concatenate([kept, bits])
+                packed = np.packbits(bits)
+                buffer[first_byte:first_byte + len(packed)] = packed
+
+        # New dictionaries and views, readers keep iterating the previous ones
+        self._columns = {column: buffer[:end] for column, buffer in self._column_buffers.items()}
+        self._bitmaps = {
+            column: {type_id: buffer[:(end + 7) // 8] for type_id, buffer in buffers.items()}
+            for column, buffers in self._bitmap_buffers.items()
+        }
+
+    def _build(self) -> None:
+        # Read first: estates written during the build make the next check rebuild
+        version = self._database_version()
+        rows = Estate.objects.order_by('id').values_list(*self._fields()) \
+            .iterator(chunk_size=self.BUILD_CHUNK_SIZE)
+
+        chunks = []
+        while chunk := list(islice(rows, self.BUILD_CHUNK_SIZE)):
+            chunks.append(self._to_columns(chunk))
+        self._set_columns(self._concatenate(chunks or [self._to_columns([])]), version)
+
+    def _refresh(self) -> None:
+        """Rebuild the snapshot when stale, or when the database changed"""
+        now = time.monotonic()
+        if not self._stale and now < self._next_check:
+            return
+
+        if self._stale or self._database_version() != self._version:
+            # Cleared first, as estates may change again while building
+            self._stale = False
+            try:
+                self._build()
+            except Exception:
+                self._stale = True
+                raise
+        self._next_check = now + settings.ESTATE_SNAPSHOT_CHECK_INTERVAL
+
+    # Writes of this process
+
+    def add_estates(self, estates: Iterable[Estate]) -> None:
+        """
+        Append estates created in bulk, instead of rebuilding the snapshot.
+
+        Args:
+            estates: Saved estates, with ids higher than any estate of the snapshot
+        """
+        rows = [tuple(getattr(estate, field) for field in self._fields()) for estate in estates]
+        if not rows:
+            return
+
+        with self._lock:
+            if self._stale or self._version is None:
+                return
+
+            max_id, count = self._version
+            ids = [row[0] for row in rows]
+            # Ids must keep increasing for the snapshot to stay sorted
+            if None in ids or any(row[4] is None for row in rows) or ids != sorted(ids) \
+                    or (max_id is not None and ids[0] <= max_id):
+                self._stale = True
+                return
+
+            self._append(self._to_columns(rows))
+            self._version = (ids[-1], count + len(rows))
+
+    def clear(self) -> None:
+        """Empty the snapshot after every estate was deleted"""
+        with self._lock:
+            self._set_columns(self._to_columns([]), (None, 0))
+            self._stale = False
+
+    # Reads
+
+    @staticmethod
+    def _compare(values: np.ndarray, column: str, suffix: str, value: Any) -> Optional[np.ndarray]:
+        """Evaluate one filter over the values of its column, None when it cannot be"""
+        if column == 'created_at':
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if settings.USE_TZ and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            value = value.timestamp()
+        elif column == 'verified':
+            if not isinstance(value, bool):
+                return None
+        else:
+            value = int(value)
+
+        if suffix == '':
+            return values == value
+        if suffix == '__gt':
+            return values > value
+        if suffix == '__lt':
+            return values < value
+        return None
+
+    def _positions(self, columns: Dict[str, np.ndarray], bitmaps: Dict[str, Dict[int, np.ndarray]],
+                   filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Rows of the estates matching the filters, None when they cannot be evaluated"""
+        count = len(columns['id'])
+        bits = None
+        comparisons = []
+        try:
+            for field, value in filters.items():
+                column, separator, suffix = field.partition('__')
+                suffix = separator + suffix
+                if value is None or column not in columns or column == 'id':
+                    return None
+
+                if column in bitmaps and suffix == '':
+                    bitmap = bitmaps[column].get(int(value))
+                    if bitmap is None:
+                        return np.empty(0, dtype=np.int64)
+                    bits = bitmap if bits is None else bits & bitmap
+                else:
+                    comparisons.append((column, suffix, value))
+
+            if bits is None:
+                # No bitmap to start from, compare every row
+                mask = np.ones(count, dtype=bool)
+                for column, suffix, value in comparisons:
+                    matches = self._compare(columns[column], column, suffix, value)
+                    if matches is None:
+                        return None
+                    mask &= matches
+                return np.flatnonzero(mask)
+
+            positions = np.flatnonzero(np.unpackbits(bits, count=count))
+            for column, suffix, value in comparisons:
+                matches = self._compare(columns[column][positions], column, suffix, value)
+                if matches is None:
+                    return None
+                positions = positions[matches]
+            return positions
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def _read(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[int, np.ndarray]]]:
+        with self._lock:
+            self._refresh()
+            return self._columns, self._bitmaps
+
+    def matching_ids(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Get the ids of the estates matching the filters.
+
+        Args:
+            filters: Validated Estate filters
+
+        Returns:
+            np.ndarray: Matching estate ids in ascending order, None when the
+                filters must be evaluated by the database instead
+        """
+        with QueryTimer.measure('snapshot'):
+            columns, bitmaps = self._read()
+            positions = self._positions(columns, bitmaps, filters)
+            return None if positions is None else columns['id'][positions]
+
+    def facet_counts(self, filters: Dict[str, Any]) -> Optional[Tuple[int, Dict[str, Dict[int, int]]]]:
+        """
+        Count the estates matching the filters by Types id of each foreign key.
+
+        Args:
+            filters: Validated Estate filters, possibly empty
+
+        Returns:
+            tuple: Number of matching estates, and for each foreign key column
+                the number of matching estates referencing each Types id (ids
+                without any left out). None when the filters must be evaluated
+                by the database instead
+        """
+        with QueryTimer.measure('snapshot'):
+            columns, bitmaps = self._read()
+            positions = self._positions(columns, bitmaps, filters)
+            if positions is None:
+                return None
+
+            matches = np.zeros(len(columns['id']), dtype=bool)
+            matches[positions] = True
+            matching_bits = np.packbits(matches)
+
+            facets = {}
+            for column, column_bitmaps in bitmaps.items():
+                counts = {type_id: int(np.bitwise_count(matching_bits & bitmap).sum())
+                          for type_id, bitmap in column_bitmaps.items()}
+                facets[column] = {type_id: count for type_id, count in counts.items() if count}
+            return len(positions), facets
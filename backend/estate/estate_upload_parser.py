@@ -0,0 +1,270 @@
+from datetime import datetime
+from typing import Callable, Dict, Tuple
+import math
+import re
+import numpy as np
+import pandas as pd
+
+
+class EstateUploadParser:
+    """
+    Column-wise parsing of estate CSV uploads.
+
+    Every column is converted with vectorized pandas operations. Cells the
+    vectorized pass cannot handle are re-parsed one by one with the scalar
+    parsers, which either recover the value or produce the error message for
+    that cell, so the results are identical to parsing cell by cell.
+    """
+
+    TRUE_VALUES = ['YES', 'TRUE', '1', 'Y']
+    FALSE_VALUES = ['NO', 'FALSE', '0', 'N']
+    SIZE_PATTERN = r'^(\d+)\s*sqft$'
+
+    @staticmethod
+    def _convert_to_boolean(value) -> bool:
+        """Convert various string representations to boolean values"""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            value = value.strip().upper()
+            if value in EstateUploadParser.TRUE_VALUES:
+                return True
+            if value in EstateUploadParser.FALSE_VALUES:
+                return False
+        raise ValueError(f"Cannot convert '{value}' to boolean")
+
+    @staticmethod
+    def _parse_datetime(value) -> datetime:
+        """Convert ISO format string to datetime"""
+        if pd.isna(value):
+            return None
+        try:
+            return pd.to_datetime(value)
+        except Exception as e:
+            raise ValueError(
+                f"Invalid datetime format. Expected ISO format: {str(e)}")
+
+    @staticmethod
+    def _parse_size(value) -> int:
+        """Extract numeric value from size string (e.g., '1323 sqft' -> 1323)"""
+        if pd.isna(value):
+            raise ValueError("Size cannot be empty")
+        if isinstance(value, (int, float)):
+            return int(value)
+
+        value = str(value).strip().lower()
+        match = re.match(EstateUploadParser.SIZE_PATTERN, value)
+        if match:
+            return int(match.group(1))
+        raise ValueError(
+            f"Invalid size format. Expected 'X sqft', got '{value}'")
+
+    @staticmethod
+    def _normalize_strings(series: pd.Series) -> pd.Series:
+        """
+        Strip and upper-case the string cells of a column.
+
+        Args:
+            series: Column to normalize
+
+        Returns:
+            pd.Series: Normalized strings, NaN for cells that are not strings
+        """
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            try:
+                return series.str.strip().str.upper()
+            except AttributeError:
+                # Column holds no string values at all
+                pass
+        return pd.Series(float('nan'), index=series.index, dtype=object)
+
+    @staticmethod
+    def _reparse_invalid_cells(series: pd.Series, parsed: pd.Series, invalid: pd.Series,
+                               parser: Callable) -> Tuple[pd.Series, pd.Series]:
+        """
+        Re-parse the cells flagged by a vectorized parser with its scalar counterpart.
+
+        Args:
+            series: Raw column values
+            parsed: Vectorized parsing result
+            invalid: Boolean mask of cells the vectorized pass could not parse
+            parser: Scalar parser raising ValueError for invalid values
+
+        Returns:
+            tuple: (parsed column, error messages aligned with the column index)
+        """
+        errors = pd.Series(None, index=series.index, dtype=object)
+        if not invalid.any():
+            return parsed, errors
+
+        parsed = parsed.astype(object)
+        for index in series.index[invalid]:
+            try:
+                parsed.at[index] = parser(series.at[index])
+            except ValueError as e:
+                errors.at[index] = str(e)
+
+        return parsed, errors
+
+    @classmethod
+    def parse_boolean_column(cls, series: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """
+        Convert a column of boolean representations ('YES', 'N', 'true', ...) to booleans.
+
+        Args:
+            series: Raw column values
+
+        Returns:
+            tuple: (boolean column, error messages aligned with the column index)
+        """
+        if pd.api.types.is_bool_dtype(series):
+            return series, pd.Series(None, index=series.index, dtype=object)
+
+        normalized = cls._normalize_strings(series)
+        is_true = normalized.isin(cls.TRUE_VALUES)
+        invalid = ~(is_true | normalized.isin(cls.FALSE_VALUES))
+
+        return cls._reparse_invalid_cells(series, is_true, invalid, cls._convert_to_boolean)
+
+    @classmethod
+    def parse_datetime_column(cls, series: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """
+        Convert a column of ISO date strings to datetimes, empty cells becoming None.
+
+        Args:
+            series: Raw column values
+
+        Returns:
+            tuple: (datetime column, error messages aligned with the column index)
+        """
+        try:
+            parsed = pd.to_datetime(series, errors='coerce', format='ISO8601')
+        except (ValueError, TypeError):
+            # Mixed offsets or types, leave every cell to the scalar parser
+            parsed = pd.Series(pd.NaT, index=series.index)
+
+        invalid = parsed.isna() & series.notna()
+        parsed = parsed.astype(object).where(parsed.notna(), None)
+
+        return cls._reparse_invalid_cells(series, parsed, invalid, cls._parse_datetime)
+
+    @staticmethod
+    def _parse_price(value) -> int:
+        """Convert a price cell to an integer"""
+        if pd.isna(value) or (isinstance(value, str) and not value.strip()):
+            raise ValueError("Price cannot be empty")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid price: '{value}'")
+        if not math.isfinite(number):
+            raise ValueError(f"Invalid price: '{value}'")
+        return int(number)
+
+    @classmethod
+    def parse_price_column(cls, series: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """
+        Convert a column of prices to integers.
+
+        Args:
+            series: Raw column values
+
+        Returns:
+            tuple: (integer column, 0 for invalid cells,
+                error messages aligned with the column index)
+        """
+        numbers = pd.to_numeric(series, errors='coerce')
+        invalid = ~np.isfinite(numbers.astype('float64'))
+        parsed = numbers.where(~invalid, 0).astype('int64')
+
+        parsed, errors = cls._reparse_invalid_cells(series, parsed, invalid, cls._parse_price)
+        return parsed.astype('int64'), errors
+
+    @classmethod
+    def parse_size_column(cls, series: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """
+        Extract the numeric value from a column of size strings (e.g., '1323 sqft' -> 1323).
+
+        Args:
+            series: Raw column values
+
+        Returns:
+            tuple: (integer column, error messages aligned with the column index)
+        """
+        if pd.api.types.is_numeric_dtype(series):
+            invalid = series.isna()
+            parsed = series.where(~invalid, 0).astype('int64')
+        else:
+            normalized = cls._normalize_strings(series).str.lower()
+            extracted = normalized.str.extract(cls.SIZE_PATTERN, expand=False)
+            invalid = extracted.isna()
+            parsed = extracted.where(~invalid, '0').astype('int64')
+
+        return cls._reparse_invalid_cells(series, parsed, invalid, cls._parse_size)
+
+    @staticmethod
+    def parse_type_column(series: pd.Series, value_ids: Dict[str, int],
+                          column_name: str) -> Tuple[pd.Series, pd.Series]:
+        """
+        Convert a column of type values to the ids of the matching Types.
+
+        Args:
+            series: Raw column values
+            value_ids: Mapping of allowed type values to their ids
+            column_name: Name of the column, used in error messages
+
+        Returns:
+            tuple: (column of type ids with NaN for empty cells,
+                error messages aligned with the column index)
+
+        Note:
+            - The comparison between input values and allowed values is case-sensitive
+        """
+        parsed = series.map(value_ids)
+        invalid = parsed.isna() & series.notna()
+
+        errors = pd.Series(None, index=series.index, dtype=object)
+        if invalid.any():
+            allowed = ', '.join(value_ids)
+            errors[invalid] = series[invalid].map(
+                lambda value: f"Invalid value: '{value}' for column: {column_name}. "
+                              f"Allowed values are: {allowed}")
+
+        return parsed, errors
+
+    @classmethod
+    def parse(cls, df: pd.DataFrame,
+              type_value_ids: Dict[str, Dict[str, int]]) -> Tuple[pd.DataFrame, pd.Series]:
+        """
+        Parse the price, special and type columns of an estate upload.
+
+        Args:
+            df: Upload DataFrame, modified in place
+            type_value_ids: Mapping of type column names to their allowed value -> id maps
+
+        Returns:
+            tuple: (parsed DataFrame, per-row error messages, NaN for rows that parsed cleanly)
+        """
+        column_errors = []
+
+        df['price'], errors = cls.parse_price_column(df['price'])
+        column_errors.append(errors)
+        df['verified'], errors = cls.parse_boolean_column(df['verified'])
+        column_errors.append(errors)
+        df['addedOn'], errors = cls.parse_datetime_column(df['addedOn'])
+        column_errors.append(errors)
+        df['sizeMin'], errors = cls.parse_size_column(df['sizeMin'])
+        column_errors.append(errors)
+
+        for column, value_ids in type_value_ids.items():
+            df[column], errors = cls.parse_type_column(
+                df[column], value_ids, column)
+            column_errors.append(errors)
+
+        # Combine the messages of all invalid cells of a row
+        errors = pd.concat(column_errors, axis=1)
+        row_errors = pd.Series(None, index=df.index, dtype=object)
+        for index in df.index[errors.notna().any(axis=1)]:
+            row_errors.at[index] = '; '.join(errors.loc[index].dropna())
+
+        return df, row_errors
@@ -0,0 +1,215 @@
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Optional
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from common.service_provider import ServiceProvider
+from .types_registry import TypesRegistry
+
+
+class LocalMemoryFilterCacheBackend:
+    """Per-process LRU cache with a time to live"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Key -> (expiry timestamp, filters)
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, filters: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, filters)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DjangoFilterCacheBackend:
+    """Cache stored in one of the Django CACHES, shared between processes when the cache is"""
+
+    def __init__(self, alias: str, ttl: int):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.cache.get(key)
+
+    def set(self, key: str, filters: dict) -> None:
+        self.cache.set(key, filters, self.ttl)
+
+
+class FilterCache:
+    """
+    Cache of the filters extracted from natural language queries.
+
+    Queries are keyed by a normalized form (case, punctuation, whitespace and
+    number formats), so near-identical questions share one filter extraction.
+    Keys include the TypesRegistry fingerprint, so cached type ids never outlive
+    the Types table they were extracted against.
+
+    The backend is chosen with ESTATE_FILTER_CACHE_BACKEND: 'local' (per-process
+    LRU, default), 'django' (the ESTATE_FILTER_CACHE_ALIAS Django cache) or 'none'.
+    """
+
+    KEY_PREFIX = 'estate:filters'
+
+    # Multipliers of number suffixes (e.g. '900k', '1.5 million')
+    NUMBER_MULTIPLIERS = {
+        'k': 1_000,
+        'thousand': 1_000,
+        'm': 1_000_000,
+        'mil': 1_000_000,
+        'mln': 1_000_000,
+        'million': 1_000_000,
+    }
+    NUMBER_PATTERN = re.compile(
+        r'(?<![\w.])(\d+(?:\.\d+)?)\s*(' + '|'.join(
+            sorted(NUMBER_MULTIPLIERS, key=len, reverse=True)) + r')\b')
+    THOUSANDS_SEPARATOR_PATTERN = re.compile(r'(?<=\d),(?=\d{3}\b)')
+    PUNCTUATION_PATTERN = re.compile(r'[^\w\s.]|_')
+    # Periods that are not decimal points
+    PERIOD_PATTERN = re.compile(r'(?<!\d)\.|\.(?!\d)')
+
+    def __init__(self):
+        self.types_registry = ServiceProvider.get_service(TypesRegistry)
+
+        backend = settings.ESTATE_FILTER_CACHE_BACKEND
+        if backend == 'local':
+            self.backend = LocalMemoryFilterCacheBackend(
+                settings.ESTATE_FILTER_CACHE_SIZE, settings.ESTATE_FILTER_CACHE_TTL)
+        elif backend == 'django':
+            self.backend = DjangoFilterCacheBackend(
+                settings.ESTATE_FILTER_CACHE_ALIAS, settings.ESTATE_FILTER_CACHE_TTL)
+        elif backend == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown filter cache backend: '{backend}'")
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def _expand_number(cls, match: re.Match) -> str:
+        value = Decimal(match.group(1)) * cls.NUMBER_MULTIPLIERS[match.group(2)]
+        return format(value.normalize(), 'f')
+
+    @classmethod
+    def normalize_query(cls, query: str) -> str:
+        """
+        Normalize a query so that equivalent phrasings map to the same string.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            str: Normalized query
+
+        Examples:
+            >>> FilterCache.normalize_query("3-Bedroom villa in Dubai, under 1.5M!")
+            '3 bedroom villa in dubai under 1500000'
+            >>> FilterCache.normalize_query("3 bedroom villa dubai under 1,500,000")
+            '3 bedroom villa dubai under 1500000'
+        """
+        text = unicodedata.normalize('NFKC', query).lower()
+        text = cls.THOUSANDS_SEPARATOR_PATTERN.sub('', text)
+        text = cls.NUMBER_PATTERN.sub(cls._expand_number, text)
+        text = cls.PUNCTUATION_PATTERN.sub(' ', text)
+        text = cls.PERIOD_PATTERN.sub(' ', text)
+        return ' '.join(text.split())
+
+    def _key(self, query: str) -> str:
+        digest = hashlib.sha1(self.normalize_query(query).encode()).hexdigest()
+        return f'{self.KEY_PREFIX}:{self.types_registry.fingerprint}:{digest}'
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached filters of a query.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            dict: A copy of the cached filters, or None on a miss
+        """
+        filters = self.backend.get(self._key(query)) if self.backend is not None else None
+
+        with self._lock:
+            if filters is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return dict(filters) if filters is not None else None
+
+    def set(self, query: str, filters: Dict[str, Any]) -> None:
+        """Cache the filters extracted from a query"""
+        if self.backend is not None:
+            self.backend.set(self._key(query), dict(filters))
+
+    def get_or_extract(self, query: str,
+                       extract: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Get the cached filters of a query, extracting and caching them on a miss.
+
+        Args:
+            query: Natural language query string
+            extract: Function extracting the filters of a query, raising instead
+                of returning filters that must not be cached (e.g. invalid ones)
+
+        Returns:
+            dict: Filters of the query
+        """
+        filters = self.get(query)
+        if filters is None:
+            filters = extract(query)
+            self.set(query, filters)
+        return filters
+
+    async def aget_or_extract(self, query: str,
+                              extract: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Async version of `get_or_extract()`, taking a coroutine function extracting
+        the filters of a query.
+        """
+        # Keys depend on the TypesRegistry, which may have to be loaded
+        filters = await sync_to_async(self.get)(query)
+        if filters is None:
+            filters = await extract(query)
+            await sync_to_async(self.set)(query, filters)
+        return filters
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of this process, for tuning"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': settings.ESTATE_FILTER_CACHE_BACKEND,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'entries': len(self.backend) if isinstance(
+                    self.backend, LocalMemoryFilterCacheBackend) else None,
+            }
@@ -0,0 +1,104 @@
+from functools import reduce
+from typing import Any, Dict, List, Optional, Tuple
+import operator
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Estate
+from .query_timer import QueryTimer
+
+
+class KeywordSearch:
+    """
+    Keyword search over the title and description of estates, combined with
+    structured filters.
+
+    On SQLite, keywords are matched through the `estate_estate_fts` FTS5 index
+    (migration 0004) and ranked with BM25, while the filters restrict the
+    matches through the regular estate indexes; both sides are index-backed.
+    Other databases, or a database without the FTS table, fall back to
+    case-insensitive LIKE scans without ranking.
+
+    Every keyword must appear in the title or the description of a result.
+    """
+
+    FTS_TABLE = 'estate_estate_fts'
+    KEYWORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self):
+        # Whether the FTS table exists, checked on first use
+        self._fts_available: Optional[bool] = None
+
+    def fts_available(self) -> bool:
+        if connection.vendor != 'sqlite':
+            return False
+        if self._fts_available is None:
+            self._fts_available = self.FTS_TABLE in connection.introspection.table_names()
+        return self._fts_available
+
+    @classmethod
+    def _keywords(cls, keywords: str) -> List[str]:
+        words = cls.KEYWORD_PATTERN.findall(keywords.lower())
+        if not words:
+            raise ValueError('At least one keyword is required')
+        return words
+
+    def _fts_search(self, words: List[str], filters: Dict[str, Any],
+                    limit: int) -> List[Tuple[int, float]]:
+        # Quoted, so keywords are never read as FTS5 operators
+        match = ' '.join(f'"{word}"' for word in words)
+        filtered_sql, filtered_params = Estate.objects.filter(**filters) \
+            .values('id').query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            # The unary + keeps SQLite from pushing the id list into the FTS
+            # table, which would run the MATCH once per filtered estate: the
+            # keyword matches are read once and probed against the filtered ids
+            cursor.execute(
+                f'SELECT rowid, bm25({self.FTS_TABLE}) AS rank FROM {self.FTS_TABLE} '
+                f'WHERE {self.FTS_TABLE} MATCH %s AND +rowid IN ({filtered_sql}) '
+                f'ORDER BY rank LIMIT %s',
+                [match, *filtered_params, limit])
+            # BM25 is negative in SQLite, lower is better
+            return [(estate_id, -rank) for estate_id, rank in cursor.fetchall()]
+
+    @staticmethod
+    def _like_search(words: List[str], filters: Dict[str, Any],
+                     limit: int) -> List[Tuple[int, Optional[float]]]:
+        conditions = [Q(title__icontains=word) | Q(description__icontains=word) for word in words]
+        ids = Estate.objects.filter(**filters).filter(reduce(operator.and_, conditions)) \
+            .order_by('id').values_list('id', flat=True)[:limit]
+        return [(estate_id, None) for estate_id in ids]
+
+    def search(self, keywords: str, filters: Optional[Dict[str, Any]] = None,
+               limit: int = 10) -> List[Tuple[Estate, Optional[float]]]:
+        """
+        Find the estates mentioning all the keywords and matching the filters.
+
+        Args:
+            keywords: Free text, split into words
+            filters: Validated Estate filters
+            limit: Maximum number of results
+
+        Returns:
+            list: (estate, score) pairs, best match first. Scores are BM25
+                relevance (higher is better), None with the LIKE fallback
+
+        Raises:
+            ValueError: If the keywords contain no word
+        """
+        words = self._keywords(keywords)
+        filters = filters or {}
+
+        with QueryTimer.measure('search'):
+            if self.fts_available():
+                matches = self._fts_search(words, filters, limit)
+            else:
+                matches = self._like_search(words, filters, limit)
+
+            estates = Estate.objects.in_bulk([estate_id for estate_id, _ in matches])
+            QueryTimer.record_rows_scanned(len(estates))
+
+        return [(estates[estate_id], score) for estate_id, score in matches if estate_id in estates]
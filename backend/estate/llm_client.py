@@ -0,0 +1,263 @@
+from typing import Any, Dict, Iterator, List, Optional
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
+import openai
+from django.conf import settings
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from .admission_control import AdmissionController, LLMOverloadedError
+from .query_timer import QueryTimer
+
+
+class _AdmittedStream:
+    """
+    Streamed completion holding its admission slot until it is exhausted,
+    closed or garbage collected.
+    """
+
+    def __init__(self, stream, admission: AdmissionController):
+        self._stream = stream
+        self._admission = admission
+        self._released = False
+
+    def __iter__(self) -> Iterator:
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self._released:
+            self._released = True
+            self._stream.close()
+            self._admission.release()
+
+    def __del__(self):
+        self.close()
+
+
+class LLMClient:
+    """
+    Long-lived Azure OpenAI client shared by all requests.
+
+    The client owns a pooled HTTP client with keep-alive connections, so
+    steady-state queries reuse warm TLS connections instead of opening a new
+    pool per request. Obtain it through the ServiceProvider; it is safe to use
+    from multiple threads.
+
+    Async callers use `acomplete()`, served by an async client per event loop,
+    as async connections cannot be shared between loops. Under an ASGI server
+    there is a single loop, hence a single pool.
+
+    Calls go through an AdmissionController bounding their concurrency and
+    rate (see ESTATE_LLM_MAX_CONCURRENCY and related settings). Rate limited
+    (429), timed out and server error responses are retried up to
+    ESTATE_LLM_MAX_RETRIES times with jittered exponential backoff, honoring
+    Retry-After; a call still rate limited raises LLMOverloadedError.
+    """
+
+    # Backoff before retry n (from 0) is drawn from [0, min(CAP, BASE * 2^n)]
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 8.0
+
+    RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APIConnectionError,  # Includes timeouts
+        openai.InternalServerError,
+    )
+
+    def __init__(self):
+        self.deployment = os.getenv('AZURE_OPENAI_DEPLOYMENT')
+        self.client = self._create_client()
+        self.admission = AdmissionController(
+            max_concurrency=settings.ESTATE_LLM_MAX_CONCURRENCY,
+            max_queue=settings.ESTATE_LLM_MAX_QUEUE,
+            queue_timeout=settings.ESTATE_LLM_QUEUE_TIMEOUT,
+            rate=settings.ESTATE_LLM_RATE_LIMIT,
+            burst=settings.ESTATE_LLM_RATE_BURST
+        )
+        self._stats_lock = threading.Lock()
+        self.retries = 0
+        self.rate_limited = 0
+        self._async_lock = threading.Lock()
+        # Event loop -> async client, dropped with their loop
+        self._async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncAzureOpenAI] = \
+            weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.ESTATE_LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ESTATE_LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.ESTATE_LLM_KEEPALIVE_EXPIRY
+        )
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        return httpx.Timeout(
+            settings.ESTATE_LLM_TIMEOUT,
+            connect=settings.ESTATE_LLM_CONNECT_TIMEOUT
+        )
+
+    def _create_client(self) -> AzureOpenAI:
+        """Create the OpenAI client, overridden by stubs (see estate/benchmark.py)"""
+        return AzureOpenAI(
+            http_client=DefaultHttpxClient(
+                limits=self._limits(),
+                timeout=self._timeout()
+            ),
+            # Retries are made by _retry_delay() callers, within admission control
+            max_retries=0
+        )
+
+    def _create_async_client(self) -> AsyncAzureOpenAI:
+        """Create the async OpenAI client of an event loop"""
+        return AsyncAzureOpenAI(
+            http_client=DefaultAsyncHttpxClient(
+                limits=self._limits(),
+                timeout=self._timeout()
+            ),
+            max_retries=0
+        )
+
+    @property
+    def async_client(self) -> AsyncAzureOpenAI:
+        """The async client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = self._create_async_client()
+            return client
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Decide whether a failed attempt is retried.
+
+        Args:
+            error: Error raised by the attempt
+            attempt: Number of the failed attempt, from 0
+
+        Returns:
+            float: Seconds to wait before retrying, None to give up
+
+        Raises:
+            LLMOverloadedError: If the call is still rate limited after the last retry
+        """
+        if isinstance(error, openai.RateLimitError):
+            with self._stats_lock:
+                self.rate_limited += 1
+
+        retry_after = None
+        if isinstance(error, openai.APIStatusError):
+            try:
+                retry_after = float(error.response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                pass
+
+        if not isinstance(error, self.RETRYABLE_ERRORS) or attempt >= settings.ESTATE_LLM_MAX_RETRIES:
+            if isinstance(error, openai.RateLimitError):
+                raise LLMOverloadedError(
+                    'The language model is rate limited', retry_after or self.BACKOFF_CAP) from error
+            return None
+
+        with self._stats_lock:
+            self.retries += 1
+
+        delay = random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs: Any):
+        """
+        Create a chat completion with the configured deployment.
+
+        Args:
+            messages: Chat messages to send
+            **kwargs: Additional completion parameters (temperature, max_tokens, ...)
+
+        Returns:
+            ChatCompletion: The completion response, or an iterator of
+                ChatCompletionChunk with stream=True
+
+        Raises:
+            LLMOverloadedError: If the call is not admitted or stays rate limited
+        """
+        self.admission.acquire()
+        streaming = False
+        try:
+            attempt = 0
+            while True:
+                time.sleep(self.admission.reserve_token())
+                try:
+                    response = self.client.chat.completions.create(
+                        model=self.deployment,
+                        messages=messages,
+                        **kwargs
+                    )
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+
+            if kwargs.get('stream'):
+                streaming = True
+                return _AdmittedStream(response, self.admission)
+            QueryTimer.record_usage(response.usage)
+            return response
+        finally:
+            if not streaming:
+                self.admission.release()
+
+    async def acomplete(self, messages: List[Dict[str, str]], **kwargs: Any):
+        """
+        Create a chat completion with the configured deployment, without blocking
+        the event loop.
+
+        Args:
+            messages: Chat messages to send
+            **kwargs: Additional completion parameters (temperature, max_tokens, ...)
+
+        Returns:
+            ChatCompletion: The completion response
+
+        Raises:
+            LLMOverloadedError: If the call is not admitted or stays rate limited
+        """
+        await self.admission.aacquire()
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self.admission.reserve_token())
+                try:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.deployment,
+                        messages=messages,
+                        **kwargs
+                    )
+                    QueryTimer.record_usage(response.usage)
+                    return response
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        finally:
+            self.admission.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Admission, retry and rate limiting counters of this process"""
+        with self._stats_lock:
+            return {
+                **self.admission.stats(),
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+            }
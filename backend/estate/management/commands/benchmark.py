@@ -0,0 +1,227 @@
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from common.service_provider import ServiceProvider
+from estate.benchmark import StubLLMClient, SyntheticListingGenerator
+from estate.constants import CITY_TYPE, ESTATE_TYPE
+from estate.llm_client import LLMClient
+from estate.semantic_index import SemanticIndex
+from estate.service import EstateService
+from estate.text_analyzer import TextAnalyzer
+from estate.types_registry import TypesRegistry
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark uploads, text analysis and queries offline. Runs against a '
+        'throwaway test database with synthetic listings and a local LLM stub, '
+        'and writes the results as JSON to compare runs across commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=10000,
+            help='Listings in the synthetic upload (default: 10000)')
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Queries sent to /estate/query (default: 200)')
+        parser.add_argument(
+            '--llm-latency', type=float, default=0.0,
+            help='Seconds the LLM stub waits per call, to model the network (default: 0)')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the synthetic data and queries (default: 0)')
+        parser.add_argument(
+            '--trace-memory', action='store_true',
+            help='Also measure the peak Python allocations of each phase with '
+                 'tracemalloc, in a separate slower pass')
+        parser.add_argument(
+            '--output',
+            help='File receiving the JSON results (default: standard output only)')
+
+    @staticmethod
+    def _git_commit() -> str:
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def _percentile(sorted_values: list, percentile: float) -> float:
+        """Nearest-rank percentile of sorted values"""
+        index = max(0, min(len(sorted_values) - 1,
+                           int(round(percentile / 100 * len(sorted_values) + 0.5)) - 1))
+        return sorted_values[index]
+
+    @staticmethod
+    def _peak_rss_mb() -> float:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+    def _benchmark_upload(self, csv_path: str, rows: int) -> dict:
+        estate_service = ServiceProvider.get_service(EstateService)
+        started_at = time.perf_counter()
+        with open(csv_path, 'rb') as csv_file:
+            result = estate_service.process_estate_upload(csv_file, truncate=True)
+        seconds = time.perf_counter() - started_at
+
+        return {
+            'rows': rows,
+            'successful_rows': result['successful_records'],
+            'failed_rows': result['failed_records'],
+            'seconds': round(seconds, 4),
+            'rows_per_second': round(rows / seconds, 1),
+        }
+
+    def _benchmark_text_analyzer(self, csv_path: str) -> dict:
+        df = pd.read_csv(csv_path, usecols=['title', 'description'])
+        texts = (df['title'] + ' ' + df['description']).tolist()
+        types_registry = ServiceProvider.get_service(TypesRegistry)
+        patterns = [list(types_registry.value_ids(CITY_TYPE)),
+                    list(types_registry.value_ids(ESTATE_TYPE))]
+
+        started_at = time.perf_counter()
+        for pattern_list in patterns:
+            TextAnalyzer.findMostFrequentPatterns(texts, pattern_list)
+        seconds = time.perf_counter() - started_at
+
+        # Same work through the process pool used by uploads, workers started beforehand
+        text_inference = ServiceProvider.get_service(EstateService).text_inference
+        text_inference.infer(texts[:text_inference.min_texts], patterns)
+        started_at = time.perf_counter()
+        text_inference.infer(texts, patterns)
+        pool_seconds = time.perf_counter() - started_at
+
+        analyzed = len(texts) * len(patterns)
+        return {
+            'texts': analyzed,
+            'seconds': round(seconds, 4),
+            'texts_per_second': round(analyzed / seconds, 1),
+            'workers': text_inference.workers,
+            'pool_seconds': round(pool_seconds, 4),
+            'pool_texts_per_second': round(analyzed / pool_seconds, 1),
+        }
+
+    def _benchmark_queries(self, queries: list) -> dict:
+        client = Client()
+        latencies = []
+        failures = 0
+
+        for query in queries:
+            started_at = time.perf_counter()
+            response = client.post('/estate/query', json.dumps({'query': query}),
+                                   content_type='application/json')
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+        latencies.sort()
+        return {
+            'queries': len(queries),
+            'failures': failures,
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(self._percentile(latencies, 50), 3),
+            'p95_ms': round(self._percentile(latencies, 95), 3),
+            'p99_ms': round(self._percentile(latencies, 99), 3),
+        }
+
+    def _trace_memory(self, phase, *args) -> float:
+        """Peak Python allocations of a phase, in MB"""
+        tracemalloc.start()
+        try:
+            phase(*args)
+            return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        finally:
+            tracemalloc.stop()
+
+    def handle(self, *args, **options):
+        generator = SyntheticListingGenerator(options['seed'])
+        queries = generator.queries(options['queries'])
+
+        # Keep one JSON line per query off the console
+        query_logger = logging.getLogger('estate.query')
+        query_logger_disabled = query_logger.disabled
+        query_logger.disabled = True
+
+        # DEBUG would record every SQL query, skewing time and memory
+        setup_test_environment(debug=False)
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        directory = tempfile.TemporaryDirectory()
+        ServiceProvider.clear_services()
+        ServiceProvider.register_service(LLMClient, StubLLMClient(options['llm_latency']))
+        # Keep the semantic index of the test database away from the real one
+        ServiceProvider.register_service(
+            SemanticIndex, SemanticIndex(os.path.join(directory.name, 'semantic_index')))
+
+        try:
+            ServiceProvider.get_service(EstateService).initTypes()
+
+            csv_path = os.path.join(directory.name, 'listings.csv')
+            generator.write(csv_path, options['rows'])
+
+            results = {
+                'upload': self._benchmark_upload(csv_path, options['rows']),
+                'text_analyzer': self._benchmark_text_analyzer(csv_path),
+                'query': self._benchmark_queries(queries),
+            }
+            memory = {'peak_rss_mb': round(self._peak_rss_mb(), 1)}
+
+            if options['trace_memory']:
+                memory['upload_peak_mb'] = self._trace_memory(
+                    self._benchmark_upload, csv_path, options['rows'])
+                memory['text_analyzer_peak_mb'] = self._trace_memory(
+                    self._benchmark_text_analyzer, csv_path)
+                memory['query_peak_mb'] = self._trace_memory(
+                    self._benchmark_queries, queries)
+            results['memory'] = memory
+        finally:
+            ServiceProvider.clear_services()
+            directory.cleanup()
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+            query_logger.disabled = query_logger_disabled
+
+        report = {
+            'git_commit': self._git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'parameters': {
+                'rows': options['rows'],
+                'queries': options['queries'],
+                'llm_latency': options['llm_latency'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
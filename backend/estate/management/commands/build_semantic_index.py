@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from common.service_provider import ServiceProvider
+from estate.models import Estate
+from estate.semantic_index import SemanticIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the semantic index from the estates in the database. Needed once '
+        'for estates imported before the index existed, after changing '
+        'ESTATE_SEMANTIC_INDEX_DIM, or to drop the rows of deleted estates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Estates indexed at a time (default: 2000)')
+
+    def handle(self, *args, **options):
+        semantic_index = ServiceProvider.get_service(SemanticIndex)
+        semantic_index.clear()
+
+        batch_size = options['batch_size']
+        documents = Estate.objects.order_by('id').values_list(
+            'id', 'title', 'description').iterator(chunk_size=batch_size)
+
+        batch = []
+        indexed = 0
+        for estate_id, title, description in documents:
+            batch.append((estate_id, f'{title} {description}'))
+            if len(batch) == batch_size:
+                indexed += semantic_index.add(batch)
+                batch = []
+        indexed += semantic_index.add(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} estates in {semantic_index.directory}'))
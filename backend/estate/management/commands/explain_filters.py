@@ -0,0 +1,97 @@
+from collections import Counter
+import json
+import re
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from estate.models import Estate
+
+
+class Command(BaseCommand):
+    help = (
+        'Report which indexes the recorded query mix uses. Reads the filters logged '
+        'to ESTATE_FILTER_LOG, groups them by shape and runs EXPLAIN on the query '
+        'issued for each shape.'
+    )
+
+    # Index names in SQLite and PostgreSQL query plans
+    INDEX_PATTERNS = [
+        re.compile(r'USING (?:COVERING )?INDEX (\w+)'),
+        re.compile(r'USING INTEGER PRIMARY KEY'),
+        re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\w+)'),
+        re.compile(r'Bitmap Index Scan on (\w+)'),
+    ]
+    # Full table scans in SQLite and PostgreSQL query plans
+    SCAN_PATTERNS = [
+        re.compile(r'\bSCAN (?:TABLE )?estate_estate\b(?! USING)'),
+        re.compile(r'Seq Scan on estate_estate'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', default=settings.ESTATE_FILTER_LOG,
+            help='Filter log to read (defaults to ESTATE_FILTER_LOG)')
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Print the full query plan of every shape')
+
+    def _read_filters(self, path: str) -> list[dict]:
+        try:
+            with open(path) as log:
+                return [json.loads(line) for line in log if line.strip()]
+        except OSError as e:
+            raise CommandError(f'Cannot read filter log {path}: {e}')
+        except json.JSONDecodeError as e:
+            raise CommandError(f'Invalid filter log {path}: {e}')
+
+    def _indexes_used(self, plan: str) -> list[str]:
+        indexes = []
+        for pattern in self.INDEX_PATTERNS:
+            for match in pattern.finditer(plan):
+                name = match.group(1) if match.groups() else 'primary key'
+                if name not in indexes:
+                    indexes.append(name)
+        return indexes
+
+    def handle(self, *args, **options):
+        path = options['log']
+        if not path:
+            raise CommandError(
+                'No filter log configured, set ESTATE_FILTER_LOG or pass --log')
+
+        recorded_filters = self._read_filters(path)
+        if not recorded_filters:
+            self.stdout.write('The filter log is empty')
+            return
+
+        # Group filters by shape, keeping the latest filters of each shape
+        shapes = Counter()
+        examples = {}
+        for filters in recorded_filters:
+            shape = tuple(sorted(filters))
+            shapes[shape] += 1
+            examples[shape] = filters
+
+        full_scans = 0
+        for shape, count in shapes.most_common():
+            # The query issued by EstateSampler for these filters
+            queryset = Estate.objects.filter(
+                **examples[shape]).values_list('id', flat=True)
+            plan = queryset.explain()
+
+            indexes = self._indexes_used(plan)
+            full_scan = any(pattern.search(plan) for pattern in self.SCAN_PATTERNS)
+            if full_scan:
+                full_scans += count
+
+            share = count / len(recorded_filters)
+            status = self.style.ERROR('FULL SCAN') if full_scan and not indexes \
+                else ', '.join(indexes + (['full scan'] if full_scan else []))
+            self.stdout.write(f'{count:>7} ({share:6.1%})  {", ".join(shape)}  ->  {status}')
+
+            if options['verbose_plans']:
+                self.stdout.write(f'    {plan}')
+
+        self.stdout.write(
+            f'\n{len(recorded_filters)} queries, {len(shapes)} filter shapes, '
+            f'{full_scans / len(recorded_filters):.1%} of queries scan the full table')
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.service_provider import ServiceProvider
+from estate.models import UploadJob
+from estate.upload_jobs import UploadJobQueue
+
+
+class Command(BaseCommand):
+    help = (
+        'Process the CSV uploads queued through /estate/upload/jobs, one at a time. '
+        'Run as many workers as uploads should be processed in parallel.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling it')
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.ESTATE_UPLOAD_JOB_POLL_INTERVAL,
+            help='Seconds between polls of an empty queue (defaults to ESTATE_UPLOAD_JOB_POLL_INTERVAL)')
+
+    def handle(self, *args, **options):
+        queue = ServiceProvider.get_service(UploadJobQueue)
+
+        while True:
+            failed = queue.fail_stale()
+            if failed:
+                self.stderr.write(f'Marked {failed} abandoned job(s) as failed')
+
+            job = queue.claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Processing job {job.id} ({job.file_name})')
+            job = queue.run(job)
+            if job.status == UploadJob.SUCCEEDED:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Job {job.id}: {job.successful_rows} of {job.processed_rows} rows imported'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Job {job.id} failed: {job.error}'))
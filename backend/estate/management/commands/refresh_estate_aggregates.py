@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from common.service_provider import ServiceProvider
+from estate.estate_aggregates import EstateAggregates
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the estate aggregates (counts, price and size statistics per '
+        'city, type and bedrooms) from the estates in the database. Needed once '
+        'for estates imported before the aggregates existed.'
+    )
+
+    def handle(self, *args, **options):
+        rows = ServiceProvider.get_service(EstateAggregates).refresh()
+        self.stdout.write(self.style.SUCCESS(f'Computed {rows} aggregates'))
@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+import threading
+
+
+class Histogram:
+    """
+    Thread-safe histogram of observed values with fixed bucket upper bounds,
+    in the style of Prometheus histograms.
+    """
+
+    # Seconds, from fast cache hits to slow LLM completions
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Last count is for values above the largest bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the state of the histogram.
+
+        Returns:
+            dict: count, sum, and cumulative counts of values lower or equal
+                to each bucket bound (`buckets`, the last one being '+Inf')
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+
+        return {
+            'count': running,
+            'sum': total,
+            'buckets': dict(zip([*map(str, self.buckets), '+Inf'], cumulative)),
+        }
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket holding it"""
+        snapshot = self.snapshot()
+        if not snapshot['count']:
+            return None
+
+        rank = q * snapshot['count']
+        for bound, cumulative in snapshot['buckets'].items():
+            if cumulative >= rank:
+                return float(bound)
+        return float('inf')
+
+
+class HistogramSet:
+    """Histograms created on first use, keyed by name"""
+
+    def __init__(self, buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+
+    def get(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, name: str, value: float) -> None:
+        self.get(name).observe(value)
+
+    def names(self) -> Iterable[str]:
+        with self._lock:
+            return list(self._histograms)
+
+
+class Counter:
+    """Thread-safe monotonic counters keyed by label values"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+
+class QueryMetrics:
+    """
+    Aggregated metrics of the query pipeline of this process: a histogram of
+    the duration of each stage (and of the whole query, 'total'), and counters
+    of queries by outcome, errors by category, filter sources and LLM tokens.
+    Filled by QueryTimer, obtain it through the ServiceProvider.
+    """
+
+    def __init__(self):
+        self.stages = HistogramSet()
+        # Labels: 'success' or 'error'
+        self.queries = Counter()
+        # Labels: error category (see RealEstateQueryProcessor.error_category)
+        self.errors = Counter()
+        # Labels: 'rules', 'llm' or 'cache'
+        self.filter_sources = Counter()
+        # Labels: 'prompt' or 'completion'
+        self.tokens = Counter()
+        self.rows_scanned = Counter()
+
+    def observe(self, durations: Dict[str, float], success: bool = True,
+                error: Optional[str] = None, filters_source: Optional[str] = None,
+                tokens: Optional[Dict[str, int]] = None, rows_scanned: int = 0) -> None:
+        """
+        Record one query.
+
+        Args:
+            durations: Seconds spent in each stage
+            success: Whether the query succeeded
+            error: Error category of a failed query
+            filters_source: Where the filters of the query came from
+            tokens: Prompt and completion tokens used by the query
+            rows_scanned: Database rows read by the query
+        """
+        for stage, duration in durations.items():
+            self.stages.observe(stage, duration)
+
+        self.queries.inc('success' if success else 'error')
+        if error is not None:
+            self.errors.inc(error)
+        if filters_source is not None:
+            self.filter_sources.inc(filters_source)
+        for kind in ('prompt', 'completion'):
+            if tokens and tokens.get(kind):
+                self.tokens.inc(kind, amount=tokens[kind])
+        if rows_scanned:
+            self.rows_scanned.inc(amount=rows_scanned)
+
+    def stats(self) -> Dict[str, Any]:
+        """Count, average and estimated p50/p95/p99 durations of each stage, in seconds"""
+        stats = {}
+        for stage in self.stages.names():
+            histogram = self.stages.get(stage)
+            snapshot = histogram.snapshot()
+            stats[stage] = {
+                'count': snapshot['count'],
+                'average': snapshot['sum'] / snapshot['count'] if snapshot['count'] else None,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99),
+                'buckets': snapshot['buckets'],
+            }
+        return stats
+
+
+class HttpMetrics:
+    """
+    Request counters and latency histograms of the estate endpoints of this
+    process, filled by RequestMetricsMiddleware.
+    """
+
+    def __init__(self):
+        # Labels: view name, method, status code
+        self.requests = Counter()
+        # Keyed by view name
+        self.durations = HistogramSet()
+
+    def observe(self, view: str, method: str, status: int, duration: float) -> None:
+        self.requests.inc(view, method, str(status))
+        self.durations.observe(view, duration)
+
+
+class UploadMetrics:
+    """Counters of the CSV uploads of this process, to follow ingestion throughput"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        # Labels: 'successful' or 'failed'
+        self.rows = Counter()
+        self.seconds = 0.0
+        self.last_rows_per_second: Optional[float] = None
+
+    def observe(self, successful_rows: int, failed_rows: int, duration: float) -> None:
+        """
+        Record one upload.
+
+        Args:
+            successful_rows: Rows saved
+            failed_rows: Rows rejected
+            duration: Seconds spent processing the upload
+        """
+        self.rows.inc('successful', amount=successful_rows)
+        self.rows.inc('failed', amount=failed_rows)
+        with self._lock:
+            self.uploads += 1
+            self.seconds += duration
+            if duration > 0:
+                self.last_rows_per_second = (successful_rows + failed_rows) / duration
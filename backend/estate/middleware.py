@@ -0,0 +1,47 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+import time
+
+from common.service_provider import ServiceProvider
+from .metrics import HttpMetrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the count and latency of the requests to the estate endpoints in
+    HttpMetrics, by view name. Works with both WSGI and ASGI servers.
+
+    Latencies of streamed responses stop when streaming starts.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.metrics = ServiceProvider.get_service(HttpMetrics)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, started_at: float) -> None:
+        match = request.resolver_match
+        # Only requests routed to the views of this app
+        if match is None or not match.func.__module__.startswith('estate.'):
+            return
+        self.metrics.observe(
+            match.url_name, request.method, response.status_code,
+            time.perf_counter() - started_at)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, started_at)
+        return response
+
+    async def __acall__(self, request):
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, started_at)
+        return response
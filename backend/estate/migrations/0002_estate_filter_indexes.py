@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estate', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['price'], name='estate_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['size'], name='estate_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['created_at'], name='estate_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['city', 'type', 'bedrooms', 'price'], name='estate_city_type_bed_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['type', 'bedrooms', 'price'], name='estate_type_bed_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estate',
+            index=models.Index(fields=['city', 'price'], name='estate_city_price_idx'),
+        ),
+    ]
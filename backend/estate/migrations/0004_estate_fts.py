@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# External content FTS5 index of the title and description of estates, kept in
+# step with estate_estate by triggers. SQLite only: other databases fall back
+# to LIKE scans (see estate/keyword_search.py).
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE estate_estate_fts USING fts5(
+        title, description,
+        content='estate_estate', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER estate_estate_fts_insert AFTER INSERT ON estate_estate BEGIN
+        INSERT INTO estate_estate_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER estate_estate_fts_delete AFTER DELETE ON estate_estate BEGIN
+        INSERT INTO estate_estate_fts(estate_estate_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER estate_estate_fts_update AFTER UPDATE OF title, description ON estate_estate BEGIN
+        INSERT INTO estate_estate_fts(estate_estate_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO estate_estate_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    # Index the estates imported before this migration
+    "INSERT INTO estate_estate_fts(estate_estate_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS estate_estate_fts_update',
+    'DROP TRIGGER IF EXISTS estate_estate_fts_delete',
+    'DROP TRIGGER IF EXISTS estate_estate_fts_insert',
+    'DROP TABLE IF EXISTS estate_estate_fts',
+]
+
+
+def _run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estate', '0003_uploadjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_on_sqlite(CREATE_SQL), _run_on_sqlite(DROP_SQL)),
+    ]
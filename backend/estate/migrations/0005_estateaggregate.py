@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:06
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estate', '0004_estate_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstateAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField()),
+                ('min_price', models.IntegerField()),
+                ('median_price', models.FloatField()),
+                ('max_price', models.IntegerField()),
+                ('min_size', models.IntegerField()),
+                ('median_size', models.FloatField()),
+                ('max_size', models.IntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bedrooms', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='estate.types')),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='estate.types')),
+                ('type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='estate.types')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('city', 0), django.db.models.functions.comparison.Coalesce('type', 0), django.db.models.functions.comparison.Coalesce('bedrooms', 0), name='unique estate aggregate group')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 
 
 class Types(models.Model):
@@ -33,3 +34,91 @@ class Estate(models.Model):
         Types, on_delete=models.SET_NULL, null=True, related_name='city', blank=True)
     category = models.ForeignKey(
         Types, on_delete=models.SET_NULL, null=True, related_name='estate_category', blank=True)
+
+    class Meta:
+        indexes = [
+            # Range filters
+            models.Index(fields=['price'], name='estate_price_idx'),
+            models.Index(fields=['size'], name='estate_size_idx'),
+            models.Index(fields=['created_at'], name='estate_created_at_idx'),
+            # Filter shapes most often extracted from chat queries,
+            # enum equalities first and the price range last
+            models.Index(fields=['city', 'type', 'bedrooms', 'price'],
+                         name='estate_city_type_bed_price_idx'),
+            models.Index(fields=['type', 'bedrooms', 'price'],
+                         name='estate_type_bed_price_idx'),
+            models.Index(fields=['city', 'price'],
+                         name='estate_city_price_idx'),
+        ]
+
+
+class UploadJob(models.Model):
+    """CSV upload processed in the background by the process_upload_jobs command"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    file_name = models.CharField(max_length=255)
+    # Copy of the uploaded file, removed once the job has run
+    file_path = models.CharField(max_length=1024)
+    truncate = models.BooleanField(default=False)
+    processed_rows = models.IntegerField(default=0)
+    successful_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    # First error messages so far (see ESTATE_UPLOAD_MAX_ERRORS)
+    errors = models.JSONField(default=list)
+    # Response of process_estate_upload, once succeeded
+    result = models.JSONField(null=True, blank=True)
+    # Reason of the failure of the whole job
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Oldest pending job first
+            models.Index(fields=['status', 'created_at'], name='uploadjob_status_created_idx'),
+        ]
+
+
+class EstateAggregate(models.Model):
+    """
+    Statistics of the estates of one city, type and bedrooms group, maintained
+    by EstateAggregates. A null key stands for all values of that field: the
+    row with only `city` set covers every estate of the city.
+    """
+
+    city = models.ForeignKey(
+        Types, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    type = models.ForeignKey(
+        Types, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    bedrooms = models.ForeignKey(
+        Types, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    count = models.IntegerField()
+    min_price = models.IntegerField()
+    median_price = models.FloatField()
+    max_price = models.IntegerField()
+    min_size = models.IntegerField()
+    median_size = models.FloatField()
+    max_size = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Coalesced, as NULLs are distinct in unique constraints and every
+            # rollup row has a null key; Types ids start at 1
+            models.UniqueConstraint(
+                Coalesce('city', 0), Coalesce('type', 0), Coalesce('bedrooms', 0),
+                name='unique estate aggregate group')
+        ]
@@ -0,0 +1,182 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from common.service_provider import ServiceProvider
+from .estate_sampler import EstateSampler
+from .filter_cache import FilterCache
+from .llm_client import LLMClient
+from .metrics import Counter, HistogramSet, HttpMetrics, QueryMetrics, UploadMetrics
+from .upload_jobs import UploadJobQueue
+
+
+class PrometheusExporter:
+    """
+    Renders the metrics of this process in the Prometheus text exposition
+    format (version 0.0.4), served by the /metrics endpoint.
+
+    All values are per process: with several worker processes, each one is
+    scraped (or aggregated) separately.
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    # Keys of LLMClient.stats(), zero until the client is created
+    LLM_STATS = ('in_flight', 'queue_depth', 'admitted', 'rejected', 'retries', 'rate_limited')
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _labels(cls, names: Iterable[str], values: Iterable[str]) -> str:
+        pairs = [f'{name}="{cls._escape(value)}"' for name, value in zip(names, values)]
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    @staticmethod
+    def _number(value: float) -> str:
+        if value == float('inf'):
+            return '+Inf'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def _header(self, name: str, kind: str, help_text: str) -> None:
+        self._lines.append(f'# HELP {name} {help_text}')
+        self._lines.append(f'# TYPE {name} {kind}')
+
+    def _sample(self, name: str, value: float,
+                label_names: Tuple[str, ...] = (), label_values: Tuple[str, ...] = ()) -> None:
+        self._lines.append(f'{name}{self._labels(label_names, label_values)} {self._number(value)}')
+
+    def gauge(self, name: str, help_text: str, value: Optional[float]) -> None:
+        if value is None:
+            return
+        self._header(name, 'gauge', help_text)
+        self._sample(name, value)
+
+    def counter(self, name: str, help_text: str, counter: Counter,
+                label_names: Tuple[str, ...] = ()) -> None:
+        self._header(name, 'counter', help_text)
+        for labels, value in sorted(counter.values().items()):
+            self._sample(name, value, label_names, labels)
+
+    def counter_value(self, name: str, help_text: str, values: Dict[str, float],
+                      label_name: Optional[str] = None) -> None:
+        """A counter from plain values, keyed by the value of one label (or '' for none)"""
+        self._header(name, 'counter', help_text)
+        for label, value in values.items():
+            if label_name is None:
+                self._sample(name, value)
+            else:
+                self._sample(name, value, (label_name,), (label,))
+
+    def histogram(self, name: str, help_text: str, histograms: HistogramSet,
+                  label_name: str) -> None:
+        self._header(name, 'histogram', help_text)
+        for key in sorted(histograms.names()):
+            snapshot = histograms.get(key).snapshot()
+            for bound, count in snapshot['buckets'].items():
+                self._sample(f'{name}_bucket', count, (label_name, 'le'), (key, bound))
+            self._sample(f'{name}_sum', snapshot['sum'], (label_name,), (key,))
+            self._sample(f'{name}_count', snapshot['count'], (label_name,), (key,))
+
+    def render(self) -> str:
+        """
+        Collect the metrics of the estate services.
+
+        Returns:
+            str: Metrics in the Prometheus text format
+        """
+        self._lines = []
+
+        http_metrics = ServiceProvider.get_service(HttpMetrics)
+        self.counter(
+            'estate_http_requests_total', 'Requests to the estate endpoints.',
+            http_metrics.requests, ('view', 'method', 'status'))
+        self.histogram(
+            'estate_http_request_duration_seconds',
+            'Latency of the estate endpoints (until streaming starts for streamed responses).',
+            http_metrics.durations, 'view')
+
+        query_metrics = ServiceProvider.get_service(QueryMetrics)
+        self.counter(
+            'estate_queries_total', 'Processed natural language queries by outcome.',
+            query_metrics.queries, ('outcome',))
+        self.counter(
+            'estate_query_errors_total',
+            'Failed queries by category (validation, value, overloaded, unexpected).',
+            query_metrics.errors, ('category',))
+        self.histogram(
+            'estate_query_stage_duration_seconds',
+            'Duration of the query pipeline stages, "total" for whole queries.',
+            query_metrics.stages, 'stage')
+        self.counter(
+            'estate_query_filter_source_total',
+            'Queries by source of their filters (rules, llm, cache).',
+            query_metrics.filter_sources, ('source',))
+        self.counter(
+            'estate_llm_tokens_total', 'Tokens used by LLM completions.',
+            query_metrics.tokens, ('kind',))
+        self.counter(
+            'estate_query_rows_scanned_total', 'Database rows read to answer queries.',
+            query_metrics.rows_scanned)
+
+        # Not created here: building the client needs the Azure OpenAI settings
+        llm_client = ServiceProvider.find_service(LLMClient)
+        llm_stats = llm_client.stats() if llm_client is not None else dict.fromkeys(self.LLM_STATS, 0)
+        self.gauge('estate_llm_in_flight', 'LLM calls in flight.', llm_stats['in_flight'])
+        self.gauge('estate_llm_queue_depth', 'Callers waiting for an LLM call slot.',
+                   llm_stats['queue_depth'])
+        self.counter_value('estate_llm_admissions_total', 'LLM calls admitted or rejected.', {
+            'admitted': llm_stats['admitted'],
+            'rejected': llm_stats['rejected'],
+        }, 'result')
+        self.counter_value('estate_llm_retries_total', 'Retried LLM calls.',
+                           {'': llm_stats['retries']})
+        self.counter_value('estate_llm_rate_limited_total', 'LLM calls answered with 429.',
+                           {'': llm_stats['rate_limited']})
+
+        filter_cache_stats = ServiceProvider.get_service(FilterCache).stats()
+        self.counter_value('estate_filter_cache_lookups_total', 'Filter cache lookups.', {
+            'hit': filter_cache_stats['hits'],
+            'miss': filter_cache_stats['misses'],
+        }, 'result')
+        self.gauge('estate_filter_cache_hit_ratio', 'Share of filter cache lookups that hit.',
+                   filter_cache_stats['hit_ratio'])
+
+        sampler = ServiceProvider.get_service(EstateSampler)
+        self.counter_value('estate_sample_cache_lookups_total',
+                           'Lookups of the matching ids cache of the sampler.', {
+                               'hit': sampler.hits,
+                               'miss': sampler.misses,
+                           }, 'result')
+        lookups = sampler.hits + sampler.misses
+        self.gauge('estate_sample_cache_hit_ratio',
+                   'Share of matching ids cache lookups that hit.',
+                   sampler.hits / lookups if lookups else None)
+
+        upload_metrics = ServiceProvider.get_service(UploadMetrics)
+        self.counter_value('estate_uploads_total', 'Processed CSV uploads.',
+                           {'': upload_metrics.uploads})
+        self.counter(
+            'estate_upload_rows_total', 'CSV rows processed by result.',
+            upload_metrics.rows, ('result',))
+        self.counter_value('estate_upload_seconds_total', 'Time spent processing CSV uploads.',
+                           {'': upload_metrics.seconds})
+        self.gauge('estate_upload_rows_per_second', 'Rows per second of the last CSV upload.',
+                   upload_metrics.last_rows_per_second)
+
+        # Background uploads run in worker processes, so they are read from their jobs
+        job_stats = UploadJobQueue.stats()
+        self.counter_value('estate_upload_jobs_total', 'Finished background upload jobs by status.',
+                           job_stats['jobs'], 'status')
+        self.counter_value('estate_upload_job_rows_total',
+                           'CSV rows processed by finished background upload jobs by result.',
+                           job_stats['rows'], 'result')
+        self.counter_value('estate_upload_job_seconds_total',
+                           'Time spent processing finished background upload jobs.',
+                           {'': job_stats['seconds']})
+        self.gauge('estate_upload_job_rows_per_second',
+                   'Rows per second of the last succeeded background upload job.',
+                   job_stats['last_rows_per_second'])
+
+        return '\n'.join(self._lines) + '\n'
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+import json
+import logging
+import threading
+import time
+
+from common.service_provider import ServiceProvider
+from .metrics import QueryMetrics
+
+# One JSON object per query with its stage timings, token usage and rows scanned
+query_logger = logging.getLogger('estate.query')
+
+
+class QueryTimer:
+    """
+    Timings of the stages of one query.
+
+    A processor activates the timer of a query with `activate()`; code running
+    on its behalf (in the same thread, coroutine, or through sync_to_async)
+    records into it with the `measure()`, `record_usage()`, `record_rows_scanned()`
+    and `annotate()` classmethods, which do nothing outside of a timed query.
+    `finish()` logs the timings to the 'estate.query' logger and adds them to
+    the QueryMetrics histograms.
+    """
+
+    _current: ContextVar[Optional['QueryTimer']] = ContextVar('estate_query_timer', default=None)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self.total: Optional[float] = None
+        # Stage -> seconds, summed when a stage runs more than once
+        self.stages: Dict[str, float] = {}
+        self.tokens = {'prompt': 0, 'completion': 0, 'total': 0}
+        self.rows_scanned = 0
+        self.annotations: Dict[str, Any] = {}
+
+    @contextmanager
+    def activate(self) -> Iterator['QueryTimer']:
+        """Make this timer the one recorded into by the current context"""
+        token = self._current.set(self)
+        try:
+            yield self
+        finally:
+            self._current.reset(token)
+
+    @classmethod
+    def current(cls) -> Optional['QueryTimer']:
+        """The timer of the query being processed, None outside of a timed query"""
+        return cls._current.get()
+
+    def add_stage(self, stage: str, duration: float) -> None:
+        """Add the duration (in seconds) of a stage"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    @classmethod
+    @contextmanager
+    def measure(cls, stage: str) -> Iterator[None]:
+        """Time a stage of the current query"""
+        timer = cls.current()
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            if timer is not None:
+                timer.add_stage(stage, time.perf_counter() - started_at)
+
+    @classmethod
+    def record_usage(cls, usage) -> None:
+        """Add the token usage of a completion (its `usage` field) to the current query"""
+        timer = cls.current()
+        if timer is None or usage is None:
+            return
+        with timer._lock:
+            timer.tokens['prompt'] += usage.prompt_tokens or 0
+            timer.tokens['completion'] += usage.completion_tokens or 0
+            timer.tokens['total'] += usage.total_tokens or 0
+
+    @classmethod
+    def record_rows_scanned(cls, rows: int) -> None:
+        """Add rows read from the database to the current query"""
+        timer = cls.current()
+        if timer is not None:
+            with timer._lock:
+                timer.rows_scanned += rows
+
+    @classmethod
+    def annotate(cls, key: str, value: Any) -> None:
+        """Attach a value to the log line of the current query (e.g. the filters source)"""
+        timer = cls.current()
+        if timer is not None:
+            with timer._lock:
+                timer.annotations[key] = value
+
+    def finish(self, success: bool) -> None:
+        """
+        Stop the timer, log the timings and record them in the QueryMetrics histograms.
+
+        Args:
+            success: Whether the query succeeded
+        """
+        with self._lock:
+            if self.total is not None:
+                return
+            self.total = time.perf_counter() - self._started_at
+            stages = dict(self.stages)
+
+        ServiceProvider.get_service(QueryMetrics).observe(
+            {**stages, 'total': self.total},
+            success=success,
+            error=self.annotations.get('error'),
+            filters_source=self.annotations.get('filters_source'),
+            tokens=self.tokens,
+            rows_scanned=self.rows_scanned
+        )
+
+        query_logger.info(json.dumps({
+            'success': success,
+            **self.annotations,
+            'total_ms': round(self.total * 1000, 2),
+            'stages_ms': {stage: round(duration * 1000, 2) for stage, duration in stages.items()},
+            'tokens': self.tokens,
+            'rows_scanned': self.rows_scanned,
+        }))
+
+    def server_timing(self) -> str:
+        """
+        Format the timings as a Server-Timing header value.
+
+        Examples:
+            >>> timer.server_timing()
+            'extract;dur=812.4, validate;dur=0.3, sample;dur=4.1, summary;dur=2210.9, total;dur=3027.9'
+        """
+        with self._lock:
+            entries = [(stage, duration) for stage, duration in self.stages.items()]
+            if self.total is not None:
+                entries.append(('total', self.total))
+        return ', '.join(f'{stage};dur={duration * 1000:.1f}' for stage, duration in entries)
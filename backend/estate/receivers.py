@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from common.service_provider import ServiceProvider
+from .estate_aggregates import EstateAggregates
+from .estate_sampler import EstateSampler
+from .estate_snapshot import EstateSnapshot
+from .models import Estate, Types
+from .semantic_index import SemanticIndex
+from .signals import estates_changed
+from .types_registry import TypesRegistry
+
+
+@receiver([post_save, post_delete], sender=Types)
+def invalidate_types_registry(sender, **kwargs):
+    """Drop the cached Types table whenever a type is created, updated or deleted"""
+    ServiceProvider.get_service(TypesRegistry).invalidate()
+
+
+# Estate post_delete is deliberately not handled: connecting it would make
+# truncating uploads fetch every estate to send the signal
+@receiver(post_save, sender=Estate)
+@receiver(estates_changed)
+def invalidate_estate_sampler(sender, **kwargs):
+    """Drop the cached sampling id lists whenever estates change"""
+    ServiceProvider.get_service(EstateSampler).invalidate()
+
+
+@receiver(post_save, sender=Estate)
+def invalidate_estate_snapshot(sender, **kwargs):
+    """Rebuild the in-memory estate snapshot before its next use, the estate may be an update"""
+    ServiceProvider.get_service(EstateSnapshot).invalidate()
+
+
+@receiver(estates_changed)
+def update_estate_snapshot(sender, created=None, truncated=False, **kwargs):
+    """Append estates written in bulk to the in-memory snapshot, empty it when all were deleted"""
+    snapshot = ServiceProvider.get_service(EstateSnapshot)
+    if truncated:
+        snapshot.clear()
+    if created:
+        snapshot.add_estates(created)
+
+
+@receiver(post_save, sender=Estate)
+def index_saved_estate(sender, instance, **kwargs):
+    """Index the text of a created or updated estate"""
+    ServiceProvider.get_service(SemanticIndex).add_estates([instance])
+
+
+@receiver(estates_changed)
+def update_semantic_index(sender, created=None, truncated=False, **kwargs):
+    """Index the text of estates written in bulk, clear the index when all were deleted"""
+    semantic_index = ServiceProvider.get_service(SemanticIndex)
+    if truncated:
+        semantic_index.clear()
+    if created:
+        semantic_index.add_estates(created)
+
+
+@receiver(pre_save, sender=Estate)
+def mark_previous_estate_aggregates(sender, instance, raw=False, **kwargs):
+    """Mark the aggregates of the group an updated estate is leaving for refresh"""
+    if raw or instance.pk is None:
+        return
+    previous = Estate.objects.filter(pk=instance.pk).only('city', 'type', 'bedrooms').first()
+    if previous is not None:
+        ServiceProvider.get_service(EstateAggregates).mark([previous])
+
+
+@receiver(post_save, sender=Estate)
+def refresh_estate_aggregates(sender, instance, **kwargs):
+    """Refresh the aggregates of the group of a saved estate once its transaction commits"""
+    estate_aggregates = ServiceProvider.get_service(EstateAggregates)
+    estate_aggregates.mark([instance])
+    transaction.on_commit(estate_aggregates.refresh_pending, robust=True)
+
+
+@receiver(estates_changed)
+def mark_estate_aggregates_in_bulk(sender, created=None, truncated=False, **kwargs):
+    """Mark the aggregates of estates written in bulk for refresh, all of them after a truncation"""
+    estate_aggregates = ServiceProvider.get_service(EstateAggregates)
+    if truncated:
+        estate_aggregates.mark_all()
+    if created:
+        estate_aggregates.mark(created)
@@ -0,0 +1,211 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import re
+
+from common.service_provider import ServiceProvider
+from .constants import *
+from .filter_cache import FilterCache
+from .types_registry import TypesRegistry
+
+
+class RuleBasedFilterExtractor:
+    """
+    Deterministic filter extraction for simple queries.
+
+    Recognizes cities and estate types from the Types table plus patterns for
+    bedrooms, bathrooms, furnishing, verification, price and size ranges, and
+    produces the same filter dictionary shape as the LLM extraction.
+
+    The confidence of an extraction is the share of query words accounted for,
+    either by a recognized filter or by a filler word ('find', 'me', 'in', ...).
+    Queries with words the rules do not understand (e.g. 'sea view'), with
+    conflicting mentions (two cities) or with values missing from the Types
+    table (e.g. '0 bedroom') get a low confidence and are left to the LLM.
+    """
+
+    # Words carrying no filter information
+    FILLER_WORDS = {
+        'a', 'an', 'the', 'in', 'at', 'on', 'of', 'to', 'for', 'with', 'and', 'or',
+        'find', 'show', 'search', 'searching', 'get', 'give', 'list', 'me', 'i', 'im',
+        'am', 'looking', 'look', 'want', 'need', 'would', 'like', 'please', 'some',
+        'any', 'all', 'there', 'is', 'are', 'that', 'which', 'located', 'available',
+        'property', 'properties', 'listing', 'listings', 'home', 'homes', 'sale', 'buy',
+        'price', 'priced', 'cost', 'costing', 'costs', 'budget', 'aed', 'dirham',
+        'dirhams', 'size', 'sized', 'than', 'can', 'you', 'my', 'city', 'area',
+    }
+
+    MAX_ROOMS = 7
+    # Filters whose recognized values are looked up in the Types table
+    ROOM_AND_FURNISHING_KEYS = ('bedrooms', 'bathrooms', 'furnished')
+
+    BEDROOMS_PATTERN = re.compile(
+        r'\b(\d+)\s*(?:bed|beds|bedroom|bedrooms|bdr|bdrm|bdrms|br|bhk)\b')
+    STUDIO_PATTERN = re.compile(r'\bstudios?\b')
+    BATHROOMS_PATTERN = re.compile(
+        r'\b(\d+)\s*(?:bath|baths|bathroom|bathrooms|ba)\b')
+    FURNISHED_PATTERNS = [
+        (re.compile(r'\b(?:un|not|non)\s?furnished\b'), 'NO'),
+        (re.compile(r'\b(?:semi|partly|partially)\s?furnished\b'), 'PARTLY'),
+        (re.compile(r'\b(?:fully\s)?furnished\b'), 'YES'),
+    ]
+    VERIFIED_PATTERNS = [
+        (re.compile(r'\b(?:un|not|non)\s?verified\b'), False),
+        (re.compile(r'\bverified\b'), True),
+    ]
+
+    LESS_THAN = r'(?:under|below|less|cheaper|up to|max|maximum|at most|within|smaller)'
+    GREATER_THAN = r'(?:over|above|more|greater|at least|min|minimum|from|starting|bigger|larger)'
+    SIZE_UNIT = r'(?:sqft|sq ft|square feet|square foot|sq feet)'
+    BETWEEN_SIZE_PATTERN = re.compile(
+        rf'\bbetween\s+(\d+)\s*(?:{SIZE_UNIT}\s*)?and\s+(\d+)\s*{SIZE_UNIT}')
+    BETWEEN_PRICE_PATTERN = re.compile(r'\bbetween\s+(\d+)\s+and\s+(\d+)\b')
+    SIZE_RANGE_PATTERNS = [
+        (re.compile(rf'\b{LESS_THAN}\s+(?:than\s+)?(\d+)\s*{SIZE_UNIT}'), 'size__lt'),
+        (re.compile(rf'\b{GREATER_THAN}\s+(?:than\s+)?(\d+)\s*{SIZE_UNIT}'), 'size__gt'),
+    ]
+    PRICE_RANGE_PATTERNS = [
+        (re.compile(rf'\b{LESS_THAN}\s+(?:than\s+)?(?:aed\s+)?(\d+)\b'), 'price__lt'),
+        (re.compile(rf'\b{GREATER_THAN}\s+(?:than\s+)?(?:aed\s+)?(\d+)\b'), 'price__gt'),
+    ]
+
+    def __init__(self):
+        self.types_registry = ServiceProvider.get_service(TypesRegistry)
+
+    def _normalized_value_ids(self, type_name: str) -> Dict[str, int]:
+        """Map the values of a type name, normalized like queries, to their ids"""
+        return {FilterCache.normalize_query(value): type_id
+                for value, type_id in self.types_registry.value_ids(type_name).items()}
+
+    def _room_type_id(self, type_name: str, count: int) -> Optional[int]:
+        """Get the id of a bedrooms/bathrooms value, counts above the maximum map to '7+'"""
+        value = f'{self.MAX_ROOMS}+' if count > self.MAX_ROOMS else str(count)
+        return self.types_registry.get_id(type_name, value)
+
+    def _match_types(self, text: str, type_name: str,
+                     spans: List[Tuple[int, int]]) -> Tuple[Optional[int], bool]:
+        """
+        Find the value of a type name mentioned in the text.
+
+        Returns:
+            tuple: (type id or None, True if several different values are mentioned)
+        """
+        value_ids = self._normalized_value_ids(type_name)
+        if not value_ids:
+            return None, False
+
+        # Longest values first, so 'dibba al fujairah' is not read as 'fujairah'
+        values = sorted(value_ids, key=len, reverse=True)
+        pattern = re.compile(
+            r'\b(' + '|'.join(re.escape(value) for value in values) + r')(?:s|es)?\b')
+
+        found_ids = set()
+        for match in pattern.finditer(text):
+            found_ids.add(value_ids[match.group(1)])
+            spans.append(match.span())
+
+        if len(found_ids) == 1:
+            return found_ids.pop(), False
+        return None, len(found_ids) > 1
+
+    def extract(self, query: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Extract filters from a natural language query without calling the LLM.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            tuple: (filters dictionary accepted by EstateFilterValidator,
+                confidence between 0 and 1)
+
+        Examples:
+            >>> extractor.extract("2 bed apartment in Sharjah under 900k")
+            ({'bedrooms': 11, 'type': 38, 'city': 24, 'price__lt': 900000}, 1.0)
+        """
+        text = FilterCache.normalize_query(query)
+        filters = {}
+        spans = []
+
+        match = self.BEDROOMS_PATTERN.search(text)
+        if match:
+            filters['bedrooms'] = self._room_type_id(BEDROOM_TYPE, int(match.group(1)))
+            spans.append(match.span())
+        elif (match := self.STUDIO_PATTERN.search(text)):
+            filters['bedrooms'] = self.types_registry.get_id(BEDROOM_TYPE, 'studio')
+            spans.append(match.span())
+
+        match = self.BATHROOMS_PATTERN.search(text)
+        if match:
+            filters['bathrooms'] = self._room_type_id(BATHROOM_TYPE, int(match.group(1)))
+            spans.append(match.span())
+
+        for pattern, value in self.FURNISHED_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                filters['furnished'] = self.types_registry.get_id(FURNISHED_TYPE, value)
+                spans.append(match.span())
+                break
+
+        for pattern, value in self.VERIFIED_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                filters['verified'] = value
+                spans.append(match.span())
+                break
+
+        # Sizes first, so their numbers are not read as prices
+        match = self.BETWEEN_SIZE_PATTERN.search(text)
+        if match:
+            filters['size__gt'], filters['size__lt'] = int(match.group(1)), int(match.group(2))
+            spans.append(match.span())
+        for pattern, key in self.SIZE_RANGE_PATTERNS:
+            match = pattern.search(text)
+            if match and key not in filters:
+                filters[key] = int(match.group(1))
+                spans.append(match.span())
+
+        covered = self._covered(spans)
+        match = self.BETWEEN_PRICE_PATTERN.search(text)
+        if match and not covered(match.span()):
+            filters['price__gt'], filters['price__lt'] = int(match.group(1)), int(match.group(2))
+            spans.append(match.span())
+        for pattern, key in self.PRICE_RANGE_PATTERNS:
+            for match in pattern.finditer(text):
+                if key not in filters and not covered(match.span()):
+                    filters[key] = int(match.group(1))
+                    spans.append(match.span())
+
+        filters['city'], city_conflict = self._match_types(text, CITY_TYPE, spans)
+        filters['type'], type_conflict = self._match_types(text, ESTATE_TYPE, spans)
+        conflicts = city_conflict or type_conflict
+        # Values recognized in the query but without a Types id (e.g. "0 bedroom")
+        # would be dropped below while their words count as understood
+        unresolved = any(filters[key] is None for key in self.ROOM_AND_FURNISHING_KEYS
+                         if key in filters)
+
+        # Drop filters that were not found or whose type value does not exist
+        filters = {key: value for key, value in filters.items() if value is not None}
+
+        if not filters or conflicts or unresolved:
+            return filters, 0.0
+
+        return filters, self._confidence(text, spans)
+
+    @staticmethod
+    def _covered(spans: List[Tuple[int, int]]) -> Callable[[Tuple[int, int]], bool]:
+        """Build a predicate telling whether a span overlaps an already matched span"""
+        def covered(span: Tuple[int, int]) -> bool:
+            return any(span[0] < end and start < span[1] for start, end in spans)
+        return covered
+
+    def _confidence(self, text: str, spans: List[Tuple[int, int]]) -> float:
+        """Share of the words of the text that are matched or filler words"""
+        covered = self._covered(spans)
+        words = list(re.finditer(r'\S+', text))
+        if not words:
+            return 0.0
+
+        understood = sum(
+            1 for word in words
+            if word.group() in self.FILLER_WORDS or covered(word.span())
+        )
+        return understood / len(words)
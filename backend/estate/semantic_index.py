@@ -0,0 +1,336 @@
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .models import Estate
+from .query_timer import QueryTimer
+
+
+class SemanticIndex:
+    """
+    Offline vector index over the title and description of estates, ranking
+    the estates matching a set of filters by relevance to the free text of a
+    query ("sea view", "near metro", "pet friendly").
+
+    Texts are embedded with the hashing trick: words (lightly stemmed, stop
+    words removed) and word bigrams are hashed with CRC32 into a signed vector
+    of `dim` dimensions, weighted by sublinear term frequency and L2 normalized.
+    Queries are weighted by the inverse document frequency of their terms as
+    well, from document frequencies kept in a hashed table, so document vectors
+    never need to be recomputed as the corpus grows.
+
+    Vectors are quantized to int8 rows (with a float32 scale per row) of
+    memory-mapped files under `directory`, appended incrementally as estates are saved (see
+    estate/receivers.py); an updated estate gets a new row which supersedes
+    the old one. Rows of deleted estates stay until the index is cleared or
+    rebuilt (`manage.py build_semantic_index`), which is harmless since only
+    the ids matching the filters of a query are ever ranked.
+
+    Note:
+        - Processes sharing the directory see each other's writes: the index
+          is reloaded whenever the generation in its metadata file changed
+        - Writers serialize on a lock file, so uploads may run in any process
+    """
+
+    # Hashed space of the document frequency table
+    DF_BUCKETS = 1 << 18
+    # Rows scored at a time, bounding the memory of ranking large id sets
+    SCORE_BLOCK = 8192
+
+    STOP_WORDS = frozenset('''
+        a an and are as at be by for from has have i in is it its looking me my need of
+        on or our property properties that the their this to us want we with you your
+    '''.split())
+    TOKEN_PATTERN = re.compile(r'[a-z]+')
+
+    def __init__(self, directory: Optional[str] = None, dim: Optional[int] = None):
+        """
+        Args:
+            directory: Directory of the index files, created when needed
+                (defaults to ESTATE_SEMANTIC_INDEX_DIR)
+            dim: Dimensions of the vectors, used when the index is created
+                (defaults to ESTATE_SEMANTIC_INDEX_DIM)
+        """
+        self.directory = directory or settings.ESTATE_SEMANTIC_INDEX_DIR
+        self.dim = dim or settings.ESTATE_SEMANTIC_INDEX_DIM
+        # An existing index keeps its dimensions until cleared
+        self._configured_dim = self.dim
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(self.directory, 'meta.json')
+        self._vectors_path = os.path.join(self.directory, 'vectors.i8')
+        self._scales_path = os.path.join(self.directory, 'scales.f32')
+        self._ids_path = os.path.join(self.directory, 'ids.i64')
+        self._df_path = os.path.join(self.directory, 'df.i32')
+        self._lock_path = os.path.join(self.directory, 'index.lock')
+
+        # State loaded from the files, see _load()
+        self._generation: Optional[int] = None
+        self._count = 0
+        self._documents = 0
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._df: Optional[np.memmap] = None
+        # Indexed estate ids in ascending order, with the row of their latest vector
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+
+    # Embedding
+
+    @classmethod
+    def _terms(cls, text: str) -> List[str]:
+        words = []
+        for word in cls.TOKEN_PATTERN.findall(text.lower()):
+            if len(word) < 2 or word in cls.STOP_WORDS:
+                continue
+            # Light stemming: 'views' and 'view', 'pets' and 'pet'
+            if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+                word = word[:-1]
+            words.append(word)
+        return words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+    @staticmethod
+    def _hash(term: str) -> int:
+        return zlib.crc32(term.encode())
+
+    def _embed(self, documents: List[Counter], weights: Optional[dict] = None) -> np.ndarray:
+        """
+        Embed the term counts of several texts at once.
+
+        Returns:
+            np.ndarray: L2 normalized float32 vectors, one row per text
+        """
+        rows, hashes, values = [], [], []
+        for row, term_counts in enumerate(documents):
+            for term, count in term_counts.items():
+                rows.append(row)
+                hashes.append(self._hash(term))
+                weight = 1.0 + math.log(count)
+                values.append(weight * weights[term] if weights is not None else weight)
+
+        hashes = np.asarray(hashes, dtype=np.int64)
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        cells = np.asarray(rows, dtype=np.int64) * self.dim + hashes % self.dim
+        vectors = np.bincount(cells, weights=signs * np.asarray(values),
+                              minlength=len(documents) * self.dim)
+        vectors = vectors.reshape(len(documents), self.dim).astype(np.float32)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+    # Storage
+
+    def _lock_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(self._lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _open(self, path: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'ab') as file:
+            if file.tell() < size:
+                file.truncate(size)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _load(self) -> None:
+        """(Re)load the index files when they were written since the last load"""
+        meta = self._read_meta()
+        if meta is None:
+            meta = {'dim': self.dim, 'count': 0, 'documents': 0, 'capacity': 0, 'generation': 0}
+        elif meta['generation'] == self._generation:
+            return
+
+        self.dim = meta['dim']
+        self._count = meta['count']
+        self._documents = meta['documents']
+        self._capacity = meta['capacity']
+        if self._capacity:
+            self._open_rows(self._capacity)
+        else:
+            self._vectors = self._scales = self._ids = None
+        self._df = self._open(self._df_path, np.int32, (self.DF_BUCKETS,)) \
+            if meta['documents'] else None
+
+        self._build_id_map()
+        self._generation = meta['generation']
+
+    def _build_id_map(self) -> None:
+        ids = np.asarray(self._ids[:self._count]) if self._count else np.empty(0, dtype=np.int64)
+        # Reversed so that unique() keeps the latest row of re-indexed estates
+        unique_ids, positions = np.unique(ids[::-1], return_index=True)
+        self._sorted_ids = unique_ids
+        self._sorted_rows = (len(ids) - 1 - positions).astype(np.int64)
+
+    def _save_meta(self) -> None:
+        self._generation = (self._generation or 0) + 1
+        meta = {'dim': self.dim, 'count': self._count, 'documents': self._documents,
+                'capacity': self._capacity, 'generation': self._generation}
+        temporary_path = f'{self._meta_path}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(meta, file)
+        # Atomic, readers never see a partially written file
+        os.replace(temporary_path, self._meta_path)
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the files to hold `rows` more vectors, doubling their capacity"""
+        needed = self._count + rows
+        if needed <= self._capacity:
+            return
+
+        capacity = max(needed, 2 * self._capacity, 1024)
+        self._open_rows(capacity)
+        self._capacity = capacity
+
+    def _open_rows(self, capacity: int) -> None:
+        self._vectors = self._open(self._vectors_path, np.int8, (capacity, self.dim))
+        self._scales = self._open(self._scales_path, np.float32, (capacity,))
+        self._ids = self._open(self._ids_path, np.int64, (capacity,))
+
+    # Writes
+
+    def add(self, documents: Iterable[Tuple[int, str]]) -> int:
+        """
+        Index the texts of estates.
+
+        Args:
+            documents: (estate id, text) pairs
+
+        Returns:
+            int: Number of indexed estates
+        """
+        ids = []
+        term_counts = []
+        for estate_id, text in documents:
+            ids.append(estate_id)
+            term_counts.append(Counter(self._terms(text or '')))
+        if not ids:
+            return 0
+        df_hashes = [self._hash(term) % self.DF_BUCKETS for counts in term_counts for term in counts]
+
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                self._load()
+                self._reserve(len(ids))
+                if self._df is None:
+                    self._df = self._open(self._df_path, np.int32, (self.DF_BUCKETS,))
+
+                # Each row is scaled to use the whole int8 range
+                vectors = self._embed(term_counts)
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                end = self._count + len(ids)
+                self._vectors[self._count:end] = np.rint(vectors / scales[:, None])
+                self._scales[self._count:end] = scales
+                self._ids[self._count:end] = ids
+                np.add.at(self._df, np.asarray(df_hashes, dtype=np.int64), 1)
+
+                for memmap in (self._vectors, self._scales, self._ids, self._df):
+                    memmap.flush()
+                self._count = end
+                self._documents += len(ids)
+                self._save_meta()
+                self._build_id_map()
+            finally:
+                lock_file.close()
+
+        return len(ids)
+
+    def add_estates(self, estates: Iterable[Estate]) -> int:
+        """Index the title and description of estates"""
+        return self.add((estate.id, f'{estate.title} {estate.description}')
+                        for estate in estates if estate.id is not None)
+
+    def clear(self) -> None:
+        """Remove every indexed estate"""
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                self._load()
+                self.dim = self._configured_dim
+                self._vectors = self._scales = self._ids = self._df = None
+                for path in (self._vectors_path, self._scales_path, self._ids_path, self._df_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._count = self._documents = self._capacity = 0
+                self._save_meta()
+                self._build_id_map()
+            finally:
+                lock_file.close()
+
+    # Reads
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._sorted_ids)
+
+    def _query_vector(self, query: str) -> Optional[np.ndarray]:
+        term_counts = Counter(self._terms(query))
+        if not term_counts or self._df is None:
+            return None
+
+        # Smoothed inverse document frequency of each query term
+        weights = {
+            term: math.log((self._documents + 1) /
+                           (int(self._df[self._hash(term) % self.DF_BUCKETS]) + 1)) + 1
+            for term in term_counts
+        }
+        return self._embed([term_counts], weights)[0]
+
+    def top_k(self, query: str, ids: Sequence[int], k: int) -> List[int]:
+        """
+        Rank estates by the cosine similarity of their text to a query.
+
+        Args:
+            query: Free text of the query
+            ids: Ids of the candidate estates
+            k: Number of estates to return
+
+        Returns:
+            list: Ids of up to k candidates with a positive similarity, most
+                similar first. Candidates missing from the index are never returned
+        """
+        with QueryTimer.measure('rank'), self._lock:
+            self._load()
+            query_vector = self._query_vector(query)
+            if query_vector is None or not len(self._sorted_ids) or not k:
+                return []
+
+            candidates = np.asarray(ids, dtype=np.int64)
+            positions = np.searchsorted(self._sorted_ids, candidates)
+            positions[positions == len(self._sorted_ids)] = 0
+            indexed = self._sorted_ids[positions] == candidates
+            candidates = candidates[indexed]
+            rows = self._sorted_rows[positions[indexed]]
+
+            scores = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), self.SCORE_BLOCK):
+                block = rows[start:start + self.SCORE_BLOCK]
+                scores[start:start + len(block)] = \
+                    (self._vectors[block].astype(np.float32) @ query_vector) * self._scales[block]
+
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [int(candidates[index]) for index in best if scores[index] > 0]
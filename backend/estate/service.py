@@ -1,18 +1,70 @@
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Callable, Dict, Any, Iterable, List, Optional
 import pandas as pd
-import re
 import math
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import DatabaseError, models, transaction
 
 from .models import Types, Estate
 from .constants import *
-from .text_analyzer import TextAnalyzer
+from .text_inference_pool import TextInferencePool
 from .estate_filter_validator import EstateFilterValidator
-from common.utils import first
+from .estate_upload_parser import EstateUploadParser
+from .signals import estates_changed
+from .types_registry import TypesRegistry
+from .upload_error_report import UploadErrorReport
 
 
 class EstateService:
+    # Maps upload columns onto the Estate fields they populate
+    UPLOAD_COLUMN_FIELDS = {
+        'displayAddress': 'address',
+        'price': 'price',
+        'verified': 'verified',
+        'priceDuration': 'price_duration',
+        'sizeMin': 'size',
+        'description': 'description',
+        'title': 'title',
+    }
+
+    # Required columns of the upload CSV and their dtypes
+    UPLOAD_COLUMNS = {
+        'displayAddress': str,
+        'bathrooms': str,
+        'bedrooms': str,
+        'price': int,
+        'verified': str,
+        'type': str,
+        'priceDuration': str,
+        'sizeMin': str,
+        'furnishing': str,
+        'description': str,
+        'addedOn': str,
+        'title': str
+    }
+
+    def __init__(self):
+        # Rendered static part of the filters prompt, with the Types fingerprint it was rendered from
+        self._filters_prompt_prefix: tuple[str, str] = None
+        self.text_inference = TextInferencePool(settings.ESTATE_TEXT_INFERENCE_WORKERS,
+                                                settings.ESTATE_TEXT_INFERENCE_MIN_ROWS)
+
+    @property
+    def types_registry(self) -> TypesRegistry:
+        """Cached Types table shared through the ServiceProvider"""
+        # Import here to avoid circular import issues
+        from common.service_provider import ServiceProvider
+        return ServiceProvider.get_service(TypesRegistry)
+
+    @property
+    def estate_aggregates(self) -> 'EstateAggregates':
+        """Materialized statistics of the estates, shared through the ServiceProvider"""
+        # Imported here as well, EstateAggregates records QueryTimer stages
+        from common.service_provider import ServiceProvider
+        from .estate_aggregates import EstateAggregates
+        return ServiceProvider.get_service(EstateAggregates)
+
     def initTypes(self):
         """
         Initialize predefined types in the database for estate properties.
@@ -39,15 +91,14 @@ class EstateService:
             - It's automatically called during application startup via apps.py
         """
 
-        for t in INITIAL_TYPES:
-            exists = Types.objects.filter(
-                type=t['type'],
-                value=t['value']
-            ).exists()
+        missing_types = [
+            t for t in INITIAL_TYPES
+            if self.types_registry.get(t['type'], t['value']) is None
+        ]
 
-            if not exists:
-                new_type = Types(type=t['type'], value=t['value'])
-                new_type.save()
+        for t in missing_types:
+            new_type = Types(type=t['type'], value=t['value'])
+            new_type.save()
 
     def validate_filters(self, filters: Dict[str, Any]) -> None:
         """
@@ -59,7 +110,7 @@ class EstateService:
         Raises:
             FilterValidationError: If any validation rule is violated
         """
-        EstateFilterValidator.validate_filters(filters)
+        EstateFilterValidator.validate_filters(filters, self.types_registry)
 
     def _convert_types_arr_to_dict_str(self, types: List[Types]):
         result = {}
@@ -68,17 +119,51 @@ class EstateService:
         return str(result)
 
     def get_filters_ai_prompt(self, query):
-        bedroom_types = Types.objects.filter(type=BEDROOM_TYPE)
-        bathroom_types = Types.objects.filter(type=BATHROOM_TYPE)
-        estate_categories_types = Types.objects.filter(type=ESTATE_CATEGORY)
-        furnishing_types = Types.objects.filter(type=FURNISHED_TYPE)
-        city_types = Types.objects.filter(type=CITY_TYPE)
-        estate_types = Types.objects.filter(type=ESTATE_TYPE)
-
-        three_bedroom_type = first(bedroom_types, lambda x: x.value == '3')
-        abu_dhabi_city_type = first(
-            city_types, lambda x: x.value == 'Abu Dhabi')
-        villa_estate_type = first(estate_types, lambda x: x.value == 'villa')
+        """
+        Build the filter extraction prompt for a user query.
+
+        The prompt is the cached static prefix followed by the query, so the
+        prefix stays byte-identical across requests and can be served from the
+        model provider's prompt cache.
+
+        Args:
+            query: Natural language query string
+
+        Returns:
+            str: The complete prompt
+        """
+        return f"{self.get_filters_ai_prompt_prefix()}{query}\n"
+
+    def get_filters_ai_prompt_prefix(self) -> str:
+        """
+        Get the static part of the filter extraction prompt.
+
+        The prefix is rendered once and re-rendered only when the Types table changes.
+
+        Returns:
+            str: The prompt up to and including the 'User Query: ' label
+        """
+        fingerprint = self.types_registry.fingerprint
+
+        cached = self._filters_prompt_prefix
+        if cached is None or cached[0] != fingerprint:
+            cached = (fingerprint, self._render_filters_ai_prompt_prefix())
+            self._filters_prompt_prefix = cached
+
+        return cached[1]
+
+    def _render_filters_ai_prompt_prefix(self) -> str:
+        types_registry = self.types_registry
+        bedroom_types = types_registry.of_type(BEDROOM_TYPE)
+        bathroom_types = types_registry.of_type(BATHROOM_TYPE)
+        estate_categories_types = types_registry.of_type(ESTATE_CATEGORY)
+        furnishing_types = types_registry.of_type(FURNISHED_TYPE)
+        city_types = types_registry.of_type(CITY_TYPE)
+        estate_types = types_registry.of_type(ESTATE_TYPE)
+
+        three_bedroom_type = types_registry.get(BEDROOM_TYPE, '3')
+        abu_dhabi_city_type = types_registry.get(CITY_TYPE, 'Abu Dhabi')
+        villa_estate_type = types_registry.get(ESTATE_TYPE, 'villa')
 
         return f"""
         You are an AI model assisting in developing an endpoint for a Django backend application. This endpoint will process natural language queries about real estate properties, extract relevant filters from the user's text, and then format these filters into a JSON object.
@@ -107,127 +192,36 @@ class EstateService:
         Output: {{"bedrooms": {three_bedroom_type.id}, "city": {
             abu_dhabi_city_type.id}, "type": {villa_estate_type.id}}}
 
-        User Query: {query}
-        """
+        User Query: """
 
     def get_summary_ai_prompt(self):
         return 'You are a real estate agent. Given a JSON dataset of real estate properties, create a well-organized summary of the properties to present to a customer. Focus on clarity and professionalism, highlighting key details like property type, location, price, size, and unique features. Ensure the summary is short, concise, visually clean, and customer-friendly.'
 
-    @staticmethod
-    def _convert_to_boolean(value) -> bool:
-        """Convert various string representations to boolean values"""
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, str):
-            value = value.strip().upper()
-            if value in ['YES', 'TRUE', '1', 'Y']:
-                return True
-            if value in ['NO', 'FALSE', '0', 'N']:
-                return False
-        raise ValueError(f"Cannot convert '{value}' to boolean")
-
-    @staticmethod
-    def _parse_datetime(value) -> datetime:
-        """Convert ISO format string to datetime"""
-        if pd.isna(value):
-            return None
-        try:
-            return pd.to_datetime(value)
-        except Exception as e:
-            raise ValueError(
-                f"Invalid datetime format. Expected ISO format: {str(e)}")
-
-    @staticmethod
-    def _parse_size(value) -> int:
-        """Extract numeric value from size string (e.g., '1323 sqft' -> 1323)"""
-        if pd.isna(value):
-            raise ValueError("Size cannot be empty")
-        if isinstance(value, (int, float)):
-            return int(value)
-
-        value = str(value).strip().lower()
-        match = re.match(r'^(\d+)\s*sqft$', value)
-        if match:
-            return int(match.group(1))
-        raise ValueError(
-            f"Invalid size format. Expected 'X sqft', got '{value}'")
-
-    @staticmethod
-    def _parse_type_function_generator(allowed_values: List[Types], column_name: str) -> callable:
-        """
-        Generate a function that parses and validates type values against a predefined set of allowed values.
-
-        This is a factory function that creates specialized parser functions for different type columns
-        (e.g., bathrooms, bedrooms, furnishing status). The generated parser converts input values
-        to corresponding type IDs from the database.
-
-        Args:
-            allowed_values (List[Types]): List of Type model instances representing valid values
-                for this type category. Each Type instance should have 'value' and 'id' attributes.
-            column_name (str): Name of the column being parsed. Used in error messages to help
-                identify where validation failed.
-
-        Returns:
-            callable: A function that takes a single value and returns either:
-                - The ID of the matching Type instance
-                - None if the input is NaN
-                - Raises ValueError if the input doesn't match any allowed values
-
-        Examples:
-            >>> # Creating a parser for bathroom types
-            >>> bathroom_types = Types.objects.filter(type=BATHROOM_TYPE)
-            >>> parse_bathroom = _parse_type_function_generator(bathroom_types, 'bathrooms')
-            >>> 
-            >>> # Using the generated parser
-            >>> bathroom_id = parse_bathroom('2')  # Returns ID for '2 bathrooms' type
-            >>> bathroom_id = parse_bathroom(float('nan'))  # Returns None
-            >>> bathroom_id = parse_bathroom('invalid')  # Raises ValueError
-
-        Raises:
-            ValueError: If the input value doesn't match any allowed value in the type list
-
-        Note:
-            - The generated parser function handles pandas' NaN values by converting them to None
-            - The comparison between input values and allowed values is case-sensitive
-            - This is typically used when processing CSV uploads where type values need to be
-              converted to their corresponding database IDs
-        """
-        def parse_type_column(value):
-            # Try to find a matching type in our allowed values
-            found_type = first(allowed_values, lambda x: x.value == value)
-
-            if found_type:
-                # If we found a matching type, return its ID
-                return found_type.id
-            elif math.isnan(value):
-                # Handle pandas/numpy NaN values by converting to None
-                # This allows for optional/nullable fields in the database
-                return None
-            else:
-                # If value isn't NaN but also doesn't match any allowed values,
-                # raise an error with a descriptive message
-                raise ValueError(
-                    f"Invalid value: '{value}' for column: {column_name}. "
-                    f"Allowed values are: {
-                        ', '.join(t.value for t in allowed_values)}"
-                )
-
-        # Return the generated parser function
-        return parse_type_column
-
     @staticmethod
     def _remove_nan(value):
         if math.isnan(value):
             return None
         return value
 
-    def process_estate_upload(self, csv_file, truncate: bool = False) -> Dict[str, Any]:
+    def process_estate_upload(self, csv_file, truncate: bool = False,
+                              progress: Optional[Callable[[int, int, List[str]], None]] = None
+                              ) -> Dict[str, Any]:
         """
         Process estate data upload from CSV file.
 
+        The file is read in chunks of `ESTATE_UPLOAD_CHUNK_SIZE` rows, each one
+        parsed, validated and written before the next is read, so memory use
+        does not grow with the size of the file. The aggregates of the groups of
+        the saved estates are refreshed once all chunks are written. At most
+        `ESTATE_UPLOAD_MAX_ERRORS` error messages are returned; beyond that the
+        full list is written to a report file whose id is returned (see
+        UploadErrorReport). The header is checked before truncating.
+
         Args:
-            csv_file: CSV file containing estate data
+            csv_file: Seekable CSV file containing estate data
             truncate: Whether to clear existing estates before import
+            progress: Called after every batch with the number of processed rows,
+                of saved rows and the error messages returned so far
 
         Returns:
             Dict containing upload results with success count and any errors
@@ -235,113 +229,254 @@ class EstateService:
         Raises:
             ValueError: If file format or data is invalid
         """
+        # Checked before anything is deleted or written
+        self._check_upload_columns(pd.read_csv(csv_file, nrows=0).columns)
+        csv_file.seek(0)
+
         if truncate:
             Estate.objects.all().delete()
+            estates_changed.send(sender=self.__class__, truncated=True)
 
         # Load required type data
-        bedroom_types = Types.objects.filter(type=BEDROOM_TYPE)
-        bathroom_types = Types.objects.filter(type=BATHROOM_TYPE)
-        estate_categories = Types.objects.filter(type=ESTATE_CATEGORY)
-        furnishing_types = Types.objects.filter(type=FURNISHED_TYPE)
-        city_types = Types.objects.filter(type=CITY_TYPE)
-        estate_types = Types.objects.filter(type=ESTATE_TYPE)
-
-        city_names = [x.value for x in city_types]
-        estate_types_values = [x.value for x in estate_types]
-
-        # Read CSV file
-        df = pd.read_csv(csv_file)
-
-        # Validate required columns
-        required_columns = {
-            'displayAddress': str,
-            'bathrooms': str,
-            'bedrooms': str,
-            'price': int,
-            'verified': str,
-            'type': str,
-            'priceDuration': str,
-            'sizeMin': str,
-            'furnishing': str,
-            'description': str,
-            'addedOn': str,
-            'title': str
+        types_registry = self.types_registry
+        city_ids = types_registry.value_ids(CITY_TYPE)
+        estate_type_ids = types_registry.value_ids(ESTATE_TYPE)
+        value_ids = {
+            'furnishing': types_registry.value_ids(FURNISHED_TYPE),
+            'type': types_registry.value_ids(ESTATE_CATEGORY),
+            'bathrooms': types_registry.value_ids(BATHROOM_TYPE),
+            'bedrooms': types_registry.value_ids(BEDROOM_TYPE),
+        }
+
+        total_count = 0
+        success_count = 0
+        batch_size = settings.ESTATE_UPLOAD_BATCH_SIZE
+
+        with UploadErrorReport(settings.ESTATE_UPLOAD_MAX_ERRORS, settings.ESTATE_UPLOAD_ERROR_DIR,
+                               settings.ESTATE_UPLOAD_ERROR_REPORT_TTL) as error_report:
+            # Text columns are read as strings so that values do not depend on
+            # what pandas infers from each chunk; chunks keep the row numbers
+            # of the whole file in their index
+            text_columns = {column: str for column, dtype in self.UPLOAD_COLUMNS.items()
+                            if dtype is str}
+            for df in pd.read_csv(csv_file, dtype=text_columns,
+                                  chunksize=settings.ESTATE_UPLOAD_CHUNK_SIZE):
+                df, parse_errors = self._parse_upload_chunk(df, value_ids)
+
+                # Find city and estate type of every row from text analysis
+                row_city_ids, row_type_ids = self._infer_type_ids(
+                    df['title'] + ' ' + df['description'], [city_ids, estate_type_ids])
+
+                # Process rows in batches, each written with a single bulk INSERT
+                for start in range(0, len(df), batch_size):
+                    end = start + batch_size
+                    batch = df.iloc[start:end]
+                    batch_success, batch_errors = self._ingest_batch(
+                        batch, parse_errors, row_city_ids[start:end], row_type_ids[start:end])
+                    total_count += len(batch)
+                    success_count += batch_success
+                    for index, message in batch_errors:
+                        error_report.add(f'Row {index + 2}: {message}')
+
+                    if progress is not None:
+                        progress(total_count, success_count, error_report.errors)
+
+        # Statistics of the groups of the saved estates, rewritten once per upload
+        self.estate_aggregates.refresh_pending()
+
+        return {
+            'message': f'Successfully processed {success_count} records',
+            'total_records': total_count,
+            'successful_records': success_count,
+            'failed_records': total_count - success_count,
+            'errors': error_report.errors if error_report.errors else None,
+            'errors_truncated': error_report.truncated,
+            'error_report': error_report.report_id
         }
 
-        missing_columns = set(required_columns.keys()) - set(df.columns)
+    def _check_upload_columns(self, columns: Iterable[str]) -> None:
+        """
+        Check the header of an upload.
+
+        Args:
+            columns: Columns of the CSV file
+
+        Raises:
+            ValueError: If required columns are missing
+        """
+        missing_columns = set(self.UPLOAD_COLUMNS.keys()) - set(columns)
         if missing_columns:
             raise ValueError(f'Missing required columns: {
                              ", ".join(missing_columns)}')
 
-        # Convert data types
-        for column, dtype in required_columns.items():
-            if column not in ['verified', 'furnishing', 'addedOn', 'sizeMin',
+    def _parse_upload_chunk(self, df: pd.DataFrame,
+                            value_ids: Dict[str, Dict[str, int]]) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Parse the values of a chunk of an upload, whose columns were checked.
+
+        Args:
+            df: Chunk of the upload as read from the CSV file
+            value_ids: Type ids by value of the type columns
+
+        Returns:
+            tuple: (parsed chunk, per-row parsing error messages)
+        """
+        # Convert data types; prices are parsed per cell with the special columns,
+        # so an invalid price fails its row rather than the rest of the upload
+        for column, dtype in self.UPLOAD_COLUMNS.items():
+            if column not in ['price', 'verified', 'furnishing', 'addedOn', 'sizeMin',
                               'bathrooms', 'bedrooms', 'type']:
                 df[column] = df[column].astype(dtype)
 
-        # Process special columns
-        df['verified'] = df['verified'].apply(self._convert_to_boolean)
-        df['addedOn'] = df['addedOn'].apply(self._parse_datetime)
-        df['sizeMin'] = df['sizeMin'].apply(self._parse_size)
-
-        # Convert type fields
-        df['furnishing'] = df['furnishing'].apply(
-            self._parse_type_function_generator(furnishing_types, 'furnishing'))
-        df['type'] = df['type'].apply(
-            self._parse_type_function_generator(estate_categories, 'type'))
-        df['bathrooms'] = df['bathrooms'].apply(
-            self._parse_type_function_generator(bathroom_types, 'bathrooms'))
-        df['bedrooms'] = df['bedrooms'].apply(
-            self._parse_type_function_generator(bedroom_types, 'bedrooms'))
+        # Parse special and type columns, collecting invalid cells per row
+        return EstateUploadParser.parse(df, value_ids)
 
-        success_count = 0
+    def _ingest_batch(self, batch: pd.DataFrame, parse_errors: pd.Series, row_city_ids: List[int],
+                      row_type_ids: List[int]) -> tuple[int, List[tuple[int, str]]]:
+        """
+        Validate a batch of parsed upload rows and write the valid ones in one transaction.
+
+        Rows are screened with vectorized checks first; only rows flagged by the screen
+        go through `full_clean()`, so the reported errors are identical to per-row
+        validation while clean rows skip it entirely.
+
+        Args:
+            batch: Slice of the parsed upload DataFrame
+            parse_errors: Per-row parsing error messages of the upload
+            row_city_ids: City type id of every row of the batch
+            row_type_ids: Estate type id of every row of the batch
+
+        Returns:
+            tuple: (number of saved rows, list of (row index, error message))
+        """
         errors = []
+        estates = []
+        invalid_rows = self._find_invalid_rows(batch)
+
+        for index, row, city_id, type_id in zip(batch.index, batch.to_dict('records'),
+                                                row_city_ids, row_type_ids):
+            if pd.notna(parse_errors[index]):
+                errors.append((index, parse_errors[index]))
+                continue
 
-        # Process each row
-        for index, row in df.iterrows():
             try:
-                estate = self._create_estate_from_row(row, city_types, estate_types,
-                                                      city_names, estate_types_values)
-                estate.full_clean()
-                estate.save()
-                success_count += 1
+                estate = self._create_estate_from_row(row, city_id, type_id)
+                if invalid_rows[index]:
+                    estate.full_clean()
+                estates.append((index, estate))
             except (ValidationError, Exception) as e:
-                errors.append(f'Row {index + 2}: {str(e)}')
+                errors.append((index, str(e)))
 
-        return {
-            'message': f'Successfully processed {success_count} records',
-            'total_records': len(df),
-            'successful_records': success_count,
-            'failed_records': len(df) - success_count,
-            'errors': errors if errors else None
-        }
+        success_count = self._bulk_save(estates, errors)
+        errors.sort(key=lambda error: error[0])
 
-    def _create_estate_from_row(self, row, city_types, estate_types,
-                                city_names, estate_types_values) -> Estate:
-        """Create Estate instance from DataFrame row"""
-        # Find city and estate type from text analysis
-        city_id = None
-        type_id = None
+        return success_count, errors
 
-        city = TextAnalyzer.findMostFrequentPattern(
-            row['title'] + ' ' + row['description'],
-            city_names
-        )
-        if city:
-            found_city_type = first(city_types, lambda x: x.value == city)
-            if found_city_type:
-                city_id = found_city_type.id
-
-        estate_type = TextAnalyzer.findMostFrequentPattern(
-            row['title'] + ' ' + row['description'],
-            estate_types_values
-        )
-        if estate_type:
-            found_estate_type = first(
-                estate_types, lambda x: x.value == estate_type)
-            if found_estate_type:
-                type_id = found_estate_type.id
+    @classmethod
+    def _find_invalid_rows(cls, df: pd.DataFrame) -> pd.Series:
+        """
+        Flag rows whose values would be rejected by `Estate.full_clean()`.
+
+        Applies the null, blank, max_length and integer range rules of the Estate
+        fields to whole columns at once.
+
+        Args:
+            df: Parsed upload DataFrame
+
+        Returns:
+            pd.Series: Boolean mask aligned with `df.index`, True for rows needing full validation
+        """
+        invalid = pd.Series(False, index=df.index)
+
+        for column, field_name in cls.UPLOAD_COLUMN_FIELDS.items():
+            field = Estate._meta.get_field(field_name)
+            values = df[column]
+
+            if not field.null:
+                invalid |= values.isna()
+
+            if isinstance(field, (models.CharField, models.TextField)):
+                lengths = values.astype(str).str.len()
+                if not field.blank:
+                    invalid |= lengths == 0
+                if field.max_length is not None:
+                    invalid |= lengths > field.max_length
+            elif isinstance(field, models.IntegerField):
+                numbers = pd.to_numeric(values, errors='coerce')
+                for validator in field.validators:
+                    if isinstance(validator, MinValueValidator):
+                        invalid |= numbers < validator.limit_value
+                    elif isinstance(validator, MaxValueValidator):
+                        invalid |= numbers > validator.limit_value
+
+        return invalid
+
+    @classmethod
+    def _bulk_save(cls, estates: List[tuple[int, Estate]], errors: List[tuple[int, str]]) -> int:
+        """
+        Save estates with a single bulk INSERT inside a transaction.
+
+        If the batch is rejected by the database, it is retried row by row so the
+        offending rows can be reported individually.
+
+        Args:
+            estates: List of (row index, Estate) pairs to save
+            errors: List receiving (row index, error message) for rows that fail
+
+        Returns:
+            int: Number of saved estates
+        """
+        if not estates:
+            return 0
+
+        try:
+            with transaction.atomic():
+                created = Estate.objects.bulk_create(
+                    [estate for _, estate in estates])
+            estates_changed.send(sender=cls, created=created)
+            return len(estates)
+        except DatabaseError:
+            pass
+
+        created = []
+        for index, estate in estates:
+            try:
+                # Not save(): its post_save receivers would handle the estate
+                # again after the estates_changed signal below
+                with transaction.atomic():
+                    Estate.objects.bulk_create([estate])
+                created.append(estate)
+            except Exception as e:
+                errors.append((index, str(e)))
+
+        estates_changed.send(sender=cls, created=created)
+        return len(created)
+
+    def _infer_type_ids(self, texts: pd.Series,
+                        value_ids_list: List[Dict[str, int]]) -> List[List[int]]:
+        """
+        Find the most frequent type value mentioned in each text, for several
+        types at once. Large inputs are analyzed in parallel by the text
+        inference pool.
+
+        Args:
+            texts: Texts to analyze
+            value_ids_list: For each type, mapping of the values to search for to their ids
+
+        Returns:
+            list: For each type, the id of the most frequent value of each text,
+                None if none is found
+        """
+        searched = [value_ids for value_ids in value_ids_list if value_ids]
+        values = iter(self.text_inference.infer(texts, [list(value_ids) for value_ids in searched]))
+
+        return [
+            [value_ids.get(value) for value in next(values)] if value_ids else [None] * len(texts)
+            for value_ids in value_ids_list
+        ]
 
+    def _create_estate_from_row(self, row, city_id: int, type_id: int) -> Estate:
+        """Create Estate instance from a DataFrame row or row record"""
         # Create and return Estate instance
         return Estate(
             address=row['displayAddress'],
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent by EstateService after estates were written in bulk or removed, bypassing
+# the model signals. Receivers get `created` (list of saved Estate instances)
+# and/or `truncated` (True when all estates were deleted).
+estates_changed = Signal()
@@ -0,0 +1,140 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import threading
+
+
+class _Call:
+    """A call in flight, awaited by the threads sharing its result"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller of a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception). Nothing
+    is cached, the next call after completion runs the function again.
+
+    `do()` coalesces calls from threads, `ado()` calls from coroutines of the
+    same event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        # (event loop id, key) -> future of the call
+        self._async_calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args), or wait for the call in flight with the same key.
+
+        Args:
+            key: Key identifying identical calls
+            fn: Function to run
+            *args: Arguments of the function
+
+        Returns:
+            The result of the call, shared with the other callers of the key
+
+        Raises:
+            Any exception raised by the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        Await fn(*args), or wait for the call in flight with the same key.
+
+        If the coroutine running the call is cancelled (e.g. its client went
+        away), the waiting callers run the call again themselves.
+
+        Args:
+            key: Key identifying identical calls
+            fn: Coroutine function to run
+            *args: Arguments of the function
+
+        Returns:
+            The result of the call, shared with the other callers of the key
+
+        Raises:
+            Any exception raised by the call
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+
+        while True:
+            with self._lock:
+                future = self._async_calls.get(loop_key)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[loop_key] = loop.create_future()
+                    self.calls += 1
+                else:
+                    self.shared += 1
+
+            if leader:
+                break
+
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Retry only when the leader was cancelled, not this caller
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        try:
+            result = await fn(*args)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved, there may be no waiters
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[loop_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of calls run and of callers that shared an in-flight call"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'shared': self.shared,
+                'in_flight': len(self._calls) + len(self._async_calls),
+            }
@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from common.service_provider import ServiceProvider
+
+
+class EstateTestRunner(DiscoverRunner):
+    """
+    Test runner keeping the files written by estate saves out of the shared
+    directories: test estates have the ids of real ones, so indexing them into
+    the production semantic index would replace the vectors of real estates.
+    """
+
+    # Semantic index directory configured before the tests ran
+    production_index_dir = None
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        EstateTestRunner.production_index_dir = settings.ESTATE_SEMANTIC_INDEX_DIR
+        self._directory = tempfile.mkdtemp(prefix='estate-tests-')
+        self._settings = override_settings(ESTATE_SEMANTIC_INDEX_DIR=self._directory)
+        self._settings.enable()
+        # Services created before would keep the shared directory
+        ServiceProvider.clear_services()
+
+    def teardown_test_environment(self, **kwargs):
+        ServiceProvider.clear_services()
+        self._settings.disable()
+        shutil.rmtree(self._directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,712 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from itertools import product
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from common.service_provider import ServiceProvider
+from .admission_control import AdmissionController, LLMOverloadedError
+from .estate_filter_validator import FilterValidationError
+from .estate_aggregates import EstateAggregates
+from .estate_facets import EstateFacets
+from .estate_snapshot import EstateSnapshot
+from .estate_query_processor import RealEstateQueryProcessor
+from .filter_cache import FilterCache
+from .llm_client import LLMClient
+from .models import Estate, EstateAggregate, Types
+from .rule_based_filter_extractor import RuleBasedFilterExtractor
+from .semantic_index import SemanticIndex
+from .singleflight import SingleFlight
+from .service import EstateService
+from .test_runner import EstateTestRunner
+from .text_analyzer import PatternMatcher, TextAnalyzer
+from .types_registry import TypesRegistry
+
+UPLOAD_HEADER = ('displayAddress,bathrooms,bedrooms,price,verified,type,priceDuration,'
+                 'sizeMin,furnishing,description,addedOn,title\n')
+
+
+def upload_row(index: int, price: str) -> str:
+    return (f'"Building {index}, Dubai",2,2,{price},true,Residential for Sale,sell,1200 sqft,NO,'
+            f'Apartment in Dubai with a balcony,2024-01-27T10:00:00Z,2 bedroom apartment in Dubai\n')
+
+
+class EstateUploadTests(TestCase):
+    def setUp(self):
+        # Types are created again in every test, with new ids
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        self.service = ServiceProvider.get_service(EstateService)
+        self.service.initTypes()
+
+    @override_settings(ESTATE_UPLOAD_CHUNK_SIZE=1000)
+    def test_invalid_price_in_later_chunk_fails_its_row_only(self):
+        rows = [upload_row(index, '' if index == 2500 else str(1000000 + index))
+                for index in range(3000)]
+        csv_file = io.StringIO(UPLOAD_HEADER + ''.join(rows))
+
+        result = self.service.process_estate_upload(csv_file)
+
+        self.assertEqual(result['total_records'], 3000)
+        self.assertEqual(result['successful_records'], 2999)
+        self.assertEqual(result['errors'], ['Row 2502: Price cannot be empty'])
+        self.assertEqual(Estate.objects.count(), 2999)
+
+    def test_non_numeric_price_is_reported_per_row(self):
+        csv_file = io.StringIO(UPLOAD_HEADER + upload_row(0, 'abc') + upload_row(1, '850000'))
+
+        result = self.service.process_estate_upload(csv_file)
+
+        self.assertEqual(result['successful_records'], 1)
+        self.assertEqual(result['errors'], ["Row 2: Invalid price: 'abc'"])
+        self.assertEqual(Estate.objects.get().price, 850000)
+
+    def test_bad_header_does_not_truncate(self):
+        self.service.process_estate_upload(io.StringIO(UPLOAD_HEADER + upload_row(0, '850000')))
+
+        with self.assertRaisesMessage(ValueError, 'Missing required columns'):
+            self.service.process_estate_upload(io.StringIO('title,price\nVilla,1\n'), truncate=True)
+
+        self.assertEqual(Estate.objects.count(), 1)
+
+    def test_full_error_report_is_served_by_id(self):
+        rows = [upload_row(index, 'abc') for index in range(3)]
+        csv_file = SimpleUploadedFile('estates.csv', (UPLOAD_HEADER + ''.join(rows)).encode())
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ESTATE_UPLOAD_MAX_ERRORS=1, ESTATE_UPLOAD_ERROR_DIR=directory):
+            result = self.client.post('/estate/upload', {'file': csv_file}).json()
+            self.assertTrue(result['errors_truncated'])
+            self.assertNotIn(directory, result['error_report'])
+
+            response = self.client.get(result['error_report_url'])
+            report = b''.join(response.streaming_content).decode()
+            response.close()
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(report.splitlines()), 3)
+            self.assertEqual(self.client.get('/estate/upload/errors/missing').status_code, 404)
+
+    def test_rows_saved_one_by_one_are_indexed_once(self):
+        bulk_create = Estate.objects.bulk_create
+
+        def reject_batches(estates, *args, **kwargs):
+            if len(estates) > 1:
+                raise DatabaseError('batch rejected')
+            return bulk_create(estates, *args, **kwargs)
+
+        semantic_index = ServiceProvider.get_service(SemanticIndex)
+        csv_file = io.StringIO(UPLOAD_HEADER + upload_row(0, '850000') + upload_row(1, '900000'))
+        with mock.patch.object(Estate.objects, 'bulk_create', side_effect=reject_batches), \
+                mock.patch.object(semantic_index, 'add_estates',
+                                  wraps=semantic_index.add_estates) as add_estates:
+            result = self.service.process_estate_upload(csv_file)
+
+        self.assertEqual(result['successful_records'], 2)
+        indexed = [estate.id for call in add_estates.call_args_list for estate in call.args[0]]
+        self.assertCountEqual(indexed, Estate.objects.values_list('id', flat=True))
+
+
+class RuleBasedFilterExtractorTests(TestCase):
+    def setUp(self):
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        ServiceProvider.get_service(EstateService).initTypes()
+        self.extractor = RuleBasedFilterExtractor()
+
+    def test_room_count_without_type_is_left_to_llm(self):
+        filters, confidence = self.extractor.extract('0 bedroom apartment dubai')
+
+        self.assertNotIn('bedrooms', filters)
+        self.assertEqual(confidence, 0.0)
+
+
+class SemanticIndexIsolationTests(TestCase):
+    def setUp(self):
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        self.service = ServiceProvider.get_service(EstateService)
+        self.service.initTypes()
+        # Files are not rolled back with the database
+        ServiceProvider.get_service(SemanticIndex).clear()
+
+    @staticmethod
+    def _production_meta():
+        path = os.path.join(EstateTestRunner.production_index_dir, 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as file:
+            return file.read()
+
+    def test_saved_estates_are_not_indexed_in_production_index(self):
+        before = self._production_meta()
+
+        self.service.process_estate_upload(io.StringIO(UPLOAD_HEADER + upload_row(0, '850000')))
+        Estate.objects.get().save()
+
+        semantic_index = ServiceProvider.get_service(SemanticIndex)
+        self.assertNotEqual(semantic_index.directory, EstateTestRunner.production_index_dir)
+        self.assertEqual(len(semantic_index), 1)
+        self.assertEqual(self._production_meta(), before)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_metrics_do_not_create_llm_client(self):
+        services = {name: service for name, service in ServiceProvider._services.items()
+                    if name != LLMClient.__name__}
+        with mock.patch.dict(ServiceProvider._services, services, clear=True), \
+                mock.patch.object(LLMClient, '__init__', side_effect=AssertionError('created')):
+            response = self.client.get('/estate/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('estate_llm_in_flight 0', response.content.decode())
+        self.assertIn('estate_upload_jobs_total{status="succeeded"} 0', response.content.decode())
+
+
+class PatternMatcherTests(SimpleTestCase):
+    PATTERNS = ['Dubai', 'Fujairah', 'Dibba Al-Fujairah', 'Al Ain', 'Ain', 'villa', 'villas', 'apartment']
+    TEXTS = [
+        'Villa in Dubai, close to Dubai Marina. Villas and villa-style apartments.',
+        'dibba al-fujairah beach house, an hour from Fujairah city',
+        'AL AIN oasis view: al ain, ain al faydah and Ain',
+        'Dubaii dubai_marina xdubai dubai. apartment!apartment',
+        'no match here',
+        '',
+    ]
+
+    @staticmethod
+    def _count_with_one_regex_per_pattern(text, patterns):
+        prepared = text.lower().strip()
+        return {pattern.lower(): len(re.findall(rf'\b{re.escape(pattern.lower())}\b', prepared))
+                for pattern in patterns}
+
+    def test_counts_match_one_regex_per_pattern(self):
+        matcher = PatternMatcher(self.PATTERNS)
+        for text in self.TEXTS:
+            with self.subTest(text=text):
+                self.assertEqual(matcher.count(text),
+                                 self._count_with_one_regex_per_pattern(text, self.PATTERNS))
+
+    def test_most_frequent_keeps_original_case_and_first_on_ties(self):
+        self.assertEqual(TextAnalyzer.findMostFrequentPattern(
+            'fujairah or dubai, dubai', ['Fujairah', 'Dubai']), 'Dubai')
+        self.assertEqual(TextAnalyzer.findMostFrequentPattern(
+            'fujairah or dubai', ['Fujairah', 'Dubai']), 'Fujairah')
+        self.assertIsNone(TextAnalyzer.findMostFrequentPattern('sharjah', ['Fujairah', 'Dubai']))
+
+
+class TypesRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = TypesRegistry()
+        self.dubai = Types.objects.create(type='city', value='Dubai')
+
+    def test_lookups_are_served_from_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.registry.get_id('city', 'Dubai'), self.dubai.id)
+            self.assertEqual(self.registry.get_by_id(self.dubai.id).value, 'Dubai')
+            self.assertEqual(self.registry.value_ids('city'), {'Dubai': self.dubai.id})
+            self.assertIsNone(self.registry.get('city', 'Paris'))
+
+    def test_invalidate_reloads_changes(self):
+        fingerprint = self.registry.fingerprint
+        # Bypasses the signals, so the registry is not invalidated
+        Types.objects.filter(id=self.dubai.id).update(value='Abu Dhabi')
+        self.assertEqual(self.registry.get_by_id(self.dubai.id).value, 'Dubai')
+
+        self.registry.invalidate()
+
+        self.assertEqual(self.registry.get_by_id(self.dubai.id).value, 'Abu Dhabi')
+        self.assertIsNone(self.registry.get_id('city', 'Dubai'))
+        self.assertNotEqual(self.registry.fingerprint, fingerprint)
+
+    def test_saving_a_type_invalidates_the_shared_registry(self):
+        registry = ServiceProvider.get_service(TypesRegistry)
+        self.assertIsNone(registry.get_id('city', 'Sharjah'))
+
+        sharjah = Types.objects.create(type='city', value='Sharjah')
+
+        self.assertEqual(registry.get_id('city', 'Sharjah'), sharjah.id)
+
+
+@override_settings(ESTATE_FILTER_CACHE_BACKEND='local', ESTATE_FILTER_CACHE_TTL=60)
+class FilterCacheTests(TestCase):
+    def setUp(self):
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        ServiceProvider.get_service(EstateService).initTypes()
+        self.cache = FilterCache()
+        self.extract = mock.Mock(return_value={'price__lt': 1500000})
+
+    def test_equivalent_queries_hit(self):
+        self.assertEqual(self.cache.get_or_extract('3-Bedroom villa, under 1.5M!', self.extract),
+                         {'price__lt': 1500000})
+        self.assertEqual(self.cache.get_or_extract('3 bedroom villa under 1,500,000', self.extract),
+                         {'price__lt': 1500000})
+
+        self.extract.assert_called_once()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_different_queries_miss(self):
+        self.cache.get_or_extract('villa in dubai', self.extract)
+        self.cache.get_or_extract('villa in sharjah', self.extract)
+
+        self.assertEqual(self.extract.call_count, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch('estate.filter_cache.time.monotonic', return_value=1000.0):
+            self.cache.get_or_extract('villa in dubai', self.extract)
+        with mock.patch('estate.filter_cache.time.monotonic', return_value=1059.0):
+            self.cache.get_or_extract('villa in dubai', self.extract)
+        self.assertEqual(self.extract.call_count, 1)
+
+        with mock.patch('estate.filter_cache.time.monotonic', return_value=1061.0):
+            self.cache.get_or_extract('villa in dubai', self.extract)
+        self.assertEqual(self.extract.call_count, 2)
+
+    def test_types_changes_change_keys(self):
+        self.cache.get_or_extract('villa in dubai', self.extract)
+        Types.objects.create(type='city', value='Atlantis')
+        self.cache.get_or_extract('villa in dubai', self.extract)
+
+        self.assertEqual(self.extract.call_count, 2)
+
+    def test_invalid_llm_filters_are_not_cached(self):
+        processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+        responses = [{'price__lte': 2000000}, {'price__lt': 2000000}]
+
+        def complete(**kwargs):
+            message = mock.Mock(content=json.dumps(responses.pop(0)))
+            return mock.Mock(choices=[mock.Mock(message=message)])
+
+        query = 'a home with a view of the sea for my parents'
+        with mock.patch.object(processor.llm_client, 'complete', side_effect=complete):
+            with self.assertRaises(FilterValidationError):
+                processor._extract_filters(query)
+            self.assertEqual(processor._extract_filters(query), {'price__lt': 2000000})
+
+        self.assertEqual(processor.filter_cache.get(query), {'price__lt': 2000000})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def wait_for_shared(self, singleflight, shared):
+        deadline = time.monotonic() + 5
+        while singleflight.stats()['shared'] < shared:
+            self.assertLess(time.monotonic(), deadline, 'callers did not join the call in flight')
+            time.sleep(0.001)
+
+    def test_concurrent_calls_share_one_result(self):
+        singleflight = SingleFlight()
+        release = threading.Event()
+        fn = mock.Mock(side_effect=lambda: release.wait(5) and object())
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(singleflight.do('key', fn)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_shared(singleflight, 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        fn.assert_called_once()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len({id(result) for result in results}), 1)
+        self.assertEqual(singleflight.stats(), {'calls': 1, 'shared': 4, 'in_flight': 0})
+
+    def test_waiters_receive_the_exception(self):
+        singleflight = SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            release.wait(5)
+            raise ValueError('extraction failed')
+
+        def call():
+            try:
+                singleflight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.wait_for_shared(singleflight, 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(len({id(error) for error in errors}), 1)
+
+    def test_calls_are_not_cached(self):
+        singleflight = SingleFlight()
+        fn = mock.Mock(return_value=1)
+
+        singleflight.do('key', fn)
+        singleflight.do('key', fn)
+        singleflight.do('other', fn)
+
+        self.assertEqual(fn.call_count, 3)
+
+    def test_async_calls_share_one_result(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        async def fn(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def run():
+            return await asyncio.gather(*(singleflight.ado('key', fn, 21) for _ in range(4)))
+
+        self.assertEqual(asyncio.run(run()), [42] * 4)
+        self.assertEqual(calls, [21])
+        self.assertEqual(singleflight.stats(), {'calls': 1, 'shared': 3, 'in_flight': 0})
+
+    def test_async_waiters_retry_when_the_leader_is_cancelled(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def run():
+            leader = asyncio.ensure_future(singleflight.ado('key', fn))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(singleflight.ado('key', fn))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await waiter
+
+        self.assertEqual(asyncio.run(run()), 2)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_full_queue_is_rejected(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+        admission.acquire()
+
+        with self.assertRaises(LLMOverloadedError) as context:
+            admission.acquire()
+
+        self.assertEqual(context.exception.retry_after, 1.0)
+        self.assertEqual(admission.stats()['rejected'], 1)
+        admission.release()
+        admission.acquire()
+        self.assertEqual(admission.stats()['admitted'], 2)
+
+    def test_queued_caller_times_out(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        admission.acquire()
+
+        with self.assertRaises(LLMOverloadedError):
+            admission.acquire()
+
+        self.assertEqual(admission.stats()['queue_depth'], 0)
+
+    def test_release_hands_the_slot_to_the_queued_caller(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        admission.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (admission.acquire(), acquired.set()))
+        thread.start()
+        while admission.stats()['queue_depth'] < 1:
+            time.sleep(0.001)
+
+        self.assertFalse(acquired.is_set())
+        admission.release()
+        thread.join()
+
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(admission.stats()['in_flight'], 1)
+
+    def test_async_full_queue_is_rejected(self):
+        admission = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+        admission.acquire()
+
+        with self.assertRaises(LLMOverloadedError):
+            asyncio.run(admission.aacquire())
+
+
+class AdmissionResponseTests(TestCase):
+    def setUp(self):
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        ServiceProvider.get_service(EstateService).initTypes()
+
+    def test_full_queue_returns_503(self):
+        processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+        admission = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+        admission.acquire()
+
+        with mock.patch.object(processor.llm_client, 'admission', admission):
+            response = self.client.post('/estate/query', json.dumps({
+                'query': 'a quiet home close to good schools for a young family',
+            }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(response.json()['success'])
+
+
+class SemanticIndexTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.index = SemanticIndex(self.directory)
+        self.index.add([
+            (1, 'Villa with a private pool and sea views'),
+            (2, 'Apartment next to the metro station'),
+            (3, 'Sea view apartment with a balcony'),
+            (4, 'Pet friendly townhouse with a garden'),
+        ])
+
+    def test_top_k_ranks_candidates_by_similarity(self):
+        self.assertEqual(self.index.top_k('sea view', [1, 2, 3, 4], 5)[:2], [3, 1])
+        self.assertEqual(self.index.top_k('sea view', [1, 2, 3, 4], 1), [3])
+        self.assertEqual(self.index.top_k('near the metro', [1, 2, 3, 4], 5), [2])
+
+    def test_top_k_only_returns_indexed_candidates(self):
+        self.assertEqual(self.index.top_k('sea view', [1, 2, 99], 5), [1])
+        self.assertEqual(self.index.top_k('sea view', [], 5), [])
+        self.assertEqual(self.index.top_k('the', [1, 2, 3], 5), [])
+
+    def test_reindexed_estate_supersedes_its_old_text(self):
+        self.index.add([(3, 'Apartment with a garden near the metro')])
+
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.top_k('sea view', [1, 2, 3, 4], 5), [1])
+        self.assertIn(3, self.index.top_k('garden', [1, 2, 3, 4], 5))
+
+    def test_writes_are_visible_to_other_instances(self):
+        other = SemanticIndex(self.directory)
+        self.assertEqual(len(other), 4)
+
+        self.index.add([(5, 'Penthouse with sea views')])
+        self.assertIn(5, other.top_k('sea view', [1, 5], 5))
+
+        other.clear()
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.top_k('sea view', [1, 5], 5), [])
+
+
+def create_estates(count: int, types: dict, seed: int) -> list:
+    """Bulk create estates with random filterable fields, some foreign keys left empty"""
+    generator = random.Random(seed)
+    estates = [
+        Estate(
+            address=f'Building {index}', title=f'Estate {index}', description='',
+            price=generator.randrange(100000, 5000000, 50000), size=generator.randrange(300, 5000, 50),
+            verified=generator.random() < 0.5, price_duration='sell',
+            **{column: generator.choice(values + [None]) for column, values in types.items()},
+        )
+        for index in range(count)
+    ]
+    return Estate.objects.bulk_create(estates)
+
+
+class EstateSnapshotTests(TestCase):
+    FILTERS = [
+        {},
+        {'price__lt': 1500000},
+        {'price__gt': 1000000, 'size__lt': 2000},
+        {'verified': True},
+        {'city': 0, 'bedrooms': 1},
+        {'city': 1, 'type': 0, 'price__lt': 3000000},
+        {'bedrooms': 2, 'verified': False, 'size__gt': 1000},
+        {'furnished': 0, 'category': 1, 'bathrooms': 2},
+        {'price': 2500000},
+        {'created_at__gt': '2000-01-01T00:00:00Z'},
+    ]
+
+    def setUp(self):
+        self.types = {
+            column: [Types.objects.create(type=column, value=str(value)) for value in range(3)]
+            for column in EstateSnapshot.FOREIGN_KEY_COLUMNS
+        }
+        create_estates(300, self.types, seed=1)
+
+    def resolve(self, filters: dict) -> dict:
+        """Replace the indexes of Types in the filters by their ids"""
+        return {field: self.types[field][value].id if field in self.types else value
+                for field, value in filters.items()}
+
+    def assert_matches_database(self, snapshot: EstateSnapshot) -> None:
+        for filters in map(self.resolve, self.FILTERS):
+            with self.subTest(filters=filters):
+                expected = list(Estate.objects.filter(**filters).order_by('id').values_list('id', flat=True))
+                self.assertEqual(snapshot.matching_ids(filters).tolist(), expected)
+
+    def test_matching_ids_match_the_database(self):
+        self.assert_matches_database(EstateSnapshot())
+
+    def test_unknown_types_id_matches_nothing(self):
+        self.assertEqual(len(EstateSnapshot().matching_ids({'city': -5})), 0)
+
+    def test_filters_left_to_the_database(self):
+        snapshot = EstateSnapshot()
+        self.assertIsNone(snapshot.matching_ids({'city': None}))
+        self.assertIsNone(snapshot.matching_ids({'id': 1}))
+        self.assertIsNone(snapshot.matching_ids({'verified': 'yes'}))
+
+    @override_settings(ESTATE_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_database_writes_rebuild_the_snapshot(self):
+        snapshot = EstateSnapshot()
+        snapshot.matching_ids({})
+
+        create_estates(10, self.types, seed=2)
+        self.assert_matches_database(snapshot)
+
+    def test_facet_counts_match_the_database(self):
+        snapshot = EstateSnapshot()
+        for filters in map(self.resolve, self.FILTERS):
+            with self.subTest(filters=filters):
+                self.assertEqual(snapshot.facet_counts(filters), EstateFacets()._database_counts(filters))
+
+    @override_settings(ESTATE_SNAPSHOT_CHECK_INTERVAL=3600)
+    def test_appended_estates_match_the_database(self):
+        snapshot = EstateSnapshot()
+        snapshot.matching_ids({})
+        # A Types id no bitmap references yet
+        self.types['city'].append(Types.objects.create(type='city', value='3'))
+
+        with mock.patch.object(snapshot, '_build', side_effect=AssertionError('rebuilt')):
+            # Batches not aligned on the bytes of the bitmaps
+            for seed in (2, 3, 4):
+                snapshot.add_estates(create_estates(13, self.types, seed=seed))
+
+            self.assertEqual(len(snapshot), 339)
+            self.assert_matches_database(snapshot)
+            for filters in map(self.resolve, self.FILTERS + [{'city': 3}]):
+                with self.subTest(filters=filters):
+                    self.assertEqual(snapshot.facet_counts(filters),
+                                     EstateFacets()._database_counts(filters))
+
+    @override_settings(ESTATE_SNAPSHOT_CHECK_INTERVAL=3600)
+    def test_out_of_order_estates_make_the_snapshot_rebuild(self):
+        snapshot = EstateSnapshot()
+        snapshot.matching_ids({})
+
+        snapshot.add_estates(Estate.objects.order_by('id')[:5])
+
+        self.assertEqual(len(snapshot), 300)
+        self.assertTrue(snapshot._stale)
+
+
+class EstateAggregatesTests(TestCase):
+    FIELDS = EstateAggregates.FIELDS
+    COLUMNS = ('count', 'min_price', 'median_price', 'max_price', 'min_size', 'median_size', 'max_size')
+
+    def setUp(self):
+        ServiceProvider.get_service(TypesRegistry).invalidate()
+        self.service = ServiceProvider.get_service(EstateService)
+        self.service.initTypes()
+        self.estate_aggregates = ServiceProvider.get_service(EstateAggregates)
+        self.types = {
+            column: [Types.objects.create(type=column, value=str(value)) for value in range(3)]
+            for column in EstateSnapshot.FOREIGN_KEY_COLUMNS
+        }
+
+    def expected(self) -> dict:
+        """Statistics of every group and rollup, computed from the estates"""
+        groups = {}
+        for *key, price, size in Estate.objects.values_list(
+                *(f'{field}_id' for field in self.FIELDS), 'price', 'size'):
+            for kept in product((True, False), repeat=len(self.FIELDS)):
+                if any(keep and value is None for value, keep in zip(key, kept)):
+                    continue
+                rollup = tuple(value if keep else None for value, keep in zip(key, kept))
+                groups.setdefault(rollup, []).append((price, size))
+
+        expected = {}
+        for key, rows in groups.items():
+            prices, sizes = zip(*rows)
+            expected[key] = {
+                'count': len(rows),
+                'min_price': min(prices), 'median_price': float(statistics.median(prices)),
+                'max_price': max(prices),
+                'min_size': min(sizes), 'median_size': float(statistics.median(sizes)),
+                'max_size': max(sizes),
+            }
+        return expected
+
+    def table(self) -> dict:
+        return {
+            tuple(row[f'{field}_id'] for field in self.FIELDS): {column: row[column] for column in self.COLUMNS}
+            for row in EstateAggregate.objects.values()
+        }
+
+    def test_refresh_computes_every_rollup(self):
+        create_estates(200, self.types, seed=1)
+
+        self.estate_aggregates.refresh()
+
+        self.assertEqual(self.table(), self.expected())
+
+    def test_incremental_refresh_matches_full_refresh(self):
+        create_estates(200, self.types, seed=1)
+        self.estate_aggregates.refresh()
+
+        for max_keys in (EstateAggregates.INCREMENTAL_MAX_KEYS, 0):
+            with self.subTest(max_keys=max_keys), \
+                    mock.patch.object(EstateAggregates, 'INCREMENTAL_MAX_KEYS', max_keys):
+                created = create_estates(5, self.types, seed=max_keys + 2)
+                self.estate_aggregates.refresh(
+                    {(estate.city_id, estate.type_id, estate.bedrooms_id) for estate in created})
+
+                self.assertEqual(self.table(), self.expected())
+
+    def test_upload_refreshes_aggregates(self):
+        self.service.process_estate_upload(io.StringIO(
+            UPLOAD_HEADER + ''.join(upload_row(index, str(price))
+                                    for index, price in enumerate((900000, 700000, 800000)))))
+        self.assertEqual(self.table(), self.expected())
+
+        self.service.process_estate_upload(io.StringIO(UPLOAD_HEADER + upload_row(3, '1000000')))
+        self.assertEqual(self.table(), self.expected())
+        overall, = self.estate_aggregates.stats()
+        self.assertEqual((overall['count'], overall['price']['median']), (4, 850000.0))
+
+        self.service.process_estate_upload(io.StringIO(UPLOAD_HEADER + upload_row(0, '500000')),
+                                           truncate=True)
+        self.assertEqual(self.table(), self.expected())
+
+    def test_saved_estate_refreshes_its_old_and_new_groups(self):
+        estate, *_ = create_estates(50, self.types, seed=1)
+        self.estate_aggregates.refresh()
+
+        estate.city = self.types['city'][2] if estate.city_id != self.types['city'][2].id \
+            else self.types['city'][1]
+        estate.price = 9000000
+        with self.captureOnCommitCallbacks(execute=True):
+            estate.save()
+
+        self.assertEqual(self.table(), self.expected())
+
+    def test_stats_group_by(self):
+        create_estates(100, self.types, seed=1)
+        self.estate_aggregates.refresh()
+        city = self.types['city'][0].id
+
+        by_type = self.estate_aggregates.stats(city=city, group_by='type')
+
+        expected = self.expected()
+        self.assertEqual([(group['type']['id'], group['count']) for group in by_type],
+                         sorted(((key[1], values['count']) for key, values in expected.items()
+                                 if key[0] == city and key[1] is not None and key[2] is None),
+                                key=lambda item: (-item[1], item[0])))
+        with self.assertRaises(ValueError):
+            self.estate_aggregates.stats(city=city, group_by='city')
@@ -1,10 +1,116 @@
-from typing import List, Dict, Optional
-from collections import defaultdict
+from typing import Iterable, List, Dict, Optional, Tuple
+from functools import lru_cache
 import re
 
 from common.utils import first
 
 
+class PatternMatcher:
+    """
+    Counts the occurrences of a fixed set of patterns in a single scan of a text.
+
+    All patterns are compiled once into one alternation regex wrapped in a lookahead,
+    so every position of the text is tested against every pattern in one pass.
+    Counts are identical to running one `\\bterm\\b` regex per pattern, including
+    patterns that overlap (e.g. 'fujairah' inside 'dibba al-fujairah').
+    """
+
+    def __init__(self, patterns: List[str]):
+        """
+        Args:
+            patterns: List of terms/phrases to match
+
+        Raises:
+            ValueError: If patterns list is empty or contains invalid entries
+        """
+        normalized_patterns = TextAnalyzer._prepare_patterns(patterns)
+
+        # Unique normalized patterns, in first-seen order for tie breaking
+        self.patterns = list(dict.fromkeys(normalized_patterns))
+
+        # Original case version of each pattern from the input list
+        self._original_case = {
+            pattern: first(patterns, lambda x: x.lower() == pattern)
+            for pattern in self.patterns
+        }
+
+        # Longest alternatives first, so a match reports the longest pattern at a
+        # position; shorter patterns starting there are recovered from its prefixes
+        alternatives = sorted(self.patterns, key=len, reverse=True)
+        self._regex = re.compile(
+            r'(?=\b(' + '|'.join(re.escape(p) for p in alternatives) + r')\b)')
+        self._prefixes = {
+            pattern: [other for other in self.patterns
+                      if other != pattern and pattern.startswith(other)]
+            for pattern in self.patterns
+        }
+
+    @staticmethod
+    def _is_word_char(char: str) -> bool:
+        """Mirror the `\\w` character class of the re module"""
+        return char.isalnum() or char == '_'
+
+    @classmethod
+    def _is_boundary(cls, text: str, position: int) -> bool:
+        """Check whether `\\b` matches at the given position of the text"""
+        before = position > 0 and cls._is_word_char(text[position - 1])
+        after = position < len(text) and cls._is_word_char(text[position])
+        return before != after
+
+    def count(self, text: str) -> Dict[str, int]:
+        """
+        Counts occurrences of each pattern in the text.
+
+        Args:
+            text: Text to search in
+
+        Returns:
+            Dictionary mapping normalized patterns to their occurrence counts
+        """
+        prepared_text = TextAnalyzer._prepare_text(text)
+
+        counts = dict.fromkeys(self.patterns, 0)
+        # End of the last counted occurrence per pattern, occurrences of the
+        # same pattern never overlap
+        last_end = dict.fromkeys(self.patterns, 0)
+
+        for match in self._regex.finditer(prepared_text):
+            start = match.start()
+            longest = match.group(1)
+
+            for pattern in (longest, *self._prefixes[longest]):
+                end = start + len(pattern)
+                if start < last_end[pattern]:
+                    continue
+                if pattern is not longest and not self._is_boundary(prepared_text, end):
+                    continue
+                counts[pattern] += 1
+                last_end[pattern] = end
+
+        return counts
+
+    def most_frequent(self, text: str) -> Optional[str]:
+        """
+        Finds the most frequently occurring pattern in the text.
+
+        Args:
+            text: Text to search for patterns
+
+        Returns:
+            Original case version of the most frequent pattern (first one in case
+            of ties), or None if no patterns are found
+        """
+        counts = self.count(text)
+
+        max_count = max(counts.values())
+        if max_count == 0:
+            return None
+
+        for pattern, count in counts.items():
+            if count == max_count:
+                return self._original_case[pattern]
+
+
 class TextAnalyzer:
     """
     A class for identifying and extracting word patterns from text.
@@ -54,19 +160,26 @@ class TextAnalyzer:
         return normalized_patterns
 
     @staticmethod
-    def _create_search_pattern(term: str) -> str:
+    @lru_cache(maxsize=64)
+    def _get_cached_matcher(patterns: Tuple[str, ...]) -> PatternMatcher:
+        return PatternMatcher(list(patterns))
+
+    @classmethod
+    def get_matcher(cls, patterns: List[str]) -> PatternMatcher:
         """
-        Creates a regex pattern for matching a term with word boundaries.
+        Returns a compiled matcher for the patterns, built once per pattern set.
 
         Args:
-            term: Term to create pattern for
+            patterns: List of patterns to search for
 
         Returns:
-            Regex pattern string
+            PatternMatcher for the patterns
+
+        Raises:
+            ValueError: If patterns list is empty or contains invalid entries
         """
-        # Escape special regex characters in the term
-        escaped_term = re.escape(term)
-        return fr'\b{escaped_term}\b'
+        cls._prepare_patterns(patterns)
+        return cls._get_cached_matcher(tuple(patterns))
 
     @classmethod
     def _count_pattern_occurrences(cls, text: str, patterns: List[str]) -> Dict[str, int]:
@@ -80,18 +193,7 @@ class TextAnalyzer:
         Returns:
             Dictionary mapping patterns to their occurrence counts
         """
-        counts = defaultdict(int)
-
-        # Prepare text once for all searches
-        prepared_text = cls._prepare_text(text)
-
-        # Count occurrences of each pattern
-        for pattern in patterns:
-            search_pattern = cls._create_search_pattern(pattern)
-            matches = re.finditer(search_pattern, prepared_text)
-            counts[pattern] = sum(1 for _ in matches)
-
-        return counts
+        return cls.get_matcher(patterns).count(text)
 
     @classmethod
     def findMostFrequentPattern(cls, text: str, patterns: List[str]) -> Optional[str]:
@@ -132,25 +234,36 @@ class TextAnalyzer:
         if not text.strip():
             raise ValueError("Input text cannot be empty")
 
-        normalized_patterns = cls._prepare_patterns(patterns)
+        return cls.get_matcher(patterns).most_frequent(text)
 
-        # Count pattern occurrences
-        pattern_counts = cls._count_pattern_occurrences(
-            text, normalized_patterns)
+    @classmethod
+    def findMostFrequentPatterns(cls, texts: Iterable[str], patterns: List[str]) -> List[Optional[str]]:
+        """
+        Finds the most frequently occurring pattern in each of the given texts.
 
-        # Find pattern with highest count
-        if not pattern_counts:
-            return None
+        The patterns are compiled once and reused for every text, which makes this
+        the preferred way to analyze a whole column of texts.
 
-        max_count = max(pattern_counts.values())
-        if max_count == 0:
-            return None
+        Args:
+            texts: Iterable of texts (e.g. a pandas Series) to search for patterns
+            patterns: List of patterns to search for
 
-        # Return any pattern with the highest count
-        # (first one in case of ties)
-        for pattern, count in pattern_counts.items():
-            if count == max_count:
-                # Return original case version from input list
-                original_case_pattern = first(
-                    patterns, lambda x: x.lower() == pattern)
-                return original_case_pattern
+        Returns:
+            List with the most frequent pattern of each text, in input order. Texts
+            that are empty, not strings or contain no pattern yield None
+
+        Raises:
+            ValueError: If patterns are invalid
+
+        Examples:
+            >>> cities = ["London", "Paris", "Berlin"]
+            >>> TextAnalyzer.findMostFrequentPatterns(["Paris in May", "", "Rome"], cities)
+            ['Paris', None, None]
+        """
+        matcher = cls.get_matcher(patterns)
+
+        return [
+            matcher.most_frequent(text)
+            if isinstance(text, str) and text.strip() else None
+            for text in texts
+        ]
@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Sequence, Tuple
+import logging
+import math
+import multiprocessing
+import threading
+
+import numpy as np
+
+from .text_analyzer import TextAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# Pattern lists of the current pool, set once per worker process by its initializer
+_worker_pattern_lists: Tuple[Tuple[str, ...], ...] = ()
+
+
+def _init_worker(pattern_lists: Tuple[Tuple[str, ...], ...]) -> None:
+    global _worker_pattern_lists
+    _worker_pattern_lists = pattern_lists
+
+
+def _infer_indexes(texts: List[str]) -> List[np.ndarray]:
+    """
+    Run in a worker process: find the most frequent pattern of every text, for
+    each pattern list of the worker.
+
+    Returns:
+        list: One array per pattern list, holding for every text the index of its
+            most frequent pattern in the list, -1 when none is found
+    """
+    results = []
+    for patterns in _worker_pattern_lists:
+        positions = {pattern: index for index, pattern in enumerate(patterns)}
+        values = TextAnalyzer.findMostFrequentPatterns(texts, list(patterns))
+        results.append(np.fromiter(
+            (positions[value] if value is not None else -1 for value in values),
+            dtype=np.int32, count=len(values)))
+    return results
+
+
+class TextInferencePool:
+    """
+    Finds the most frequent pattern of many texts across CPU cores.
+
+    Texts are split into one slice per worker of a process pool. Workers receive
+    the pattern lists once, when the pool starts, and return compact arrays of
+    pattern indexes; the pool is restarted only when the pattern lists change.
+    Below `min_texts` texts, or with a single worker, texts are analyzed in
+    process since starting and feeding workers would cost more than it saves.
+
+    Results are identical to `TextAnalyzer.findMostFrequentPatterns`.
+    """
+
+    def __init__(self, workers: int, min_texts: int):
+        """
+        Args:
+            workers: Worker processes, 1 or less analyzes every text in process
+            min_texts: Fewest texts analyzed by the workers
+        """
+        self.workers = workers
+        self.min_texts = min_texts
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pattern_lists: Tuple[Tuple[str, ...], ...] = ()
+
+    def _get_executor(self, pattern_lists: Tuple[Tuple[str, ...], ...]) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pattern_lists != pattern_lists:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                # Spawned rather than forked, as servers fork from threaded processes
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(pattern_lists,))
+                self._pattern_lists = pattern_lists
+            return self._executor
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, they are started again when needed"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def infer(self, texts: Sequence[str], pattern_lists: List[List[str]]) -> List[List[Optional[str]]]:
+        """
+        Find the most frequent pattern of every text, for each pattern list.
+
+        Args:
+            texts: Texts to analyze
+            pattern_lists: Lists of patterns to search for
+
+        Returns:
+            list: For each pattern list, the most frequent pattern of every text in
+                input order, None for texts without any pattern
+
+        Raises:
+            ValueError: If patterns are invalid
+        """
+        texts = list(texts)
+        if self.workers <= 1 or len(texts) < self.min_texts:
+            return [TextAnalyzer.findMostFrequentPatterns(texts, patterns)
+                    for patterns in pattern_lists]
+
+        # Checked here so invalid patterns fail like in process
+        for patterns in pattern_lists:
+            TextAnalyzer.get_matcher(patterns)
+
+        frozen_lists = tuple(tuple(patterns) for patterns in pattern_lists)
+        size = math.ceil(len(texts) / self.workers)
+        slices = [texts[start:start + size] for start in range(0, len(texts), size)]
+
+        try:
+            results = list(self._get_executor(frozen_lists).map(_infer_indexes, slices))
+        except BrokenProcessPool:
+            logger.exception('Text inference worker died, analyzing in process')
+            self.shutdown()
+            return [TextAnalyzer.findMostFrequentPatterns(texts, patterns)
+                    for patterns in pattern_lists]
+
+        inferred = []
+        for position, patterns in enumerate(frozen_lists):
+            indexes = np.concatenate([result[position] for result in results])
+            inferred.append([patterns[index] if index >= 0 else None for index in indexes])
+        return inferred
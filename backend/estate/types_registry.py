@@ -0,0 +1,102 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import hashlib
+import threading
+
+from .models import Types
+
+
+class _TypesTable(NamedTuple):
+    by_key: Dict[Tuple[str, str], Types]
+    by_id: Dict[int, Types]
+    by_type: Dict[str, List[Types]]
+    fingerprint: str
+
+
+class TypesRegistry:
+    """
+    In-process cache of the Types lookup table.
+
+    The table is loaded once with a single query and served from dictionaries
+    keyed by (type, value) and by id. The cache is dropped by the post_save and
+    post_delete signals of Types (see estate/signals.py) and reloaded lazily on
+    the next lookup.
+
+    Note:
+        - Invalidation only reaches the current process; other worker processes
+          pick up changes when they are restarted
+        - Bulk operations that bypass model signals (`QuerySet.update()`,
+          `bulk_create()`) must call `invalidate()` themselves
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table: Optional[_TypesTable] = None
+
+    def _get_table(self) -> _TypesTable:
+        """Return the cached table, loading it from the database when needed"""
+        table = self._table
+        if table is not None:
+            return table
+
+        with self._lock:
+            if self._table is None:
+                self._table = self._load_table()
+            return self._table
+
+    @staticmethod
+    def _load_table() -> _TypesTable:
+        types = list(Types.objects.order_by('id'))
+
+        by_type = {}
+        for item in types:
+            by_type.setdefault(item.type, []).append(item)
+
+        fingerprint = hashlib.sha1(repr(
+            [(item.id, item.type, item.value) for item in types]).encode()).hexdigest()
+
+        return _TypesTable(
+            by_key={(item.type, item.value): item for item in types},
+            by_id={item.id: item for item in types},
+            by_type=by_type,
+            fingerprint=fingerprint
+        )
+
+    def invalidate(self) -> None:
+        """Drop the cached table, the next lookup reloads it"""
+        with self._lock:
+            self._table = None
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of the table contents, changes whenever a type is added, changed or removed"""
+        return self._get_table().fingerprint
+
+    def get(self, type: str, value: str) -> Optional[Types]:
+        """
+        Get a type by its type and value.
+
+        Args:
+            type: Type name (e.g. CITY_TYPE)
+            value: Type value (e.g. 'Dubai')
+
+        Returns:
+            The matching Types instance, or None if it does not exist
+        """
+        return self._get_table().by_key.get((type, value))
+
+    def get_id(self, type: str, value: str) -> Optional[int]:
+        """Get the id of a type by its type and value, None if it does not exist"""
+        found_type = self.get(type, value)
+        return found_type.id if found_type else None
+
+    def get_by_id(self, id: int) -> Optional[Types]:
+        """Get a type by its id, None if it does not exist"""
+        return self._get_table().by_id.get(id)
+
+    def of_type(self, type: str) -> List[Types]:
+        """Get all types of the given type name, ordered by id"""
+        return list(self._get_table().by_type.get(type, []))
+
+    def value_ids(self, type: str) -> Dict[str, int]:
+        """Map the values of the given type name to their ids, ordered by id"""
+        return {item.value: item.id for item in self._get_table().by_type.get(type, [])}
@@ -0,0 +1,113 @@
+from typing import List, Optional
+import glob
+import os
+import re
+import tempfile
+import time
+import uuid
+
+
+class UploadErrorReport:
+    """
+    Collects the row errors of a CSV upload with bounded memory.
+
+    The first `max_errors` messages are kept in memory for the upload response.
+    Once that limit is exceeded, every message (the kept ones included) is
+    written to a report file instead, so arbitrarily broken uploads do not grow
+    the memory of the worker.
+
+    Reports are identified by a random id, served by the
+    /estate/upload/errors/<id> endpoint, and removed once older than
+    ESTATE_UPLOAD_ERROR_REPORT_TTL seconds whenever a new report is written.
+    """
+
+    PREFIX = 'upload-errors-'
+    SUFFIX = '.txt'
+    ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+    def __init__(self, max_errors: int, directory: Optional[str] = None,
+                 max_age: Optional[int] = None):
+        """
+        Args:
+            max_errors: Messages kept in memory
+            directory: Directory of the report file, the system temporary
+                directory when None
+            max_age: Seconds after which reports are removed, never when None
+        """
+        self.max_errors = max_errors
+        self.directory = directory
+        self.max_age = max_age
+        self.errors: List[str] = []
+        self.count = 0
+        self.report_id: Optional[str] = None
+        self._file = None
+
+    @classmethod
+    def _path(cls, directory: Optional[str], report_id: str) -> str:
+        return os.path.join(directory or tempfile.gettempdir(),
+                            f'{cls.PREFIX}{report_id}{cls.SUFFIX}')
+
+    @classmethod
+    def find(cls, report_id: str, directory: Optional[str] = None) -> Optional[str]:
+        """
+        Get the path of a report.
+
+        Args:
+            report_id: Id returned with the upload result
+            directory: Directory of the reports, the system temporary directory when None
+
+        Returns:
+            str: Path of the report file, None if the id is invalid or the report was removed
+        """
+        if not cls.ID_PATTERN.match(report_id):
+            return None
+        path = cls._path(directory, report_id)
+        return path if os.path.isfile(path) else None
+
+    @classmethod
+    def remove_expired(cls, max_age: int, directory: Optional[str] = None) -> int:
+        """
+        Remove the reports older than max_age seconds.
+
+        Returns:
+            int: Number of removed reports
+        """
+        deadline = time.time() - max_age
+        removed = 0
+        for path in glob.glob(cls._path(directory, '*')):
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                # Removed concurrently by another upload
+                pass
+        return removed
+
+    @property
+    def truncated(self) -> bool:
+        return self.count > len(self.errors)
+
+    def add(self, message: str) -> None:
+        self.count += 1
+        if self.count <= self.max_errors:
+            self.errors.append(message)
+            return
+
+        if self._file is None:
+            if self.max_age is not None:
+                self.remove_expired(self.max_age, self.directory)
+            self.report_id = uuid.uuid4().hex
+            self._file = open(self._path(self.directory, self.report_id), 'w')
+            self._file.writelines(f'{error}\n' for error in self.errors)
+        self._file.write(f'{message}\n')
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self) -> 'UploadErrorReport':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,226 @@
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from common.service_provider import ServiceProvider
+from .metrics import UploadMetrics
+from .models import UploadJob
+from .service import EstateService
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJobQueue:
+    """
+    Database backed queue of CSV uploads processed in the background.
+
+    The web process stores the uploaded file under `ESTATE_UPLOAD_JOB_DIR` and
+    records a pending UploadJob; worker processes (`manage.py
+    process_upload_jobs`) claim pending jobs one at a time and run them through
+    `EstateService.process_estate_upload`, saving the progress of the job after
+    every batch.
+
+    Note:
+        - Web and worker processes must share the job directory
+        - Jobs are claimed with a conditional UPDATE, so several workers can
+          poll the same database
+        - A running job whose progress has not been saved for
+          `ESTATE_UPLOAD_JOB_STALE_TIMEOUT` seconds is marked failed: its
+          worker is assumed dead, and running it again could import its rows twice
+    """
+
+    def enqueue(self, uploaded_file, truncate: bool = False) -> UploadJob:
+        """
+        Store an uploaded file and queue its processing.
+
+        Args:
+            uploaded_file: Uploaded CSV file
+            truncate: Whether to clear existing estates before import
+
+        Returns:
+            UploadJob: The pending job
+        """
+        directory = settings.ESTATE_UPLOAD_JOB_DIR
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f'{uuid.uuid4().hex}.csv')
+
+        with open(file_path, 'wb') as file:
+            for chunk in uploaded_file.chunks():
+                file.write(chunk)
+
+        return UploadJob.objects.create(
+            file_name=uploaded_file.name, file_path=file_path, truncate=truncate)
+
+    def claim_next(self) -> Optional[UploadJob]:
+        """
+        Mark the oldest pending job as running.
+
+        Returns:
+            UploadJob: The claimed job, None when no job is pending
+        """
+        while True:
+            job = UploadJob.objects.filter(status=UploadJob.PENDING).order_by('created_at').first()
+            if job is None:
+                return None
+
+            now = timezone.now()
+            # Another worker may claim the same job first
+            claimed = UploadJob.objects.filter(id=job.id, status=UploadJob.PENDING).update(
+                status=UploadJob.RUNNING, started_at=now, updated_at=now)
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    def fail_stale(self) -> int:
+        """
+        Mark the running jobs of dead workers as failed.
+
+        Returns:
+            int: Number of failed jobs
+        """
+        deadline = timezone.now() - timedelta(seconds=settings.ESTATE_UPLOAD_JOB_STALE_TIMEOUT)
+        failed = 0
+        for job in UploadJob.objects.filter(status=UploadJob.RUNNING, updated_at__lt=deadline):
+            # Skip the job if its worker saved progress in the meantime
+            if UploadJob.objects.filter(id=job.id, status=UploadJob.RUNNING,
+                                        updated_at__lt=deadline).update(
+                    status=UploadJob.FAILED, finished_at=timezone.now(),
+                    error='The worker stopped before the upload finished, '
+                          'rows up to the reported progress were imported'):
+                self._remove_file(job)
+                failed += 1
+        return failed
+
+    def run(self, job: UploadJob) -> UploadJob:
+        """
+        Process a claimed job, saving its progress along the way.
+
+        Args:
+            job: Job returned by `claim_next`
+
+        Returns:
+            UploadJob: The finished job
+        """
+        estate_service = ServiceProvider.get_service(EstateService)
+
+        def save_progress(processed_rows: int, successful_rows: int, errors: List[str]) -> None:
+            UploadJob.objects.filter(id=job.id).update(
+                processed_rows=processed_rows,
+                successful_rows=successful_rows,
+                failed_rows=processed_rows - successful_rows,
+                errors=errors,
+                updated_at=timezone.now())
+
+        started_at = time.perf_counter()
+        try:
+            with open(job.file_path, 'rb') as csv_file:
+                result = estate_service.process_estate_upload(
+                    csv_file, job.truncate, progress=save_progress)
+        except ValueError as e:
+            return self._finish(job, UploadJob.FAILED, error=str(e))
+        except Exception as e:
+            logger.exception('Upload job %s failed', job.id)
+            return self._finish(job, UploadJob.FAILED, error=f'Error processing file: {str(e)}')
+
+        ServiceProvider.get_service(UploadMetrics).observe(
+            result['successful_records'], result['failed_records'],
+            time.perf_counter() - started_at)
+        return self._finish(job, UploadJob.SUCCEEDED, result=result)
+
+    @classmethod
+    def _finish(cls, job: UploadJob, status: str, result: Optional[Dict[str, Any]] = None,
+                error: str = '') -> UploadJob:
+        job.refresh_from_db()
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = timezone.now()
+        if result is not None:
+            job.processed_rows = result['total_records']
+            job.successful_rows = result['successful_records']
+            job.failed_rows = result['failed_records']
+            job.errors = result['errors'] or []
+        job.save()
+
+        cls._remove_file(job)
+        return job
+
+    @staticmethod
+    def _remove_file(job: UploadJob) -> None:
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """
+        Throughput of the finished jobs of every worker process.
+
+        Returns:
+            dict: Number of 'jobs' by status, 'rows' by result ('successful' or
+                'failed'), total processing 'seconds', and the rows per second
+                of the last succeeded job (None before any)
+        """
+        finished = UploadJob.objects.filter(status__in=[UploadJob.SUCCEEDED, UploadJob.FAILED])
+        jobs = dict.fromkeys([UploadJob.SUCCEEDED, UploadJob.FAILED], 0)
+        jobs.update(finished.order_by().values_list('status').annotate(count=Count('id')))
+        totals = finished.aggregate(successful=Sum('successful_rows'), failed=Sum('failed_rows'))
+
+        seconds = 0.0
+        last_rows_per_second = None
+        timed = finished.filter(started_at__isnull=False, finished_at__isnull=False)
+        for status, processed_rows, started_at, finished_at in timed.order_by('finished_at') \
+                .values_list('status', 'processed_rows', 'started_at', 'finished_at').iterator():
+            elapsed = (finished_at - started_at).total_seconds()
+            seconds += elapsed
+            if status == UploadJob.SUCCEEDED and elapsed > 0:
+                last_rows_per_second = processed_rows / elapsed
+
+        return {
+            'jobs': jobs,
+            'rows': {'successful': totals['successful'] or 0, 'failed': totals['failed'] or 0},
+            'seconds': seconds,
+            'last_rows_per_second': last_rows_per_second,
+        }
+
+    @staticmethod
+    def progress(job: UploadJob) -> Dict[str, Any]:
+        """
+        Describe the state of a job.
+
+        Args:
+            job: The job
+
+        Returns:
+            dict: Status, row counts and rate so far, error messages so far, and
+                once succeeded the result of `process_estate_upload`
+        """
+        rows_per_second = None
+        if job.started_at is not None:
+            elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+            if elapsed > 0:
+                rows_per_second = round(job.processed_rows / elapsed, 1)
+
+        return {
+            'job_id': job.id,
+            'status': job.status,
+            'file_name': job.file_name,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'processed_rows': job.processed_rows,
+            'successful_rows': job.successful_rows,
+            'failed_rows': job.failed_rows,
+            'rows_per_second': rows_per_second,
+            'errors': job.errors,
+            'error': job.error or None,
+            'result': job.result,
+        }
@@ -5,5 +5,17 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("upload", views.upload_excel, name="upload_excel"),
+    path("upload/errors/<str:report_id>", views.upload_error_report, name="upload_error_report"),
+    path("upload/jobs", views.upload_job, name="upload_job"),
+    path("upload/jobs/<int:job_id>", views.upload_job_status, name="upload_job_status"),
     path("query", views.process_nlp_query, name="process_nlp_query"),
+    path("query/async", views.aprocess_nlp_query, name="aprocess_nlp_query"),
+    path("query/stream", views.stream_nlp_query, name="stream_nlp_query"),
+    path("query/cache", views.filter_cache_stats, name="filter_cache_stats"),
+    path("query/timings", views.query_timings, name="query_timings"),
+    path("search", views.search_estates, name="search_estates"),
+    path("facets", views.estate_facets, name="estate_facets"),
+    path("stats", views.estate_stats, name="estate_stats"),
+    path("metrics", views.metrics, name="metrics"),
+    path("llm/stats", views.llm_stats, name="llm_stats"),
 ]
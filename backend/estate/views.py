@@ -1,18 +1,34 @@
 import pandas as pd
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.exceptions import ValidationError
 from django.views.decorators.http import require_http_methods
 import re
 import math
 import json
+import time
 import traceback
+from typing import Optional
 
 from .constants import *
 from common.utils import first
 from .estate_query_processor import RealEstateQueryProcessor
 from common.service_provider import ServiceProvider
 from .service import EstateService
+from .estate_aggregates import EstateAggregates
+from .estate_facets import EstateFacets
+from .filter_cache import FilterCache
+from .keyword_search import KeywordSearch
+from .llm_client import LLMClient
+from .metrics import QueryMetrics, UploadMetrics
+from .prometheus import PrometheusExporter
+from .query_timer import QueryTimer
+from .models import UploadJob
+from .types_registry import TypesRegistry
+from .upload_error_report import UploadErrorReport
+from .upload_jobs import UploadJobQueue
 
 # Create your views here.
 
@@ -76,6 +92,32 @@ def removeNan(value):
     return value
 
 
+def query_response(result: dict, timer: QueryTimer) -> JsonResponse:
+    """Build the HTTP response of a processed query"""
+    if result["success"]:
+        response = JsonResponse(result, status=200)
+    elif "retry_after" in result:
+        response = JsonResponse(result, status=503)
+        response["Retry-After"] = str(math.ceil(result["retry_after"]))
+    else:
+        response = JsonResponse(result, status=400)
+
+    if settings.ESTATE_SERVER_TIMING:
+        response["Server-Timing"] = timer.server_timing()
+    return response
+
+
+def with_error_report_url(request, result: Optional[dict]) -> Optional[dict]:
+    """Add the download URL of the error report of an upload result, if it has one"""
+    if not result or not result.get('error_report'):
+        return result
+    return {
+        **result,
+        'error_report_url': request.build_absolute_uri(
+            reverse('upload_error_report', args=[result['error_report']])),
+    }
+
+
 @csrf_exempt
 def upload_excel(request):
     """
@@ -99,9 +141,13 @@ def upload_excel(request):
 
         # Process the upload
         truncate = request.GET.get('truncate', 'false').lower() == 'true'
+        started_at = time.perf_counter()
         result = estate_service.process_estate_upload(csv_file, truncate)
+        ServiceProvider.get_service(UploadMetrics).observe(
+            result['successful_records'], result['failed_records'],
+            time.perf_counter() - started_at)
 
-        return JsonResponse(result, status=200)
+        return JsonResponse(with_error_report_url(request, result), status=200)
 
     except ValueError as e:
         return JsonResponse({'error': str(e)}, status=400)
@@ -109,6 +155,66 @@ def upload_excel(request):
         return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=500)
 
 
+@csrf_exempt
+def upload_job(request):
+    """
+    Queue an estate data upload for background processing.
+
+    Accepts the same request as /upload and answers immediately with the id
+    of the job, processed by the `process_upload_jobs` command.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method is allowed'}, status=405)
+
+    if 'file' not in request.FILES:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+
+    csv_file = request.FILES['file']
+
+    # Check if it's a CSV file
+    if not csv_file.name.endswith('.csv'):
+        return JsonResponse({'error': 'File must be of type CSV'}, status=400)
+
+    truncate = request.GET.get('truncate', 'false').lower() == 'true'
+    job = ServiceProvider.get_service(UploadJobQueue).enqueue(csv_file, truncate)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('upload_job_status', args=[job.id])),
+    }, status=202)
+
+
+@require_http_methods(["GET"])
+def upload_job_status(request, job_id):
+    """
+    Progress of a background upload: rows processed, rows per second and
+    errors so far, and the upload result once finished.
+    """
+    try:
+        job = UploadJob.objects.get(id=job_id)
+    except UploadJob.DoesNotExist:
+        return JsonResponse({'error': 'Upload job not found'}, status=404)
+
+    progress = UploadJobQueue.progress(job)
+    progress['result'] = with_error_report_url(request, progress['result'])
+    return JsonResponse(progress)
+
+
+@require_http_methods(["GET"])
+def upload_error_report(request, report_id):
+    """
+    Full list of the row errors of an upload, when there were more than
+    ESTATE_UPLOAD_MAX_ERRORS, as plain text with one error per line.
+    """
+    path = UploadErrorReport.find(report_id, settings.ESTATE_UPLOAD_ERROR_DIR)
+    if path is None:
+        return JsonResponse({'error': 'Error report not found or expired'}, status=404)
+
+    return FileResponse(open(path, 'rb'), content_type='text/plain; charset=utf-8',
+                        as_attachment=True, filename=f'upload-errors-{report_id}.txt')
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def process_nlp_query(request):
@@ -130,10 +236,49 @@ def process_nlp_query(request):
                 "error": "Query is required"
             }, status=400)
 
-        processor = RealEstateQueryProcessor()
-        result = processor.process_query(query)
+        processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+        timer = QueryTimer()
+        result = processor.process_query(query, timer)
+
+        return query_response(result, timer)
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "success": False,
+            "error": "Invalid JSON in request body"
+        }, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def aprocess_nlp_query(request):
+    """
+    Async variant of /query, for ASGI servers: the request does not hold a
+    worker thread while waiting on the LLM.
+
+    Expected POST body: same as /query
+    """
+    try:
+        data = json.loads(request.body)
+        query = data.get('query')
+
+        if not query:
+            return JsonResponse({
+                "success": False,
+                "error": "Query is required"
+            }, status=400)
+
+        processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+        timer = QueryTimer()
+        result = await processor.aprocess_query(query, timer)
 
-        return JsonResponse(result, status=200 if result["success"] else 400)
+        return query_response(result, timer)
 
     except json.JSONDecodeError:
         return JsonResponse({
@@ -146,3 +291,258 @@ def process_nlp_query(request):
             "success": False,
             "error": f"Server error: {str(e)}"
         }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def stream_nlp_query(request):
+    """
+    Endpoint answering natural language real estate queries with Server-Sent Events,
+    forwarding the summary as the model generates it.
+
+    Expected POST body: same as /query
+
+    Events:
+        delta: {"text": "..."} next piece of the summary
+        done: {"success": true} the summary is complete
+        error: {"success": false, "error": "..."} the query failed
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "success": False,
+            "error": "Invalid JSON in request body"
+        }, status=400)
+
+    query = data.get('query')
+    if not query:
+        return JsonResponse({
+            "success": False,
+            "error": "Query is required"
+        }, status=400)
+
+    processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+
+    def event_stream():
+        for event in processor.stream_query(query):
+            name = event.pop("event")
+            yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Keep reverse proxies such as nginx from buffering the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def search_estates(request):
+    """
+    Endpoint searching the title and description of estates for keywords,
+    restricted by structured filters and ranked by relevance.
+
+    Expected POST body:
+    {
+        "keywords": "sea view balcony",
+        "filters": {"city": 12, "price__lt": 2000000},  // optional, Types ids
+        "limit": 10  // optional, at most 50
+    }
+    """
+    try:
+        data = json.loads(request.body)
+        keywords = data.get('keywords')
+        filters = data.get('filters') or {}
+        limit = data.get('limit', SEARCH_DEFAULT_LIMIT)
+
+        if not keywords or not isinstance(keywords, str):
+            return JsonResponse({
+                "success": False,
+                "error": "Keywords are required"
+            }, status=400)
+
+        if not isinstance(filters, dict):
+            return JsonResponse({
+                "success": False,
+                "error": "Filters must be an object"
+            }, status=400)
+
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= SEARCH_MAX_LIMIT:
+            return JsonResponse({
+                "success": False,
+                "error": f"Limit must be an integer between 1 and {SEARCH_MAX_LIMIT}"
+            }, status=400)
+
+        if filters:
+            ServiceProvider.get_service(EstateService).validate_filters(filters)
+
+        keyword_search = ServiceProvider.get_service(KeywordSearch)
+        results = keyword_search.search(keywords, filters, limit)
+
+        return JsonResponse({
+            "success": True,
+            "results": [{
+                "id": estate.id,
+                "title": estate.title,
+                "description": estate.description,
+                "address": estate.address,
+                "price": estate.price,
+                "size": estate.size,
+                "score": score,
+            } for estate, score in results]
+        }, status=200)
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "success": False,
+            "error": "Invalid JSON in request body"
+        }, status=400)
+    except ValidationError as e:
+        return JsonResponse({
+            "success": False,
+            "error": f"Invalid filters: {'; '.join(e.messages)}"
+        }, status=400)
+    except ValueError as e:
+        return JsonResponse({
+            "success": False,
+            "error": str(e)
+        }, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def estate_facets(request):
+    """
+    Endpoint counting the estates matching filters by value of each categorized
+    field (bedrooms, bathrooms, furnished, city, category and type).
+
+    Expected POST body:
+    {
+        "filters": {"city": 12, "price__lt": 2000000}  // optional, Types ids
+    }
+    """
+    try:
+        data = json.loads(request.body or '{}')
+        filters = data.get('filters') or {}
+
+        if not isinstance(filters, dict):
+            return JsonResponse({
+                "success": False,
+                "error": "Filters must be an object"
+            }, status=400)
+
+        if filters:
+            ServiceProvider.get_service(EstateService).validate_filters(filters)
+
+        facets = ServiceProvider.get_service(EstateFacets)
+        return JsonResponse({"success": True, **facets.counts(filters)}, status=200)
+
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "success": False,
+            "error": "Invalid JSON in request body"
+        }, status=400)
+    except ValidationError as e:
+        return JsonResponse({
+            "success": False,
+            "error": f"Invalid filters: {'; '.join(e.messages)}"
+        }, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def estate_stats(request):
+    """
+    Endpoint reporting the number of estates and their minimum, median and
+    maximum price and size, from the precomputed aggregates.
+
+    Query parameters (all optional):
+        city, type, bedrooms: Types ids restricting the group, all values when omitted
+        group_by: 'city', 'type' or 'bedrooms', to list the subgroups of the group
+    """
+    try:
+        key = {}
+        for field, type_name in (('city', CITY_TYPE), ('type', ESTATE_TYPE), ('bedrooms', BEDROOM_TYPE)):
+            value = request.GET.get(field)
+            if value is None:
+                key[field] = None
+                continue
+
+            found_type = ServiceProvider.get_service(TypesRegistry).get_by_id(int(value)) \
+                if value.isdigit() else None
+            if found_type is None or found_type.type != type_name:
+                return JsonResponse({
+                    "success": False,
+                    "error": f"Unknown {type_name} id {value} for {field}"
+                }, status=400)
+            key[field] = found_type.id
+
+        estate_aggregates = ServiceProvider.get_service(EstateAggregates)
+        stats = estate_aggregates.stats(**key, group_by=request.GET.get('group_by'))
+
+        return JsonResponse({"success": True, "stats": stats}, status=200)
+
+    except ValueError as e:
+        return JsonResponse({
+            "success": False,
+            "error": str(e)
+        }, status=400)
+    except Exception as e:
+        traceback.print_exc()
+        return JsonResponse({
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Endpoint exposing the metrics of this process in the Prometheus text format.
+    """
+    return HttpResponse(PrometheusExporter().render(),
+                        content_type=PrometheusExporter.CONTENT_TYPE)
+
+
+@require_http_methods(["GET"])
+def query_timings(request):
+    """
+    Endpoint reporting the duration histograms of the query stages of this process.
+    """
+    query_metrics = ServiceProvider.get_service(QueryMetrics)
+    return JsonResponse(query_metrics.stats(), status=200)
+
+
+@require_http_methods(["GET"])
+def llm_stats(request):
+    """
+    Endpoint reporting the admission control counters of the LLM calls of this process.
+    """
+    llm_client = ServiceProvider.get_service(LLMClient)
+    return JsonResponse(llm_client.stats(), status=200)
+
+
+@require_http_methods(["GET"])
+def filter_cache_stats(request):
+    """
+    Endpoint reporting the hit and miss counters of the filter cache of this process,
+    and how many queries shared an identical query in flight.
+    """
+    filter_cache = ServiceProvider.get_service(FilterCache)
+    processor = ServiceProvider.get_service(RealEstateQueryProcessor)
+    return JsonResponse({
+        **filter_cache.stats(),
+        'coalescing': processor.singleflight.stats(),
+    }, status=200)
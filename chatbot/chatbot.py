@@ -1,7 +1,7 @@
 import streamlit as st
 import requests
 import json
-from typing import Dict
+from typing import Dict, Iterator
 import time
 from dotenv import load_dotenv
 import os
@@ -13,6 +13,10 @@ load_dotenv()
 API_ENDPOINT = os.getenv('API_ENDPOINT', 'http://localhost:8000/query')
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
 RETRY_DELAY = int(os.getenv('RETRY_DELAY', '1'))
+# Stream responses from the Server-Sent Events variant of the query endpoint
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+STREAM_API_ENDPOINT = os.getenv(
+    'STREAM_API_ENDPOINT', f"{API_ENDPOINT.rstrip('/')}/stream")
 
 # Set Streamlit page config for dark theme
 st.set_page_config(page_title="Chat Estate", page_icon="🤖")
@@ -113,6 +117,8 @@ def initialize_session_state():
         st.session_state.messages = []
     if 'error' not in st.session_state:
         st.session_state.error = None
+    if 'pending_query' not in st.session_state:
+        st.session_state.pending_query = None
 
 
 def send_query_to_backend(query: str) -> Dict:
@@ -136,48 +142,121 @@ def send_query_to_backend(query: str) -> Dict:
             time.sleep(RETRY_DELAY)
 
 
+def stream_query_from_backend(query: str) -> Iterator[str]:
+    """Send a query to the streaming endpoint and yield the summary as it arrives."""
+    headers = {"Content-Type": "application/json",
+               "Accept": "text/event-stream"}
+    data = {"query": query}
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = requests.post(
+                STREAM_API_ENDPOINT,
+                headers=headers,
+                data=json.dumps(data),
+                stream=True,
+                timeout=30
+            )
+            response.raise_for_status()
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == MAX_RETRIES - 1:
+                raise Exception(f"Failed to connect to backend after {
+                                MAX_RETRIES} attempts: {str(e)}")
+            time.sleep(RETRY_DELAY)
+
+    # Parse the Server-Sent Events, an event ends with a blank line
+    with response:
+        event, data_lines = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+            elif not line and data_lines:
+                payload = json.loads("\n".join(data_lines))
+                if event == "delta":
+                    yield payload["text"]
+                elif event == "error":
+                    raise Exception(payload.get(
+                        "error", "Unknown error occurred"))
+                elif event == "done":
+                    return
+                event, data_lines = "message", []
+
+
+def render_message(msg: ChatMessage, container=st):
+    """Render a chat message bubble into a container (the page by default)."""
+    message_type = "user-message" if msg.is_user else "bot-message"
+    icon = "🧑" if msg.is_user else "🤖"
+    alignment_class = "user" if msg.is_user else "bot"
+
+    container.markdown(
+        f'<div class="message-row {alignment_class}">'
+        f'<div class="message-bubble {message_type}">'
+        f'<div class="message-content">'
+        f'<span class="message-icon">{icon}</span>'
+        f'<div class="message-text">{msg.text}</div>'
+        f'</div></div></div>',
+        unsafe_allow_html=True
+    )
+
+
 def display_chat_messages():
     """Display chat messages with improved formatting."""
     st.markdown('<div class="message-container">', unsafe_allow_html=True)
 
     for msg in st.session_state.messages:
-        message_type = "user-message" if msg.is_user else "bot-message"
-        icon = "🧑" if msg.is_user else "🤖"
-        alignment_class = "user" if msg.is_user else "bot"
-
-        st.markdown(
-            f'<div class="message-row {alignment_class}">'
-            f'<div class="message-bubble {message_type}">'
-            f'<div class="message-content">'
-            f'<span class="message-icon">{icon}</span>'
-            f'<div class="message-text">{msg.text}</div>'
-            f'</div></div></div>',
-            unsafe_allow_html=True
-        )
+        render_message(msg)
 
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+def display_streamed_response():
+    """Stream the answer to the pending query, rendering the text as it arrives."""
+    query = st.session_state.pending_query
+    st.session_state.pending_query = None
+
+    placeholder = st.empty()
+    message = ChatMessage("", False)
+    try:
+        for text in stream_query_from_backend(query):
+            message.text += text
+            render_message(message, placeholder)
+        st.session_state.error = None
+    except Exception as e:
+        st.session_state.error = str(e)
+
+    if message.text:
+        st.session_state.messages.append(message)
+    else:
+        placeholder.empty()
+
+
 def handle_user_input():
     """Process user input and update chat history."""
     if st.session_state.user_input and st.session_state.user_input.strip():
         user_message = st.session_state.user_input.strip()
         st.session_state.messages.append(ChatMessage(user_message, True))
 
-        try:
-            response = send_query_to_backend(user_message)
+        if STREAM_RESPONSES:
+            # Streamed in main(), so partial text renders below the history
+            st.session_state.pending_query = user_message
+        else:
+            try:
+                response = send_query_to_backend(user_message)
 
-            if response.get("success"):
-                st.session_state.messages.append(
-                    ChatMessage(response["summary"], False)
-                )
-                st.session_state.error = None
-            else:
-                st.session_state.error = response.get(
-                    "error", "Unknown error occurred")
+                if response.get("success"):
+                    st.session_state.messages.append(
+                        ChatMessage(response["summary"], False)
+                    )
+                    st.session_state.error = None
+                else:
+                    st.session_state.error = response.get(
+                        "error", "Unknown error occurred")
 
-        except Exception as e:
-            st.session_state.error = str(e)
+            except Exception as e:
+                st.session_state.error = str(e)
 
         # Clear the input
         st.session_state.user_input = ""
@@ -196,6 +275,10 @@ def main():
         # Display chat messages
         display_chat_messages()
 
+        # Stream the answer to a query just sent
+        if st.session_state.pending_query:
+            display_streamed_response()
+
         # Display error if any
         if st.session_state.error:
             st.error(f"Error: {st.session_state.error}")